@@ -0,0 +1,88 @@
+"""
+Single-pass aggregates for benchmark metrics
+- An Accumulator keeps count, sum, min, max, and mean and variance (Welford's method)
+    updated as each value is recorded, without storing the values
+- Accumulators merge exactly, so per-worker results combine into the same aggregates
+    one accumulator would have produced
+"""
+import math
+
+
+class Accumulator(object):
+    """ Running count, sum, min, max, mean, variance and harmonic mean of the values recorded """
+    count = 0
+    total = 0
+    min = None
+    max = None
+    average = 0.0  # Running mean
+    squares = 0.0  # Sum of squared differences from the running mean
+    inverse_total = 0.0  # Sum of 1/value, for the harmonic mean
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.average = 0.0
+        self.squares = 0.0
+        self.inverse_total = 0.0
+
+    def record(self, value, count=1):
+        """ Add a value, count times """
+        total_count = self.count + count
+        delta = value - self.average
+        self.average = self.average + delta * count / total_count
+        self.squares = self.squares + delta * delta * self.count * count / total_count
+        self.count = total_count
+        self.total = self.total + value * count
+        if value:
+            self.inverse_total = self.inverse_total + count / float(value)
+        else:
+            self.inverse_total = float('inf')  # Harmonic mean of anything with a 0 is 0
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Add another accumulator's values to this one, returns self """
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.average - self.average
+        self.average = self.average + delta * other.count / count
+        self.squares = (self.squares + other.squares +
+                        delta * delta * self.count * other.count / count)
+        self.count = count
+        self.total = self.total + other.total
+        self.inverse_total = self.inverse_total + other.inverse_total
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def mean(self):
+        """ Arithmetic mean, None if empty """
+        if not self.count:
+            return None
+        return self.total / float(self.count)
+
+    def variance(self):
+        """ Population variance """
+        if self.count <= 1:
+            return 0
+        return self.squares / self.count
+
+    def std_deviation(self):
+        """ Population standard deviation """
+        return math.sqrt(self.variance())
+
+    def mean_harmonic(self):
+        """ Harmonic mean, None if empty """
+        if not self.count:
+            return None
+        return 1.0 / (self.inverse_total / self.count)
@@ -0,0 +1,341 @@
+"""
+asyncio execution engine for tests and benchmarks
+- Runs Test and Benchmark objects on a single event loop
+- Sends requests with aiohttp when it is installed, many in flight without a thread each
+- Without aiohttp, blocking sends are handed to a thread pool over the shared connection pool
+- Templating, request configuration, signing, validation and context handling are the same
+    functions run_test and run_benchmark use, so test files behave identically
+"""
+import asyncio
+import datetime
+import logging
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import super_len
+
+from . import resttest
+from . import parallel
+from .benchmarks import BenchmarkRecorder, PrecisionSchedule
+from .binding import Context
+from .connections import ConnectionPool, DEFAULT_POOL_SIZE, DRAIN_CHUNK_SIZE, drain_response
+from .metric import RequestTimings
+from .profiling import NO_PROFILE
+from .resources import ResourceSampler
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOGGER = logging.getLogger('pyresttest.asyncio_engine')
+
+
+def _mark(phase):
+    """ aiohttp trace callback marking a phase on the request's RequestTimings """
+    async def callback(session, trace_config_ctx, params):
+        timings = trace_config_ctx.trace_request_ctx
+        if timings is not None:
+            timings.mark(phase)
+    return callback
+
+
+def timing_trace_config():
+    """ aiohttp TraceConfig marking request phases on the RequestTimings passed as trace_request_ctx
+        aiohttp reports the TLS handshake as part of connecting, so appconnect is marked with it """
+    config = aiohttp.TraceConfig()
+    config.on_dns_resolvehost_end.append(_mark('namelookup'))
+    config.on_connection_create_end.append(_mark('connect'))
+    config.on_request_headers_sent.append(_mark('pretransfer'))
+    config.on_request_end.append(_mark('starttransfer'))
+    return config
+
+
+def to_requests_response(client_response, body, prepped, elapsed, timings=None):
+    """ Wrap an aiohttp response and its body as a requests Response,
+        so validators, header parsing and benchmark METRICS can use it unchanged """
+    response = requests.Response()
+    response.status_code = client_response.status
+    response.reason = client_response.reason
+    response.headers = CaseInsensitiveDict(client_response.headers)
+    response._content = body
+    response._content_consumed = True
+    response.url = str(client_response.url)
+    response.elapsed = datetime.timedelta(seconds=elapsed)
+    response.history = list(client_response.history)
+    response.request = prepped
+    if timings is not None:
+        response.timings = timings
+    return response
+
+
+class AsyncioEngine(object):
+    """ Owns the event loop and HTTP client for a run, and runs tests/benchmarks on them
+
+        Tests in a TestSet run one at a time unless test_parallel is set, in which case they run
+        concurrently, at most parallel_workers in flight, ordered by parallel.dependency_graph
+    """
+    loop = None
+    client = None  # aiohttp.ClientSession, created on the loop when first needed
+    executor = None  # Thread pool for blocking sends, when aiohttp is not installed
+    connection_pool = None
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connection_pool=None):
+        self.pool_size = pool_size
+        self.loop = asyncio.new_event_loop()
+        self.owns_pool = connection_pool is None
+        self.connection_pool = connection_pool
+        if aiohttp is None:
+            LOGGER.info("aiohttp not installed, asyncio engine sends requests from a thread pool")
+            if self.connection_pool is None:
+                self.connection_pool = ConnectionPool(pool_size=pool_size)
+            self.executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    def run_tests(self, tests, test_config=resttest.TestConfig(), context=None,
+                  profile=NO_PROFILE):
+        """ Run the tests of a TestSet, returning their TestResponses in test order
+            Stops after a failed stop_on_failure test, like run_testsets """
+        if context is None:
+            context = Context()
+        return self.loop.run_until_complete(
+            self._run_tests(tests, test_config, context, profile))
+
+    def run_test(self, mytest, test_config=resttest.TestConfig(), context=None,
+                 profile=NO_PROFILE):
+        """ Run a single test, like resttest.run_test """
+        if context is None:
+            context = Context()
+        return self.loop.run_until_complete(
+            self._run_test(mytest, test_config, context, profile))
+
+    def run_benchmark(self, benchmark, test_config=resttest.TestConfig(), context=None,
+                      monitor=None, sample_writer=None):
+        """ Run a benchmark, like resttest.run_benchmark, returning the analyzed BenchmarkResult """
+        if context is None:
+            context = Context()
+        return self.loop.run_until_complete(
+            self._run_benchmark(benchmark, test_config, context, monitor, sample_writer))
+
+    def close(self):
+        """ Close the HTTP client, threads and the event loop """
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.close())
+            self.client = None
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.owns_pool and self.connection_pool is not None:
+            self.connection_pool.close()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+    async def _send(self, prepped, test_config, stream=False):
+        """ Send a prepared request, returning a requests Response with the body read
+            With stream set, the body is left to drain_response over the thread pool fallback,
+            and over aiohttp read in chunks and counted without being kept """
+        if aiohttp is None:
+            session = self.connection_pool.session()
+            session.stream = stream
+            if test_config.ssl_insecure:
+                session.verify = False
+            return await self.loop.run_in_executor(self.executor, session.send, prepped)
+
+        if self.client is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            # Each test gets its own cookies in the requests engine, so keep none here
+            self.client = aiohttp.ClientSession(connector=connector,
+                                                cookie_jar=aiohttp.DummyCookieJar(),
+                                                trace_configs=[timing_trace_config()])
+        timings = RequestTimings()
+        async with self.client.request(
+                prepped.method, prepped.url,
+                headers=dict(prepped.headers),
+                data=prepped.body,
+                ssl=False if test_config.ssl_insecure else None,
+                timeout=aiohttp.ClientTimeout(total=test_config.timeout),
+                trace_request_ctx=timings) as client_response:
+            elapsed = timeit.default_timer() - timings.start
+            if stream:
+                body = b''
+                async for chunk in client_response.content.iter_chunked(DRAIN_CHUNK_SIZE):
+                    timings.downloaded = timings.downloaded + len(chunk)
+            else:
+                body = await client_response.read()
+                timings.downloaded = len(body)
+            timings.mark('end')
+        if prepped.body is not None:
+            timings.uploaded = super_len(prepped.body)
+        if timings.connect is not None:
+            timings.connects = 1
+        if timings.connect is not None and client_response.url.scheme == 'https':
+            timings.appconnect = timings.connect
+        response = to_requests_response(client_response, body, prepped, elapsed, timings)
+        response.drained = stream  # Counted already, nothing for drain_response to read
+        return response
+
+    async def _run_test(self, mytest, test_config, context, profile=NO_PROFILE):
+        """ Coroutine version of resttest.run_test, interactive mode excepted """
+        started = profile.start()
+        mytest.update_context_before(context)
+        profile.stop(u'update_context_before', started)
+        started = profile.start()
+        templated_test = mytest.realize(context)
+        profile.stop(u'realize', started)
+
+        result = resttest.TestResponse()
+        result.test = templated_test
+        prepped = resttest.prepare_request(templated_test, test_config, context, profile=profile)
+        result.passed = None
+
+        if mytest.delay > 0:
+            LOGGER.info("Delaying for %ds" % mytest.delay)
+            await asyncio.sleep(mytest.delay)
+
+        try:
+            started = profile.start()
+            response = await self._send(prepped, test_config)
+            profile.stop(u'send', started)
+        except Exception as error:
+            return resttest.request_failed(result, error)
+        return resttest.process_test_response(mytest, result, response, test_config, context,
+                                              profile)
+
+    async def _run_tests(self, tests, test_config, context, profile=NO_PROFILE):
+        """ Run tests serially, or concurrently in dependency order if test_parallel is set """
+        results = list()
+        if not test_config.test_parallel:
+            for test in tests:
+                result = await self._run_test(test, test_config, context, profile)
+                results.append(result)
+                if not result.passed and test.stop_on_failure:
+                    break
+            return results
+
+        graph = parallel.dependency_graph(tests)
+        limit = asyncio.Semaphore(test_config.parallel_workers)
+        tasks = list()
+        for index, test in enumerate(tests):
+            deps = [(tasks[dep], tests[dep]) for dep in sorted(graph[index])]
+            tasks.append(self.loop.create_task(
+                self._run_after(deps, test, test_config, context, limit, profile)))
+
+        try:
+            for index, task in enumerate(tasks):
+                result = await task
+                if result is None:  # Held back by a failed stop_on_failure test
+                    break
+                results.append(result)
+                if not result.passed and tests[index].stop_on_failure:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return results
+
+    async def _run_after(self, deps, mytest, test_config, context, limit, profile=NO_PROFILE):
+        """ Wait for the tests this one depends on, then run it
+            Returns None if a dependency stopped the test set """
+        for task, dep_test in deps:
+            dep_result = await task
+            if dep_result is None or (not dep_result.passed and dep_test.stop_on_failure):
+                return None
+        async with limit:
+            return await self._run_test(mytest, test_config, context, profile)
+
+    async def _run_benchmark(self, benchmark, test_config, context, monitor=None,
+                             sample_writer=None):
+        """ Coroutine version of resttest.run_benchmark, workers are tasks on the loop """
+        benchmark_runs = benchmark.benchmark_runs
+        if benchmark_runs <= 0 and benchmark.duration is None and not benchmark.stages:
+            raise Exception(
+                "Invalid number of benchmark runs, must be > 0 :" + str(benchmark_runs))
+
+        output = resttest.BenchmarkResult()
+        output.name = benchmark.name
+        output.group = benchmark.group
+        stages = benchmark.load_stages()
+        # Streamed values are already on disk, keeping them too would grow without bound
+        kept_metrics = benchmark.raw_metrics if sample_writer is None else ()
+
+        async def warmup(schedule):
+            while schedule.next_run() is not None:
+                prepped = resttest.prepare_benchmark_request(benchmark, test_config, context)
+                response = await self._send(prepped, test_config, stream=True)
+                drain_response(response)
+                schedule.record(response)
+
+        async def measure(schedule):
+            recorder = BenchmarkRecorder(benchmark.metrics, open_loop=schedule.rate is not None,
+                                         stage=stage_index,
+                                         raw_metrics=kept_metrics,
+                                         aggregated_metrics=benchmark.aggregated_metrics,
+                                         timeseries=benchmark.new_timeseries(origin),
+                                         profile_client=test_config.profile_client,
+                                         sink=sample_writer)
+            if monitor is not None:
+                monitor(recorder)
+            profile = recorder.profile or NO_PROFILE
+            start = timeit.default_timer()
+            while True:
+                due = schedule.next_run()
+                if due is None:
+                    break
+                wait = due - timeit.default_timer()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                sent = timeit.default_timer()
+                prepped = resttest.prepare_benchmark_request(benchmark, test_config, context,
+                                                             profile)
+                try:
+                    started = profile.start()
+                    response = await self._send(prepped, test_config, stream=True)
+                    profile.stop(u'send', started)
+                    drain_response(response)
+                except Exception as error:
+                    recorder.record_failure(error, timeit.default_timer() - sent)
+                    continue
+                # Latency from when it was due, so time waiting on the lock, templating
+                # and signing count too, not only the transport's total_time
+                recorder.record(response, timeit.default_timer() - due)
+                schedule.record(response)
+            recorder.elapsed = timeit.default_timer() - start
+            return recorder
+
+        async def run_workers(function, schedule, count):
+            return list(await asyncio.gather(*[function(schedule) for x in range(0, count)]))
+
+        LOGGER.info('Warmup: ' + benchmark.name + ' started')
+        warmup_schedule = benchmark.warmup_schedule()
+        await run_workers(warmup, warmup_schedule, stages[0].worker_count())
+        output.warmup_runs = warmup_schedule.issued
+        LOGGER.info('Warmup: ' + benchmark.name +
+                    ' finished after {0} runs'.format(output.warmup_runs))
+
+        LOGGER.info('Benchmark: ' + benchmark.name + ' starting')
+        origin = timeit.default_timer()
+        sampler = ResourceSampler().start()
+        stage_recorders = list()
+        try:
+            for stage_index, stage in enumerate(stages):
+                schedule = stage.schedule()
+                schedule.begin()
+                stage_recorders.append(await run_workers(measure, schedule, stage.worker_count()))
+                if isinstance(schedule, PrecisionSchedule):
+                    output.precision = schedule.summary()
+        finally:
+            sampler.stop()
+        output.resources = [sampler.summary()]
+        LOGGER.info('Benchmark: ' + benchmark.name + ' ending')
+
+        if benchmark.stages:
+            resttest.collect_benchmark_results(output, stage_recorders, benchmark.stages)
+        else:
+            resttest.collect_benchmark_results(output, stage_recorders[0])
+        return resttest.analyze_benchmark_results(output, benchmark)
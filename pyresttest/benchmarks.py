@@ -6,6 +6,19 @@ Encapsulates logic related to benchmarking
 """
 import math
 import json
+import array
+import bisect
+import collections
+import errno
+import mmap
+import random
+import socket
+import ssl
+import struct
+import sys
+import threading
+import timeit
+import concurrent.futures
 
 # Python 3 compatibility shims
 from . import six
@@ -16,59 +29,79 @@ from . import tests
 from .tests import Test
 from .parsing import *
 from .metric import Metrics
+from .accumulators import Accumulator
+from .histogram import Histogram
+from .profiling import ClientProfile
+from . import samples
+from .samples import Samples
 
 # Python 2/3 switches
 if sys.version_info[0] > 2:
     from past.builtins import basestring
 
+try:
+    from statistics import NormalDist  # Python 3.8+
+except ImportError:
+    NormalDist = None
+
 
 # Request metrics for benchmarking, key is name in config file, value is request variable
 METRICS = {
     # Timing info, precisely in order from start to finish
     # The time it took from the start until the name resolving was completed.
-    'namelookup_time': Metrics.namelookup_time(),
+    'namelookup_time':
+        lambda x: Metrics.namelookup_time(x),
 
     # The time it took from the start until the connect to the remote host (or
     # proxy) was completed.
-    'connect_time': Metrics.connect_time(),
+    'connect_time':
+        lambda x: Metrics.connect_time(x),
 
     # The time it took from the start until the SSL connect/handshake with the
     # remote host was completed.
-    'appconnect_time': Metrics.appconnect_time(),
+    'appconnect_time':
+        lambda x: Metrics.appconnect_time(x),
 
     # The time it took from the start until the file transfer is just about to begin.
     # This includes all pre-transfer commands and negotiations that are
     # specific to the particular protocol(s) involved.
-    'pretransfer_time': Metrics.pretransfer_time(),
+    'pretransfer_time':
+        lambda x: Metrics.pretransfer_time(x),
 
     # The time it took from the start until the first byte is received by
     # libcurl.
-    'starttransfer_time': Metrics.starttransfer_time(),
+    'starttransfer_time':
+        lambda x: Metrics.starttransfer_time(x),
 
     # The time it took for all redirection steps
     # include name lookup, connect, pretransfer and transfer
     # before final transaction was started.
     # So, this is zero if no redirection took place.
-    'redirect_time': Metrics.redirect_time(),
+    'redirect_time':
+        lambda x: Metrics.redirect_time(x),
 
     # Total time of the previous request.
     'total_time':
         lambda x: Metrics.total_time(x),
 
     # Transfer sizes and speeds
-    'size_download': Metrics.size_download(),
+    'size_download':
+        lambda x: Metrics.size_download(x),
     'size_upload':
         lambda x: Metrics.size_upload(x),
     'request_size':
         lambda x: Metrics.request_size(x),
 
-    'speed_download': Metrics.speed_download(),
-    'speed_upload': Metrics.speed_upload(),
+    'speed_download':
+        lambda x: Metrics.speed_download(x),
+    'speed_upload':
+        lambda x: Metrics.speed_upload(x),
 
     # Connection counts
     'redirect_count':
         lambda x: Metrics.redirect_count(x),
-    'num_connects': Metrics.num_connects()
+    'num_connects':
+        lambda x: Metrics.num_connects(x)
 }
 
 # Map statistical aggregate to the function to use to perform the
@@ -83,10 +116,99 @@ AGGREGATES = {
     'median': lambda x: median(x),
     'std_deviation': lambda x: std_deviation(x),
     'sum': lambda x: sum(x),
-    'total': lambda x: sum(x)
+    'total': lambda x: sum(x),
+    'min': lambda x: min(x),
+    'max': lambda x: max(x),
+    'p50': lambda x: percentile(x, 50),
+    'p75': lambda x: percentile(x, 75),
+    'p90': lambda x: percentile(x, 90),
+    'p95': lambda x: percentile(x, 95),
+    'p99': lambda x: percentile(x, 99),
+    'p99.9': lambda x: percentile(x, 99.9)
+}
+
+# Aggregates an Accumulator keeps up to date as values are recorded, no values are stored
+ACCUMULATOR_AGGREGATES = {
+    'mean_arithmetic': lambda x: x.mean(),
+    'mean': lambda x: x.mean(),
+    'mean_harmonic': lambda x: x.mean_harmonic(),
+    'std_deviation': lambda x: x.std_deviation(),
+    'sum': lambda x: x.total,
+    'total': lambda x: x.total,
+    'min': lambda x: x.min,
+    'max': lambda x: x.max
 }
 
-OUTPUT_FORMATS = [u'csv', u'json']
+# Aggregates computed from a Histogram, for metrics not kept as raw data
+# Histograms are Accumulators, so they have those aggregates too
+HISTOGRAM_AGGREGATES = {
+    'median': lambda x: x.percentile(50),
+    'p50': lambda x: x.percentile(50),
+    'p75': lambda x: x.percentile(75),
+    'p90': lambda x: x.percentile(90),
+    'p95': lambda x: x.percentile(95),
+    'p99': lambda x: x.percentile(99),
+    'p99.9': lambda x: x.percentile(99.9)
+}
+HISTOGRAM_AGGREGATES.update(ACCUMULATOR_AGGREGATES)
+
+# Aggregate names for any percentile, followed by the percent: percentile_99.99
+PERCENTILE_PREFIX = u'percentile_'
+
+# Percentiles with names of their own
+NAMED_PERCENTILES = {'p50': 50, 'p75': 75, 'p90': 90, 'p95': 95, 'p99': 99, 'p99.9': 99.9}
+
+# Metrics measured in seconds, recorded into histograms unless their raw values are wanted
+TIMING_METRICS = frozenset([u'namelookup_time', u'connect_time', u'appconnect_time',
+                            u'pretransfer_time', u'starttransfer_time', u'redirect_time',
+                            u'total_time'])
+
+OUTPUT_FORMATS = [u'csv', u'json', u'jsonl', u'binary']
+
+# Binary output, see write_binary_results: magic, format version and header length, then the
+# header as JSON, then each raw metric as a column of fixed-width little-endian values
+BINARY_MAGIC = b'PRTB'
+BINARY_VERSION = 1
+BINARY_PREAMBLE = struct.Struct('<4sII')
+BINARY_ALIGNMENT = 8  # Columns start on a multiple of this many bytes
+# Metrics that are whole numbers, stored as int64 with -1 when missing; others are float64, NaN
+INTEGER_METRICS = frozenset([u'size_download', u'size_upload', u'request_size',
+                             u'redirect_count', u'num_connects'])
+
+# With a rate, latency measured from the intended send time rather than the actual one
+CORRECTED_TOTAL_TIME = u'corrected_total_time'
+
+# Classes of errors counted separately in benchmark results, see error_class
+ERROR_TIMEOUT = u'timeout'
+ERROR_REFUSED = u'connection_refused'
+ERROR_RESET = u'connection_reset'
+ERROR_TLS = u'tls'
+ERROR_OTHER = u'other'
+
+TIMEOUT_ERRORS = (socket.timeout, concurrent.futures.TimeoutError)
+if sys.version_info[0] > 2:
+    TIMEOUT_ERRORS = TIMEOUT_ERRORS + (TimeoutError,)
+TLS_ERRORS = (ssl.SSLError, ssl.CertificateError)
+
+# Suffixes allowed on durations, and seconds per unit
+DURATION_UNITS = {u's': 1, u'm': 60, u'h': 3600}
+
+# Automatic warmup: compare the mean total_time of the last window of runs against the window
+# before it, and stop once they differ by at most tolerance (relative), or after max_runs
+DEFAULT_WARMUP_WINDOW = 10
+DEFAULT_WARMUP_TOLERANCE = 0.05
+DEFAULT_WARMUP_MAX_RUNS = 500
+
+# Precision targets: runs always made before checking, and the most runs made to reach it
+DEFAULT_PRECISION_MIN_RUNS = 30
+DEFAULT_PRECISION_MAX_RUNS = 10000
+
+# Aggregates a precision target can be set for, the confidence interval is computed differently
+PRECISION_AGGREGATES = {u'mean': u'mean', u'mean_arithmetic': u'mean', u'median': u'median'}
+
+# Workers for a benchmark with a rate but no concurrency, enough to keep sending on schedule
+# while responses are slow
+DEFAULT_RATE_CONCURRENCY = 32
 
 
 def median(array):
@@ -115,9 +237,1010 @@ def std_deviation(array):
     return math.sqrt(stdev)
 
 
+def new_metric_store(metricname, raw_metrics=None, aggregates=None):
+    """ Empty storage for a metric's values
+        - Samples, keeping every value, if raw_metrics is None or lists the metric
+        - Otherwise a Histogram for timing metrics
+        - An Accumulator for other metrics if the aggregates wanted (a list of names) need
+            no more, or else a Histogram counting whole units
+    """
+    if raw_metrics is None or metricname in raw_metrics:
+        return Samples()
+    if metricname in TIMING_METRICS:
+        return Histogram()
+    if aggregates is not None and all(x in ACCUMULATOR_AGGREGATES for x in aggregates):
+        return Accumulator()
+    return Histogram(unit=1)
+
+
+def _store(store, value):
+    """ Add a value to Samples, an Accumulator or a Histogram """
+    if isinstance(store, Samples):
+        store.append(value)
+    elif value is not None:  # Not measured for this response, nothing to count
+        store.record(value)
+
+
+def _merge(store, other):
+    """ Add the values of another store of the same kind to Samples, an Accumulator
+        or a Histogram """
+    if isinstance(store, Samples):
+        store.extend(other)
+    else:
+        store.merge(other)
+
+
+def select(array, rank):
+    """ The rank-th smallest value (from 0) of an array, in linear time on average,
+        without sorting it all """
+    values = list(array)
+    while True:
+        pivot = values[random.randrange(len(values))]
+        lower = [x for x in values if x < pivot]
+        if rank < len(lower):
+            values = lower
+            continue
+        rank = rank - len(lower)
+        equal = len(values) - len(lower) - sum(1 for x in values if x > pivot)
+        if rank < equal:
+            return pivot
+        rank = rank - equal
+        values = [x for x in values if x > pivot]
+
+
+def percentile_rank(percent, count):
+    """ Index in sorted order of the value at a percentile of count values, nearest-rank """
+    rank = int(math.ceil(percent / 100.0 * count)) - 1
+    return min(max(rank, 0), count - 1)
+
+
+def percentile(array, percent):
+    """ Value at or below which percent (0 to 100) of an array falls, nearest-rank method """
+    return select(array, percentile_rank(percent, len(array)))
+
+
+def percentile_of(aggregate_name):
+    """ Percent for a percentile aggregate name, p99 or percentile_NN,
+        None if the name isn't one """
+    if aggregate_name in NAMED_PERCENTILES:
+        return NAMED_PERCENTILES[aggregate_name]
+    if not aggregate_name.startswith(PERCENTILE_PREFIX):
+        return None
+    try:
+        percent = float(aggregate_name[len(PERCENTILE_PREFIX):])
+    except ValueError:
+        return None
+    if percent < 0 or percent > 100:
+        return None
+    return percent
+
+
+def aggregate_function(aggregate_name, numbers=None):
+    """ Function computing the named aggregate over numbers, a list of values by default,
+        or an Accumulator or Histogram.  None if there is no such aggregate for them. """
+    if isinstance(numbers, Histogram):
+        aggregates = HISTOGRAM_AGGREGATES
+    elif isinstance(numbers, Accumulator):
+        aggregates = ACCUMULATOR_AGGREGATES
+    else:
+        aggregates = AGGREGATES
+    if aggregate_name in aggregates:
+        return aggregates[aggregate_name]
+    percent = percentile_of(aggregate_name)
+    if percent is None or aggregates is ACCUMULATOR_AGGREGATES:
+        return None
+    if aggregates is HISTOGRAM_AGGREGATES:
+        return lambda x: x.percentile(percent)
+    return lambda x: percentile(x, percent)
+
+
+def _vectorized_aggregates(values, aggregate_names):
+    """ Aggregates over a NumPy array, order statistics all come from one partial sort """
+    count = len(values)
+    ranks = set()
+    for name in aggregate_names:
+        if name == 'median':
+            ranks.update([count // 2, (count - 1) // 2])
+        elif percentile_of(name) is not None:
+            ranks.add(percentile_rank(percentile_of(name), count))
+    ordered = values
+    if ranks:
+        ordered = samples.numpy.partition(values, sorted(ranks))
+
+    output = list()
+    for name in aggregate_names:
+        if name in ('mean', 'mean_arithmetic'):
+            result = values.mean()
+        elif name == 'mean_harmonic':
+            result = 1.0 / (1.0 / values).mean()
+        elif name == 'std_deviation':
+            result = values.std() if count > 1 else 0
+        elif name in ('sum', 'total'):
+            result = values.sum()
+        elif name == 'min':
+            result = values.min()
+        elif name == 'max':
+            result = values.max()
+        elif name == 'median':
+            result = (ordered[count // 2] + ordered[(count - 1) // 2]) / 2.0
+        else:
+            result = ordered[percentile_rank(percentile_of(name), count)]
+        output.append(float(result))
+    return output
+
+
+def aggregate_all(numbers, aggregate_names):
+    """ List of the named aggregates over numbers: a list, Samples, Accumulator or Histogram
+        Samples are aggregated vectorized if NumPy is installed, in pure Python if not.
+        Missing values are left out, aggregates are None if there are no values. """
+    if isinstance(numbers, Samples):
+        if samples.numpy is not None:
+            values = numbers.as_numpy()
+            if len(values):
+                return _vectorized_aggregates(values, aggregate_names)
+            return [None for x in aggregate_names]
+        numbers = numbers.present()
+    if not numbers:
+        return [None for x in aggregate_names]
+    return [aggregate_function(name, numbers)(numbers) for name in aggregate_names]
+
+
+def _error_chain(error):
+    """ The error, then the errors it wraps or was raised from
+        HTTP libraries wrap the socket or TLS error that caused a failure, in args,
+        as a reason (urllib3) or an os_error (aiohttp), or by raising from it """
+    chain = list()
+    pending = [error]
+    while pending:
+        current = pending.pop(0)
+        if not isinstance(current, BaseException) or any(current is x for x in chain):
+            continue
+        chain.append(current)
+        pending.extend((getattr(current, 'reason', None), getattr(current, 'os_error', None),
+                        getattr(current, '__cause__', None), getattr(current, '__context__', None)))
+        pending.extend(current.args)
+    return chain
+
+
+def error_class(error):
+    """ Classify the exception raised by a failed request: one of ERROR_TIMEOUT, ERROR_REFUSED,
+        ERROR_RESET, ERROR_TLS, or ERROR_OTHER for anything else """
+    chain = _error_chain(error)
+    errors = set(getattr(x, 'errno', None) for x in chain)
+    if errno.ETIMEDOUT in errors or any(isinstance(x, TIMEOUT_ERRORS) for x in chain):
+        return ERROR_TIMEOUT
+    if any(isinstance(x, TLS_ERRORS) for x in chain):
+        return ERROR_TLS
+    if errno.ECONNREFUSED in errors:
+        return ERROR_REFUSED
+    if errno.ECONNRESET in errors or errno.EPIPE in errors:
+        return ERROR_RESET
+    return ERROR_OTHER
+
+
+def latency_summary(histogram):
+    """ Mean, p50, p90, p99 and max of a Histogram of latencies """
+    return {u'mean': histogram.mean(), u'p50': histogram.percentile(50),
+            u'p90': histogram.percentile(90), u'p99': histogram.percentile(99),
+            u'max': histogram.max}
+
+
+class Outcome(object):
+    """ Requests that ended one way, such as with one status code or class of error,
+        and their latency """
+    count = 0
+    latency = None  # Histogram of seconds each request took, where known
+
+    def __init__(self):
+        self.count = 0
+        self.latency = Histogram()
+
+    def record(self, latency=None):
+        self.count = self.count + 1
+        if latency is not None:
+            self.latency.record(latency)
+
+    def merge(self, other):
+        self.count = self.count + other.count
+        self.latency.merge(other.latency)
+        return self
+
+    def summary(self):
+        return {u'count': self.count, u'latency': latency_summary(self.latency)}
+
+
+def _record_outcome(outcomes, key, latency=None):
+    outcome = outcomes.get(key)
+    if outcome is None:
+        outcome = outcomes[key] = Outcome()
+    outcome.record(latency)
+
+
+def _merge_outcomes(outcomes, other):
+    for key, outcome in other.items():
+        if key in outcomes:
+            outcomes[key].merge(outcome)
+        else:
+            outcomes[key] = Outcome().merge(outcome)
+
+
+class TimeBucket(object):
+    """ What completed during one interval of a benchmark """
+    requests = 0  # Responses measured
+    failures = 0  # Requests that raised instead of returning a response
+    latency = None  # Histogram of total_time
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.latency = Histogram()
+
+    def merge(self, other):
+        self.requests = self.requests + other.requests
+        self.failures = self.failures + other.failures
+        self.latency.merge(other.latency)
+        return self
+
+
+class TimeSeries(object):
+    """ Requests, failures and latency for each interval (seconds) of a benchmark,
+        by the time each request completed
+
+        Intervals count from origin, a timeit.default_timer() value: workers of one run
+        share it, so their buckets line up when merged.
+    """
+    interval = None
+    origin = None
+    buckets = None  # Interval index -> TimeBucket, intervals where nothing completed are absent
+
+    def __init__(self, interval, origin=None):
+        self.interval = interval
+        if origin is None:
+            origin = timeit.default_timer()
+        self.origin = origin
+        self.buckets = dict()
+
+    def _bucket(self):
+        index = max(0, int((timeit.default_timer() - self.origin) / self.interval))
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = TimeBucket()
+        return bucket
+
+    def record(self, latency):
+        """ Count a response, completed now, with its total_time """
+        bucket = self._bucket()
+        bucket.requests = bucket.requests + 1
+        bucket.latency.record(latency)
+
+    def record_failure(self):
+        """ Count a request that failed now """
+        bucket = self._bucket()
+        bucket.failures = bucket.failures + 1
+
+    def merge(self, other):
+        """ Add another series' buckets, interval for interval, returns self """
+        for index, bucket in other.buckets.items():
+            if index in self.buckets:
+                self.buckets[index].merge(bucket)
+            else:
+                self.buckets[index] = TimeBucket().merge(bucket)
+        return self
+
+    def empty_copy(self):
+        return TimeSeries(self.interval, self.origin)
+
+    def summary(self):
+        """ List with a dict for every interval up to the last one with results:
+            its start (seconds from the origin), requests, failures, throughput (responses/second)
+            and latency: mean, p50, p90, p99 and max of total_time """
+        output = list()
+        if not self.buckets:
+            return output
+        for index in range(0, max(self.buckets.keys()) + 1):
+            bucket = self.buckets.get(index) or TimeBucket()
+            output.append({
+                u'start': index * self.interval,
+                u'requests': bucket.requests,
+                u'failures': bucket.failures,
+                u'throughput': bucket.requests / float(self.interval),
+                u'latency': latency_summary(bucket.latency)})
+        return output
+
+
+class SinkGroup(object):
+    """ Recorder sink passing every sample and failure on to each of several sinks """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def sample(self, stage, metrics, status):
+        for sink in self.sinks:
+            sink.sample(stage, metrics, status)
+
+    def failure(self, stage, error, elapsed):
+        for sink in self.sinks:
+            sink.failure(stage, error, elapsed)
+
+
+def add_sink(recorder, sink):
+    """ Have a recorder pass its samples to sink, as well as any sink it already has """
+    if recorder.sink is None:
+        recorder.sink = sink
+    else:
+        recorder.sink = SinkGroup([recorder.sink, sink])
+
+
+class BenchmarkRecorder(object):
+    """ Collects the measurements of one benchmark worker
+        Each worker records into its own recorder, recorders are merged at the end.
+        Another thread can take() what has been recorded so far while the worker runs.
+
+        Metrics named in raw_metrics keep Samples of every value.  The others are aggregated as
+        they are recorded, see new_metric_store: timing metrics go into Histograms, other
+        metrics into Accumulators when aggregated_metrics (metric name to aggregate names)
+        only asks for what those keep.  Without raw_metrics, every metric keeps Samples.
+    """
+    metricnames = None
+    metricvalues = None  # Functions from METRICS, in metricnames order
+    raw_metrics = None  # Metrics that keep every value
+    aggregated_metrics = None  # Aggregates wanted for each metric
+    results = None  # One Samples, Accumulator or Histogram of values per metric
+    timeseries = None  # TimeSeries, if requests are also counted per interval
+    statuses = None  # HTTP status code -> Outcome, with total_time as latency
+    errors = None  # Error class (see error_class) -> Outcome of the failures
+    profile = None  # ClientProfile of the worker's own overhead, if profiling
+    sink = None  # Receives every sample as it is recorded, such as a resttest.SampleWriter
+    corrected = None  # Open loop only: latency from each request's intended send time
+    requests = 0  # Responses measured
+    failures = 0  # Requests that raised instead of returning a response
+    elapsed = 0.0  # Seconds this worker spent in the measured phase
+    stage = 0  # Index of the benchmark stage the worker ran in
+
+    def __init__(self, metricnames, open_loop=False, stage=0, raw_metrics=None,
+                 aggregated_metrics=None, timeseries=None, profile_client=False, sink=None):
+        self.metricnames = list(metricnames)
+        self.metricvalues = [METRICS[name] for name in self.metricnames]
+        if raw_metrics is not None:
+            raw_metrics = frozenset(raw_metrics)
+        self.raw_metrics = raw_metrics
+        self.aggregated_metrics = aggregated_metrics
+        self.timeseries = timeseries
+        self.profile = ClientProfile() if profile_client else None
+        self.sink = sink
+        self.results = self._new_results()
+        self.statuses = dict()
+        self.errors = dict()
+        self.corrected = self._new_corrected() if open_loop else None
+        self.requests = 0
+        self.failures = 0
+        self.elapsed = 0.0
+        self.stage = stage
+        self.lock = threading.Lock()
+
+    def record(self, response, corrected=None):
+        """ Store every metric for a response
+            corrected is the latency from the request's intended send time until it completed,
+            for open loop runs; total_time if not given """
+        values = [metricvalue(response) for metricvalue in self.metricvalues]
+        total_time = METRICS['total_time'](response)
+        if corrected is None:
+            corrected = total_time
+        with self.lock:
+            for i in range(0, len(values)):
+                _store(self.results[i], values[i])
+            if self.corrected is not None:
+                _store(self.corrected, corrected)
+            if self.timeseries is not None:
+                self.timeseries.record(total_time)
+            _record_outcome(self.statuses, getattr(response, 'status_code', None), total_time)
+            self.requests = self.requests + 1
+        if self.sink is not None:
+            metrics = dict(zip(self.metricnames, values))
+            metrics[u'total_time'] = total_time  # Latency, even if not a benchmark metric
+            if self.corrected is not None:
+                metrics[CORRECTED_TOTAL_TIME] = corrected
+            self.sink.sample(self.stage, metrics, getattr(response, 'status_code', None))
+
+    def record_failure(self, error=None, elapsed=None):
+        """ Count a request that failed before producing a response
+            error is the exception it raised, elapsed the seconds until it did """
+        kind = ERROR_OTHER
+        if error is not None:
+            kind = error_class(error)
+        with self.lock:
+            self.failures = self.failures + 1
+            _record_outcome(self.errors, kind, elapsed)
+            if self.timeseries is not None:
+                self.timeseries.record_failure()
+        if self.sink is not None:
+            self.sink.failure(self.stage, kind, elapsed)
+
+    def throughput(self):
+        """ Responses per second for this worker, None if nothing was timed """
+        if self.elapsed <= 0:
+            return None
+        return self.requests / self.elapsed
+
+    def _new_results(self):
+        aggregates = self.aggregated_metrics
+        if aggregates is None:
+            return [new_metric_store(name, self.raw_metrics) for name in self.metricnames]
+        return [new_metric_store(name, self.raw_metrics, aggregates.get(name, list()))
+                for name in self.metricnames]
+
+    def _new_corrected(self):
+        """ Corrected latency is kept like total_time """
+        if self.raw_metrics is None or u'total_time' in self.raw_metrics:
+            return Samples()
+        return Histogram()
+
+    def empty_copy(self):
+        """ A new recorder for the same metrics and stage, storing them the same way """
+        timeseries = None
+        if self.timeseries is not None:
+            timeseries = self.timeseries.empty_copy()
+        return BenchmarkRecorder(self.metricnames, stage=self.stage,
+                                 raw_metrics=self.raw_metrics,
+                                 aggregated_metrics=self.aggregated_metrics,
+                                 timeseries=timeseries)
+
+    def take(self):
+        """ Remove and return everything recorded so far, as a new recorder
+            This recorder is left holding only what is recorded afterwards """
+        with self.lock:
+            taken = self.empty_copy()
+            taken.results = self.results
+            taken.statuses = self.statuses
+            taken.errors = self.errors
+            if self.profile is not None:
+                taken.profile = self.profile.take()
+            taken.corrected = self.corrected
+            taken.timeseries, self.timeseries = self.timeseries, taken.timeseries
+            taken.requests = self.requests
+            taken.failures = self.failures
+            taken.elapsed = self.elapsed
+            self.results = self._new_results()
+            self.statuses = dict()
+            self.errors = dict()
+            if self.corrected is not None:
+                self.corrected = self._new_corrected()
+            self.requests = 0
+            self.failures = 0
+        return taken
+
+    def merge(self, other):
+        """ Fold another worker's measurements into this one, returns self
+            Recorders taken from the same worker merge back into one, with its elapsed time """
+        for i in range(0, len(self.results)):
+            _merge(self.results[i], other.results[i])
+        if other.corrected is not None:
+            if self.corrected is None:
+                self.corrected = self._new_corrected()
+            _merge(self.corrected, other.corrected)
+        if other.timeseries is not None:
+            if self.timeseries is None:
+                self.timeseries = other.timeseries.empty_copy()
+            self.timeseries.merge(other.timeseries)
+        _merge_outcomes(self.statuses, other.statuses)
+        _merge_outcomes(self.errors, other.errors)
+        if other.profile is not None:
+            if self.profile is None:
+                self.profile = ClientProfile()
+            self.profile.merge(other.profile)
+        self.requests = self.requests + other.requests
+        self.failures = self.failures + other.failures
+        self.elapsed = max(self.elapsed, other.elapsed)
+        return self
+
+    def metric_results(self):
+        """ Map of metric name to its Samples of raw values, Accumulator or Histogram """
+        output = dict(zip(self.metricnames, self.results))
+        if self.corrected is not None:
+            output[CORRECTED_TOTAL_TIME] = self.corrected
+        return output
+
+    def __getstate__(self):
+        """ Pickle without the metric functions and lock, they are rebuilt on unpickling """
+        state = self.__dict__.copy()
+        del state['metricvalues']
+        del state['lock']
+        state['sink'] = None  # Samples are written where they are recorded
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.metricvalues = [METRICS[name] for name in self.metricnames]
+        self.lock = threading.Lock()
+
+
+class RunSchedule(object):
+    """ Hands out the runs of a benchmark phase to its workers, safe to share between threads
+
+        Without a rate this is a closed loop: each run may start as soon as a worker is free.
+        With a rate (requests/second) it is an open loop: run N is due at start + N/rate,
+        whether or not earlier responses have come back.  A worker that picks up a run late
+        (all workers were busy) records the delay, so it counts toward corrected latency.
+
+        The schedule ends after runs runs, or when no more runs are due within duration seconds,
+        whichever comes first, either may be None for no limit.
+    """
+    runs = None
+    rate = None
+    duration = None
+    issued = 0
+    start = None
+
+    def __init__(self, runs=None, rate=None, duration=None):
+        self.runs = runs
+        self.rate = rate
+        self.duration = duration
+        self.issued = 0
+        self.lock = threading.Lock()
+        self.start = timeit.default_timer()
+
+    def begin(self):
+        """ Start the clock for the schedule """
+        self.start = timeit.default_timer()
+
+    def next_run(self):
+        """ Claim a run, returning the timer value it is due at, or None when all are claimed """
+        with self.lock:
+            if self.runs is not None and self.issued >= self.runs:
+                return None
+            if self.rate is None:
+                due = timeit.default_timer()
+            else:
+                due = self.start + self.issued / float(self.rate)
+            if self.duration is not None and due - self.start >= self.duration:
+                return None
+            self.issued = self.issued + 1
+        return due
+
+    def record(self, response):
+        """ Called with each response of a run, for schedules that adapt to what they see """
+        pass
+
+
+class SteadyStateSchedule(RunSchedule):
+    """ Warmup schedule that runs until total_time stabilizes, up to max_runs runs
+
+        Stable means the mean of the last window responses is within tolerance (relative)
+        of the mean of the window before.  Runs already claimed by other workers when that
+        happens still go out, issued counts them all.
+    """
+    window = DEFAULT_WARMUP_WINDOW
+    tolerance = DEFAULT_WARMUP_TOLERANCE
+    stable = False
+
+    def __init__(self, window=DEFAULT_WARMUP_WINDOW, tolerance=DEFAULT_WARMUP_TOLERANCE,
+                 max_runs=DEFAULT_WARMUP_MAX_RUNS):
+        super(SteadyStateSchedule, self).__init__(runs=max_runs)
+        self.window = window
+        self.tolerance = tolerance
+        self.stable = False
+        self.samples = collections.deque(maxlen=2 * window)
+
+    def next_run(self):
+        if self.stable:
+            return None
+        return super(SteadyStateSchedule, self).next_run()
+
+    def record(self, response):
+        with self.lock:
+            self.samples.append(METRICS['total_time'](response))
+            if len(self.samples) < 2 * self.window:
+                return
+            samples = list(self.samples)
+            previous = sum(samples[:self.window]) / float(self.window)
+            current = sum(samples[self.window:]) / float(self.window)
+            if abs(current - previous) <= self.tolerance * previous:
+                self.stable = True
+
+
+# Coefficients of the rational approximations in inverse_normal_cdf
+_NORMAL_A = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+             1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+_NORMAL_B = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+             6.680131188771972e+01, -1.328068155288572e+01)
+_NORMAL_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+             -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+_NORMAL_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+             3.754408661907416e+00)
+_NORMAL_TAIL = 0.02425  # Below this, and above 1 minus it, the tail approximation is used
+
+
+def _polynomial(coefficients, x):
+    """ Polynomial with the coefficients from the highest power down, at x """
+    total = 0.0
+    for coefficient in coefficients:
+        total = total * x + coefficient
+    return total
+
+
+def inverse_normal_cdf(p):
+    """ Standard normal quantile for probability p, without statistics.NormalDist
+        Acklam's rational approximation, relative error below 1.2e-9 """
+    if p <= 0 or p >= 1:
+        raise ValueError("Probability must be between 0 and 1: {0}".format(p))
+    if p < _NORMAL_TAIL or p > 1 - _NORMAL_TAIL:
+        q = math.sqrt(-2 * math.log(min(p, 1 - p)))
+        x = _polynomial(_NORMAL_C, q) / (_polynomial(_NORMAL_D, q) * q + 1)
+        return x if p < 0.5 else -x
+    q = p - 0.5
+    r = q * q
+    return q * _polynomial(_NORMAL_A, r) / (_polynomial(_NORMAL_B, r) * r + 1)
+
+
+def z_score(confidence):
+    """ Standard normal quantile for a two-sided confidence level, e.g. 1.96 for 0.95 """
+    if NormalDist is None:
+        return inverse_normal_cdf(0.5 + confidence / 2.0)
+    return NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+
+class PrecisionTarget(object):
+    """ Run until the confidence interval for an aggregate of a metric is narrow enough:
+        its half-width within tolerance of the estimate (relative), at the confidence level """
+    metric = u'total_time'
+    aggregate = u'mean'
+    tolerance = 0.02
+    confidence = 0.95
+    min_runs = DEFAULT_PRECISION_MIN_RUNS
+    max_runs = DEFAULT_PRECISION_MAX_RUNS
+
+    def __init__(self, metric=u'total_time', aggregate=u'mean', tolerance=0.02, confidence=0.95,
+                 min_runs=DEFAULT_PRECISION_MIN_RUNS, max_runs=DEFAULT_PRECISION_MAX_RUNS):
+        self.metric = metric
+        self.aggregate = aggregate
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+
+    def __str__(self):
+        return json.dumps(self, default=safe_to_json)
+
+
+class PrecisionSchedule(RunSchedule):
+    """ Schedule that stops once a PrecisionTarget is reached, or after its max_runs runs
+
+        Means use a normal-approximation interval over a running mean and variance,
+        medians the distribution-free interval from order statistics of the sorted values.
+    """
+    target = None
+    count = 0
+    reached = False
+    relative_width = None  # Latest half-width / estimate, once min_runs values are in
+
+    def __init__(self, target, rate=None, duration=None):
+        super(PrecisionSchedule, self).__init__(runs=target.max_runs, rate=rate, duration=duration)
+        self.target = target
+        self.metric = METRICS[target.metric]
+        self.z = z_score(target.confidence)
+        self.reached = False
+        self.relative_width = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.values = list()  # Sorted, for medians only
+
+    def next_run(self):
+        if self.reached:
+            return None
+        return super(PrecisionSchedule, self).next_run()
+
+    def record(self, response):
+        value = self.metric(response)
+        with self.lock:
+            self.count = self.count + 1
+            if PRECISION_AGGREGATES[self.target.aggregate] == u'median':
+                bisect.insort(self.values, value)
+            else:
+                delta = value - self.mean
+                self.mean = self.mean + delta / self.count
+                self.m2 = self.m2 + delta * (value - self.mean)
+            if self.count >= self.target.min_runs:
+                self.relative_width = self.interval_width()
+                if self.relative_width is not None:
+                    self.reached = self.relative_width <= self.target.tolerance
+
+    def interval_width(self):
+        """ Confidence interval half-width relative to the estimate, None if undefined """
+        if self.count < 2:
+            return None
+        if PRECISION_AGGREGATES[self.target.aggregate] == u'median':
+            values = self.values
+            estimate = median(values)
+            offset = self.z * math.sqrt(len(values)) / 2.0
+            low = max(0, int(math.floor(len(values) / 2.0 - offset)))
+            high = min(len(values) - 1, int(math.ceil(len(values) / 2.0 + offset)))
+            half_width = (values[high] - values[low]) / 2.0
+        else:
+            estimate = self.mean
+            half_width = self.z * math.sqrt(self.m2 / (self.count - 1) / self.count)
+        if estimate == 0:
+            return None
+        return half_width / abs(estimate)
+
+    def summary(self):
+        """ How the run went against the target, for the benchmark result """
+        return {u'metric': self.target.metric, u'aggregate': self.target.aggregate,
+                u'tolerance': self.target.tolerance, u'confidence': self.target.confidence,
+                u'relative_width': self.relative_width, u'runs': self.count,
+                u'reached': self.reached}
+
+
+def parse_precision(node):
+    """ Build a PrecisionTarget from its configuration node:
+        metric, aggregate (mean or median), tolerance, confidence, min_runs and max_runs """
+    node = lowercase_keys(flatten_dictionaries(node))
+    target = PrecisionTarget()
+    for key, value in node.items():
+        if key == u'metric':
+            target.metric = tests.coerce_to_string(value).lower().strip()
+            if not callable(METRICS.get(target.metric)):
+                raise ValueError(
+                    "Invalid precision metric: {0}".format(value))
+        elif key == u'aggregate':
+            target.aggregate = tests.coerce_to_string(value).lower().strip()
+            if target.aggregate not in PRECISION_AGGREGATES:
+                raise ValueError("Invalid precision aggregate, must be one of {0}: {1}".format(
+                    sorted(PRECISION_AGGREGATES.keys()), value))
+        elif key == u'tolerance':
+            target.tolerance = parse_tolerance(value)
+        elif key == u'confidence':
+            target.confidence = parse_tolerance(value)
+            if target.confidence >= 1:
+                raise ValueError(
+                    "Invalid precision confidence, must be < 1: {0}".format(value))
+        elif key == u'min_runs':
+            target.min_runs = int(value)
+        elif key == u'max_runs':
+            target.max_runs = int(value)
+        else:
+            raise ValueError("Invalid benchmark precision option: {0}".format(key))
+    if target.min_runs < 2 or target.max_runs < target.min_runs:
+        raise ValueError("Invalid precision run bounds, need 2 <= min_runs <= max_runs")
+    return target
+
+
+def parse_tolerance(value):
+    """ Relative tolerance from a fraction, or a string percentage like '5%' """
+    text = text_type(value).strip()
+    try:
+        if text.endswith(u'%'):
+            tolerance = float(text[:-1]) / 100.0
+        else:
+            tolerance = float(text)
+    except ValueError:
+        raise ValueError("Invalid tolerance: {0}".format(value))
+    if tolerance <= 0:
+        raise ValueError("Invalid tolerance, must be > 0: {0}".format(value))
+    return tolerance
+
+
+def parse_duration(value):
+    """ Seconds from a number, or a string with an optional s/m/h suffix, like '30m' """
+    text = text_type(value).strip().lower()
+    multiplier = 1
+    if text and text[-1] in DURATION_UNITS:
+        multiplier = DURATION_UNITS[text[-1]]
+        text = text[:-1]
+    try:
+        seconds = float(text) * multiplier
+    except ValueError:
+        raise ValueError("Invalid duration: {0}".format(value))
+    if seconds <= 0:
+        raise ValueError("Invalid duration, must be > 0: {0}".format(value))
+    return seconds
+
+
+class BenchmarkStage(object):
+    """ One phase of a benchmark's load profile:
+        a number of runs or a duration, sent by concurrency workers or at a fixed rate """
+    runs = None
+    duration = None  # Seconds
+    concurrency = None
+    rate = None
+    precision = None  # PrecisionTarget that can end the stage early
+
+    def __init__(self, runs=None, duration=None, concurrency=None, rate=None, precision=None):
+        self.runs = runs
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rate = rate
+        self.precision = precision
+
+    def worker_count(self):
+        """ Number of workers to run with: concurrency if set, otherwise 1,
+            or DEFAULT_RATE_CONCURRENCY so a rate can be kept up with """
+        if self.concurrency:
+            workers = self.concurrency
+        elif self.rate:
+            workers = DEFAULT_RATE_CONCURRENCY
+        else:
+            workers = 1
+        # No point in workers that have no runs to do
+        runs = self.runs
+        if runs is None and self.rate and self.duration:
+            runs = int(math.ceil(self.rate * self.duration))
+        if runs is not None:
+            workers = max(1, min(workers, runs))
+        return workers
+
+    def schedule(self):
+        """ A fresh RunSchedule for the stage """
+        if self.precision is not None:
+            return PrecisionSchedule(self.precision, rate=self.rate, duration=self.duration)
+        return RunSchedule(self.runs, rate=self.rate, duration=self.duration)
+
+    def __str__(self):
+        return json.dumps(self, default=safe_to_json)
+
+
+def parse_stage(node):
+    """ Build a BenchmarkStage from a {duration, concurrency and/or rate} configuration node """
+    node = lowercase_keys(flatten_dictionaries(node))
+    stage = BenchmarkStage()
+    for key, value in node.items():
+        if key == u'duration':
+            stage.duration = parse_duration(value)
+        elif key == u'concurrency':
+            stage.concurrency = int(value)
+            if stage.concurrency <= 0:
+                raise ValueError(
+                    "Invalid stage concurrency, must be > 0: {0}".format(value))
+        elif key == u'rate':
+            stage.rate = float(value)
+            if stage.rate <= 0:
+                raise ValueError("Invalid stage rate, must be > 0: {0}".format(value))
+        else:
+            raise ValueError("Invalid benchmark stage option: {0}".format(key))
+    if stage.duration is None:
+        raise ValueError("Benchmark stage needs a duration")
+    if stage.concurrency is None and stage.rate is None:
+        raise ValueError("Benchmark stage needs a concurrency or a rate")
+    return stage
+
+
+def throughput_summary(recorders):
+    """ Throughput in responses/second for each worker's recorder and for all combined
+        Workers start their measured runs together, so the slowest one sets the wall time """
+    workers = [recorder.throughput() for recorder in recorders]
+    wall_time = max([recorder.elapsed for recorder in recorders] + [0])
+    combined = None
+    if wall_time > 0:
+        combined = sum(recorder.requests for recorder in recorders) / wall_time
+    return {u'combined': combined, u'workers': workers}
+
+
+def write_binary_results(file_out, results, header=None):
+    """ Write raw metric values to a binary file, as fixed-width typed columns
+        results is metric name -> list of values, header a json-able dict stored alongside them
+        Read it back with read_binary_results, without parsing the values """
+    columns = list()
+    offset = 0
+    for name in sorted(results.keys()):
+        typecode = 'q' if name in INTEGER_METRICS else 'd'
+        missing = -1 if typecode == 'q' else float('nan')
+        convert = int if typecode == 'q' else float  # Samples hold every value as a float
+        values = array.array(typecode, [missing if x is None or x != x else convert(x)
+                                        for x in results[name]])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        columns.append((name, typecode, values))
+    described = list()
+    for name, typecode, values in columns:
+        described.append({u'name': name, u'type': typecode, u'count': len(values),
+                          u'offset': offset})
+        offset = offset + len(values) * values.itemsize
+
+    text = json.dumps({u'columns': described, u'header': header}, default=safe_to_json)
+    encoded = text.encode('utf-8')
+    used = BINARY_PREAMBLE.size + len(encoded)
+    encoded = encoded + b' ' * (-used % BINARY_ALIGNMENT)  # Pad so columns are aligned
+    file_out.write(BINARY_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION, len(encoded)))
+    file_out.write(encoded)
+    for name, typecode, values in columns:
+        file_out.write(values.tobytes() if hasattr(values, 'tobytes') else values.tostring())
+
+
+class BinaryResults(object):
+    """ Raw metric values of a binary output file, memory-mapped rather than read
+
+        columns maps each metric name to a sequence of its values: a memoryview straight onto
+        the mapped file, which numpy.frombuffer can also wrap without a copy.  Integer metrics
+        have -1 and float ones NaN where a response did not measure them.  header is the dict
+        written with the values: for benchmark output, the result without its raw arrays.
+        Columns are only valid until close(), use as a context manager.
+    """
+    header = None
+    columns = None
+
+    def __init__(self, path):
+        self.file_in = open(path, 'rb')
+        try:
+            self.mapped = mmap.mmap(self.file_in.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file_in.close()
+            raise
+        self.views = list()
+        try:
+            self._read()
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self):
+        if len(self.mapped) < BINARY_PREAMBLE.size:
+            raise ValueError("Not a binary benchmark file, too short")
+        magic, version, length = BINARY_PREAMBLE.unpack_from(self.mapped, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary benchmark file")
+        if version != BINARY_VERSION:
+            raise ValueError("Unsupported binary benchmark file version: {0}".format(version))
+        start = BINARY_PREAMBLE.size + length
+        described = json.loads(self.mapped[BINARY_PREAMBLE.size:start].decode('utf-8'))
+        self.header = described[u'header']
+        self.columns = collections.OrderedDict()
+        for column in described[u'columns']:
+            begin = start + column[u'offset']
+            end = begin + column[u'count'] * struct.calcsize('<' + column[u'type'])
+            if end > len(self.mapped):
+                raise ValueError("Binary benchmark file is truncated")
+            self.columns[column[u'name']] = self._column(begin, end, column[u'type'])
+
+    def _column(self, begin, end, typecode):
+        if sys.byteorder == 'little' and hasattr(memoryview, 'cast'):
+            view = memoryview(self.mapped)[begin:end]
+            self.views.append(view)
+            column = view.cast(typecode)
+            self.views.append(column)
+            return column
+        values = array.array(typecode)  # Big-endian host or Python 2: a copy instead
+        if hasattr(values, 'frombytes'):
+            values.frombytes(self.mapped[begin:end])
+        else:
+            values.fromstring(self.mapped[begin:end])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def close(self):
+        """ Unmap the file, the columns can no longer be used """
+        for view in reversed(self.views):
+            view.release()
+        self.views = list()
+        self.mapped.close()
+        self.file_in.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+
+def read_binary_results(path):
+    """ BinaryResults for a file written by write_binary_results """
+    return BinaryResults(path)
+
+
 class Benchmark(Test):
     """ Extends test with configuration for benchmarking
         warmup_runs and benchmark_runs behave like you'd expect
+        warmup_auto replaces warmup_runs with warming up until total_time is steady,
+            see SteadyStateSchedule
+        concurrency sets how many workers send requests at once, they split the runs between them
+        rate (requests/second) sends the benchmark runs on a fixed schedule instead,
+            latency is then also reported from each request's intended send time
+        duration (seconds) runs for that long instead of benchmark_runs times
+        precision (a PrecisionTarget) replaces benchmark_runs with running until an aggregate
+            is known precisely enough
+        stages replace all of those with a sequence of BenchmarkStages, for load profiles
+        timeseries_interval (seconds) also reports requests, failures and latency
+            for each interval of the run, see TimeSeries
 
         Metrics are a bit tricky:
             - Key is metric name from METRICS
@@ -126,7 +1249,17 @@ class Benchmark(Test):
                 - value of 'all' returns everything
     """
     warmup_runs = 10  # Times call is executed to warm up
+    warmup_auto = False  # Warm up until total_time is steady instead
+    warmup_window = DEFAULT_WARMUP_WINDOW
+    warmup_tolerance = DEFAULT_WARMUP_TOLERANCE
+    warmup_max_runs = DEFAULT_WARMUP_MAX_RUNS
     benchmark_runs = 100  # Times call is executed to generate benchmark results
+    concurrency = None  # Workers sending requests at the same time, see worker_count
+    rate = None  # Requests per second for an open loop benchmark, None to send back-to-back
+    duration = None  # Seconds to run for, overrides benchmark_runs
+    precision = None  # PrecisionTarget, overrides benchmark_runs
+    stages = None  # List of BenchmarkStage, run in order in place of the settings above
+    timeseries_interval = None  # Seconds per time series bucket, None for no time series
     output_format = u'csv'
     output_file = None
 
@@ -162,7 +1295,7 @@ class Benchmark(Test):
 
         if not aggregate:
             self.raw_metrics.add(clean_metric)
-        elif aggregate.lower().strip() in AGGREGATES:
+        elif aggregate_function(aggregate.lower().strip()) is not None:
             # Add aggregate to this metric
             clean_aggregate = aggregate.lower().strip()
             current_aggregates = self.aggregated_metrics.get(
@@ -175,6 +1308,36 @@ class Benchmark(Test):
 
         return self
 
+    def new_timeseries(self, origin):
+        """ A TimeSeries for a worker of a run that started at origin, None if not wanted """
+        if self.timeseries_interval is None:
+            return None
+        return TimeSeries(self.timeseries_interval, origin)
+
+    def warmup_schedule(self):
+        """ A fresh RunSchedule for the warmup runs """
+        if self.warmup_auto:
+            return SteadyStateSchedule(window=self.warmup_window,
+                                       tolerance=self.warmup_tolerance,
+                                       max_runs=self.warmup_max_runs)
+        return RunSchedule(self.warmup_runs)
+
+    def load_stages(self):
+        """ The stages to run: the configured stages, or one from the benchmark's own settings """
+        if self.stages:
+            return self.stages
+        runs = self.benchmark_runs
+        if self.precision is not None:
+            runs = self.precision.max_runs
+        elif self.duration is not None:
+            runs = None
+        return [BenchmarkStage(runs=runs, duration=self.duration, concurrency=self.concurrency,
+                               rate=self.rate, precision=self.precision)]
+
+    def worker_count(self):
+        """ Most workers any stage runs with """
+        return max(stage.worker_count() for stage in self.load_stages())
+
     def __init__(self):
         self.metrics = set()
         self.raw_metrics = set()
@@ -217,8 +1380,45 @@ def parse_benchmark(base_url, node):
     for key, value in node.items():
         if key == u'warmup_runs':
             benchmark.warmup_runs = int(value)
+        elif key == u'warmup':
+            if text_type(value).strip().lower() == u'auto':
+                benchmark.warmup_auto = True
+            else:
+                benchmark.warmup_runs = int(value)
+        elif key == u'warmup_window':
+            benchmark.warmup_window = int(value)
+            if benchmark.warmup_window <= 0:
+                raise ValueError(
+                    "Invalid warmup window, must be > 0: {0}".format(value))
+        elif key == u'warmup_tolerance':
+            benchmark.warmup_tolerance = parse_tolerance(value)
+        elif key == u'warmup_max_runs':
+            benchmark.warmup_max_runs = int(value)
+            if benchmark.warmup_max_runs <= 0:
+                raise ValueError(
+                    "Invalid warmup max runs, must be > 0: {0}".format(value))
         elif key == u'benchmark_runs':
             benchmark.benchmark_runs = int(value)
+        elif key == u'concurrency':
+            benchmark.concurrency = int(value)
+            if benchmark.concurrency <= 0:
+                raise ValueError(
+                    "Invalid benchmark concurrency, must be > 0: {0}".format(value))
+        elif key == u'rate':
+            benchmark.rate = float(value)
+            if benchmark.rate <= 0:
+                raise ValueError(
+                    "Invalid benchmark rate, must be > 0: {0}".format(value))
+        elif key == u'duration':
+            benchmark.duration = parse_duration(value)
+        elif key == u'precision':
+            benchmark.precision = parse_precision(value)
+        elif key == u'timeseries':
+            benchmark.timeseries_interval = parse_duration(value)
+        elif key == u'stages':
+            if not isinstance(value, list) or not value:
+                raise ValueError("Benchmark stages must be a non-empty list")
+            benchmark.stages = [parse_stage(stage) for stage in value]
         elif key == u'output_format':
             format = value.lower()
             if format in OUTPUT_FORMATS:
@@ -0,0 +1,515 @@
+"""
+Comparison of benchmark results: against a baseline run as a regression gate, and side by side
+- Baseline results are JSON benchmark output (write_benchmark_json): one result, or a list
+- Benchmarks are matched by name, then compared aggregate by aggregate, and on throughput
+- A change is a regression when it is worse than the threshold, relative to the baseline value,
+    and, where both runs kept the metric's raw values, a Mann-Whitney U test finds the two
+    runs' values significantly different: a noisy metric doesn't fail the gate on chance alone
+- Timings are worse when higher, speeds and throughput when lower, sizes and counts are
+    reported but never regress
+- The pyresttest-compare command reads CSV or JSON benchmark output files as streams, and
+    binary ones memory-mapped, raw values going straight into Histograms, so files larger
+    than memory can be compared
+"""
+import collections
+import csv
+import io
+import json
+import math
+import re
+import sys
+from optparse import OptionParser
+
+from .benchmarks import TIMING_METRICS, CORRECTED_TOTAL_TIME, z_score, parse_tolerance
+from .benchmarks import BINARY_MAGIC, read_binary_results
+from .histogram import Histogram
+
+DEFAULT_THRESHOLD = 0.1  # Relative change allowed before a worse value is a regression
+DEFAULT_ALPHA = 0.05  # Significance level for the Mann-Whitney U test
+
+LOWER_IS_BETTER = TIMING_METRICS | frozenset([CORRECTED_TOTAL_TIME])
+HIGHER_IS_BETTER = frozenset([u'speed_download', u'speed_upload', u'throughput'])
+
+# Status of a compared value
+REGRESSED = u'regressed'
+IMPROVED = u'improved'
+UNCHANGED = u'ok'
+
+Change = collections.namedtuple('Change', ['benchmark', 'metric', 'aggregate', 'baseline',
+                                           'current', 'change', 'p_value', 'status'])
+
+
+def load_results(path):
+    """ List of benchmark results (dicts) from a JSON benchmark output file """
+    with open(path, 'r') as file_in:
+        data = json.load(file_in)
+    if isinstance(data, dict):
+        return [data]
+    return list(data)
+
+
+def mann_whitney_u(first, second):
+    """ Two-sided p-value of a Mann-Whitney U test that two samples come from the
+        same distribution, by the normal approximation with a correction for ties
+        None if either sample is empty """
+    count_first = len(first)
+    count_second = len(second)
+    if not count_first or not count_second:
+        return None
+    values = sorted([(x, 0) for x in first] + [(x, 1) for x in second])
+    total = len(values)
+
+    # Rank, giving tied values the mean of their ranks
+    rank_sum = 0.0
+    ties = 0.0
+    start = 0
+    while start < total:
+        end = start
+        while end + 1 < total and values[end + 1][0] == values[start][0]:
+            end = end + 1
+        rank = (start + end) / 2.0 + 1
+        tied = end - start + 1
+        rank_sum = rank_sum + rank * sum(1 for x in values[start:end + 1] if x[1] == 0)
+        ties = ties + tied ** 3 - tied
+        start = end + 1
+
+    u_value = rank_sum - count_first * (count_first + 1) / 2.0
+    mean = count_first * count_second / 2.0
+    variance = count_first * count_second / 12.0 * (
+        (total + 1) - ties / float(total * (total - 1) if total > 1 else 1))
+    if variance <= 0:
+        return 1.0  # Every value the same
+    z_value = max(0.0, abs(u_value - mean) - 0.5) / math.sqrt(variance)
+    return math.erfc(z_value / math.sqrt(2))
+
+
+def _direction(metric):
+    """ 1 if higher values are worse, -1 if lower values are worse, 0 if neither """
+    if metric in LOWER_IS_BETTER:
+        return 1
+    if metric in HIGHER_IS_BETTER:
+        return -1
+    return 0
+
+
+def _values(result):
+    """ (metric, aggregate) -> value for a result's aggregates and combined throughput """
+    values = collections.OrderedDict()
+    for metric, aggregate, value in result.get(u'aggregates') or list():
+        values[(metric, aggregate)] = value
+    throughput = result.get(u'throughput')
+    if throughput:
+        values[(u'throughput', u'combined')] = throughput.get(u'combined')
+    return values
+
+
+def compare_result(baseline, current, threshold=DEFAULT_THRESHOLD, alpha=DEFAULT_ALPHA):
+    """ List of Changes between a baseline benchmark result and the current one
+        for every aggregate both have """
+    name = current.get(u'name')
+    baseline_values = _values(baseline)
+    baseline_raw = baseline.get(u'results') or dict()
+    current_raw = current.get(u'results') or dict()
+    changes = list()
+    for key, value in _values(current).items():
+        if key not in baseline_values:
+            continue
+        metric, aggregate = key
+        old = baseline_values[key]
+        change = None
+        if old is not None and value is not None and old != 0:
+            change = (value - old) / float(abs(old))
+
+        p_value = None
+        if metric in baseline_raw and metric in current_raw:
+            p_value = mann_whitney_u([x for x in baseline_raw[metric] if x is not None],
+                                     [x for x in current_raw[metric] if x is not None])
+
+        status = UNCHANGED
+        worse = change is not None and change * _direction(metric) > threshold
+        better = change is not None and change * _direction(metric) < -threshold
+        significant = p_value is None or p_value < alpha
+        if worse and significant:
+            status = REGRESSED
+        elif better and significant:
+            status = IMPROVED
+        changes.append(Change(name, metric, aggregate, old, value, change, p_value, status))
+    return changes
+
+
+def compare_results(baseline_results, current_results, threshold=DEFAULT_THRESHOLD,
+                    alpha=DEFAULT_ALPHA):
+    """ List of Changes for each current result with a baseline result of the same name """
+    baselines = dict((result.get(u'name'), result) for result in baseline_results)
+    changes = list()
+    for result in current_results:
+        baseline = baselines.get(result.get(u'name'))
+        if baseline is not None:
+            changes.extend(compare_result(baseline, result, threshold, alpha))
+    return changes
+
+
+def _format(value):
+    if value is None:
+        return u'-'
+    if isinstance(value, float):
+        return u'{0:.6g}'.format(value)
+    return u'{0}'.format(value)
+
+
+def write_changes(file_out, changes):
+    """ Write Changes as a text table """
+    header = (u'benchmark', u'metric', u'aggregate', u'baseline', u'current', u'change',
+              u'p-value', u'status')
+    rows = [header]
+    for change in changes:
+        percent = None
+        if change.change is not None:
+            percent = u'{0:+.1f}%'.format(change.change * 100)
+        rows.append((_format(change.benchmark), change.metric, change.aggregate,
+                     _format(change.baseline), _format(change.current), _format(percent),
+                     _format(change.p_value), change.status.upper()))
+    _write_table(file_out, rows)
+
+
+def _write_table(file_out, rows):
+    """ Write rows of text cells as columns padded to line up """
+    widths = [max(len(row[column]) for row in rows) for column in range(0, len(rows[0]))]
+    for row in rows:
+        file_out.write(u'  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+        file_out.write(u'\n')
+
+
+def regressions(changes):
+    """ The changes that are regressions """
+    return [change for change in changes if change.status == REGRESSED]
+
+
+class BenchmarkSummary(object):
+    """ What pyresttest-compare reads from a benchmark output file, for one benchmark """
+    name = None
+    aggregates = None  # (metric, aggregate) -> value, in file order
+    throughput = None  # Combined responses/second
+    raw = None  # Metric -> Histogram of its raw values
+
+    def __init__(self, name=None):
+        self.name = name
+        self.aggregates = collections.OrderedDict()
+        self.throughput = None
+        self.raw = collections.OrderedDict()
+
+    def raw_histogram(self, metric):
+        histogram = self.raw.get(metric)
+        if histogram is None:
+            histogram = self.raw[metric] = Histogram()
+        return histogram
+
+    def record(self, metric, value):
+        """ Add a raw value of a metric, skipping missing or negative ones """
+        if value is not None and value >= 0:
+            self.raw_histogram(metric).record(value)
+
+
+# Sections of write_benchmark_csv output: a row with the title and an empty cell starts each
+CSV_SECTIONS = frozenset([u'Results', u'Aggregates', u'Throughput', u'Precision', u'Resources',
+                          u'Resource Samples', u'Time Series', u'Status Codes', u'Errors',
+                          u'Client Overhead'])
+
+
+def _csv_number(text):
+    if text == u'':
+        return None
+    return float(text)
+
+
+def read_csv_summaries(file_in):
+    """ List of the one BenchmarkSummary in write_benchmark_csv output, read row by row
+        Only the whole run is read: the sections for each stage are skipped """
+    summary = BenchmarkSummary()
+    section = None
+    header = None
+    for row in csv.reader(file_in):
+        if not row:
+            continue
+        title = row[0]
+        if title == u'Stage':
+            break
+        if len(row) == 2 and row[1] == u'' and title in CSV_SECTIONS:
+            section = title
+            header = None
+        elif section is None:
+            if title == u'Benchmark':
+                summary.name = row[1]
+        elif section == u'Results':
+            if header is None:
+                header = row
+            else:
+                for metric, value in zip(header, row):
+                    summary.record(metric, _csv_number(value))
+        elif section == u'Aggregates':
+            summary.aggregates[(row[0], row[1])] = _csv_number(row[2])
+        elif section == u'Throughput' and title == u'combined':
+            summary.throughput = _csv_number(row[1])
+    return [summary]
+
+
+JSON_TOKEN = re.compile(r'''
+    (?P<punctuation>[{}\[\]:,])
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<literal>-?(?:[0-9.eE+\-]+|Infinity)|NaN|true|false|null)
+''', re.VERBOSE)
+JSON_LITERALS = {u'true': True, u'false': False, u'null': None, u'NaN': float('nan'),
+                 u'Infinity': float('inf'), u'-Infinity': float('-inf')}
+CHUNK_SIZE = 1 << 16
+
+
+def _json_tokens(file_in, chunk_size=CHUNK_SIZE):
+    """ Generator of the tokens of JSON text read from a file in chunks:
+        punctuation characters, or (value,) tuples for strings, numbers and literals """
+    buffer = u''
+    position = 0
+    done = False
+    while True:
+        while position < len(buffer) and buffer[position] in u' \t\r\n':
+            position = position + 1
+        match = JSON_TOKEN.match(buffer, position)
+        # A token running to the end of the buffer may continue in the next chunk
+        if not done and (match is None or match.end() == len(buffer)):
+            chunk = file_in.read(chunk_size)
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('utf-8')
+            done = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if match is None:
+            if position < len(buffer):
+                raise ValueError("Invalid JSON near: {0}".format(buffer[position:position + 20]))
+            return
+        position = match.end()
+        if match.group(u'punctuation'):
+            yield match.group(u'punctuation')
+        elif match.group(u'string'):
+            yield (json.loads(match.group(u'string')),)
+        else:
+            text = match.group(u'literal')
+            if text in JSON_LITERALS:
+                yield (JSON_LITERALS[text],)
+            elif u'.' in text or u'e' in text or u'E' in text:
+                yield (float(text),)
+            else:
+                yield (int(text),)
+
+
+def _json_value(tokens, token, path, stream):
+    """ Build the JSON value starting at token.  Arrays at paths where stream(path) returns a
+        function are passed to it item by item instead of being built """
+    if isinstance(token, tuple):
+        return token[0]
+    if token == u'{':
+        output = collections.OrderedDict()
+        token = next(tokens)
+        while token != u'}':
+            key = token[0]
+            if next(tokens) != u':':
+                raise ValueError("Invalid JSON: expected ':' after key {0}".format(key))
+            output[key] = _json_value(tokens, next(tokens), path + (key,), stream)
+            token = next(tokens)
+            if token == u',':
+                token = next(tokens)
+        return output
+    if token == u'[':
+        sink = stream(path)
+        output = list()
+        token = next(tokens)
+        index = 0
+        while token != u']':
+            value = _json_value(tokens, token, path + (index,), stream)
+            if sink is None:
+                output.append(value)
+            else:
+                sink(value)
+            index = index + 1
+            token = next(tokens)
+            if token == u',':
+                token = next(tokens)
+        return output if sink is None else None
+    raise ValueError("Invalid JSON: unexpected {0}".format(token))
+
+
+def read_json_summaries(file_in):
+    """ List of BenchmarkSummary for write_benchmark_json output (one result or a list),
+        parsed as a stream: raw values go into Histograms without being held in memory """
+    summaries = dict()  # Index of the result in the file (None if just one) -> summary
+
+    def stream(path):
+        # Raw values are the arrays at results/<metric> of a result
+        index = None
+        if path and isinstance(path[0], int):
+            index, path = path[0], path[1:]
+        if len(path) != 2 or path[0] != u'results':
+            return None
+        summary = summaries.setdefault(index, BenchmarkSummary())
+        metric = path[1]
+        return lambda value: summary.record(metric, value)
+
+    tokens = _json_tokens(file_in)
+    data = _json_value(tokens, next(tokens), (), stream)
+    results = data if isinstance(data, list) else [data]
+    output = list()
+    for index, result in enumerate(results):
+        summary = summaries.get(index if isinstance(data, list) else None, BenchmarkSummary())
+        summary.name = result.get(u'name')
+        for metric, aggregate, value in result.get(u'aggregates') or list():
+            summary.aggregates[(metric, aggregate)] = value
+        throughput = result.get(u'throughput')
+        if throughput:
+            summary.throughput = throughput.get(u'combined')
+        output.append(summary)
+    return output
+
+
+def read_binary_summaries(path):
+    """ List of the one BenchmarkSummary in a binary benchmark output file, read through
+        read_binary_results: columns are memory-mapped, nothing is parsed """
+    with read_binary_results(path) as results:
+        header = results.header or dict()
+        summary = BenchmarkSummary(header.get(u'name'))
+        for metric, aggregate, value in header.get(u'aggregates') or list():
+            summary.aggregates[(metric, aggregate)] = value
+        throughput = header.get(u'throughput')
+        if throughput:
+            summary.throughput = throughput.get(u'combined')
+        for metric, column in results.columns.items():
+            for value in column:
+                summary.record(metric, value)  # Missing values, -1 or NaN, are skipped
+    return [summary]
+
+
+def read_summaries(path):
+    """ List of BenchmarkSummary from a CSV, JSON or binary benchmark output file """
+    with io.open(path, 'rb') as file_in:
+        if file_in.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+            return read_binary_summaries(path)
+    with io.open(path, 'r', encoding='utf-8', newline='') as file_in:
+        start = file_in.read(1)
+        while start and start.isspace():
+            start = file_in.read(1)
+        file_in.seek(0)
+        if start in (u'{', u'['):
+            return read_json_summaries(file_in)
+        return read_csv_summaries(file_in)
+
+
+def mean_interval(histogram, z):
+    """ (mean, low, high): normal-approximation confidence interval of the mean """
+    mean = histogram.mean()
+    if histogram.count < 2:
+        return (mean, None, None)
+    half_width = z * math.sqrt(histogram.squares / (histogram.count - 1) / histogram.count)
+    return (mean, mean - half_width, mean + half_width)
+
+
+def percentile_interval(histogram, percent, z):
+    """ (percentile, low, high): distribution-free confidence interval of a percentile,
+        from the order statistics around its rank """
+    count = histogram.count
+    value = histogram.percentile(percent)
+    if count < 2:
+        return (value, None, None)
+    fraction = percent / 100.0
+    offset = z * math.sqrt(count * fraction * (1 - fraction))
+    low_rank = max(1, int(math.floor(count * fraction - offset)))
+    high_rank = min(count, int(math.ceil(count * fraction + offset)))
+    return (value, histogram.percentile(100.0 * low_rank / count),
+            histogram.percentile(100.0 * high_rank / count))
+
+
+RAW_STATISTICS = [(u'mean', None), (u'p50', 50), (u'p90', 90), (u'p99', 99)]
+
+
+def summary_rows(summary, z):
+    """ (metric, statistic) -> (value, low, high) for a BenchmarkSummary: its aggregates and
+        throughput, then from raw values the mean and percentiles with confidence intervals """
+    rows = collections.OrderedDict()
+    for key, value in summary.aggregates.items():
+        rows[key] = (value, None, None)
+    if summary.throughput is not None:
+        rows[(u'throughput', u'combined')] = (summary.throughput, None, None)
+    for metric, histogram in summary.raw.items():
+        rows[(metric, u'count')] = (histogram.count, None, None)
+        for name, percent in RAW_STATISTICS:
+            if percent is None:
+                rows[(metric, u'raw ' + name)] = mean_interval(histogram, z)
+            else:
+                rows[(metric, u'raw ' + name)] = percentile_interval(histogram, percent, z)
+    return rows
+
+
+def _match(files):
+    """ Lists of BenchmarkSummary, one per file, grouped into one list per benchmark
+        By name, unless every file has a single benchmark: then they are compared whatever
+        their names """
+    if all(len(summaries) == 1 for summaries in files):
+        return [[summaries[0] for summaries in files]]
+    names = list()
+    for summaries in files:
+        for summary in summaries:
+            if summary.name not in names:
+                names.append(summary.name)
+    groups = list()
+    for name in names:
+        group = [dict((x.name, x) for x in summaries).get(name) for summaries in files]
+        if group[0] is not None:
+            groups.append(group)
+    return groups
+
+
+def _format_interval(value, low, high):
+    text = _format(value)
+    if low is not None and high is not None:
+        text = u'{0} [{1}, {2}]'.format(text, _format(low), _format(high))
+    return text
+
+
+def write_side_by_side(file_out, files, names, confidence=0.95):
+    """ Write a table comparing the benchmarks in files (lists of BenchmarkSummary):
+        each value with its confidence interval where there is one, and its change
+        from the first file's value """
+    z = z_score(confidence)
+    header = [u'benchmark', u'metric', u'statistic', names[0]]
+    for name in names[1:]:
+        header.extend([name, u'change'])
+    rows = [header]
+    for group in _match(files):
+        tables = [summary_rows(x, z) if x is not None else dict() for x in group]
+        for key in tables[0].keys():
+            baseline = tables[0][key]
+            row = [_format(group[0].name), key[0], key[1], _format_interval(*baseline)]
+            for table in tables[1:]:
+                value = table.get(key, (None, None, None))
+                change = None
+                if value[0] is not None and baseline[0]:
+                    change = u'{0:+.1f}%'.format(
+                        (value[0] - baseline[0]) * 100.0 / abs(baseline[0]))
+                row.extend([_format_interval(*value), _format(change)])
+            rows.append(row)
+    _write_table(file_out, rows)
+
+
+def command_line_run(args_in):
+    """ pyresttest-compare: compare benchmark output files, the first being the baseline """
+    parser = OptionParser(
+        usage="usage: %prog baseline_results current_results [more_results ...] [options]")
+    parser.add_option(u'--confidence',
+                      help='Confidence level of the intervals shown, such as 95% (the default)',
+                      action='store', type='string', dest='confidence')
+    (args, files) = parser.parse_args(args_in)
+    if len(files) < 2:
+        parser.error("need at least two benchmark output files, CSV, JSON or binary")
+    confidence = 0.95
+    if args.confidence is not None:
+        confidence = parse_tolerance(args.confidence)
+        if confidence >= 1:
+            parser.error("confidence must be below 100%")
+    write_side_by_side(sys.stdout, [read_summaries(path) for path in files], files, confidence)
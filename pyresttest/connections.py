@@ -0,0 +1,182 @@
+"""
+Connection pooling shared across a test run
+- One pool manager per run, so TCP and TLS connections are reused between tests
+- Pools are keyed by scheme, host and port (urllib3 PoolManager semantics)
+- Every test still gets its own session, and therefore its own cookie jar
+- Connections time each phase of a request (DNS, connect, TLS, sent, first byte, last byte),
+    found on response.timings for the benchmark METRICS
+"""
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import super_len
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+from .metric import RequestTimings
+
+DEFAULT_POOL_SIZE = 10  # Connections kept alive per scheme/host/port
+DRAIN_CHUNK_SIZE = 64 * 1024  # Bytes read at a time when discarding a response body
+
+
+_local = threading.local()  # RequestTimings of the request being sent on this thread
+
+
+def current_timings():
+    """ RequestTimings for the request this thread is sending, None if not being timed """
+    return getattr(_local, 'timings', None)
+
+
+class _TimedConnection(object):
+    """ Mixin for urllib3 connections, marking phases on the current RequestTimings """
+
+    def _new_conn(self):
+        timings = current_timings()
+        if timings is None:
+            return super(_TimedConnection, self)._new_conn()
+        timings.connects = timings.connects + 1
+
+        # Resolve here so the lookup is timed separately from the connect
+        host = self._dns_host
+        try:
+            addresses = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            addresses = None  # urllib3 raises its usual error below
+        timings.mark('namelookup')
+        if not addresses:
+            return super(_TimedConnection, self)._new_conn()
+
+        # Try each address once in turn, as urllib3 would, without resolving again
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address[4][0]
+                try:
+                    conn = super(_TimedConnection, self)._new_conn()
+                    break
+                except NewConnectionError:
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+        timings.mark('connect')
+        return conn
+
+    def request(self, *args, **kwargs):
+        super(_TimedConnection, self).request(*args, **kwargs)
+        timings = current_timings()
+        if timings is not None:
+            timings.mark('pretransfer')
+
+    def getresponse(self, *args, **kwargs):
+        response = super(_TimedConnection, self).getresponse(*args, **kwargs)
+        timings = current_timings()
+        if timings is not None:
+            timings.mark('starttransfer')
+        return response
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+
+    def connect(self):
+        super(TimedHTTPSConnection, self).connect()
+        timings = current_timings()
+        if timings is not None:
+            timings.mark('appconnect')
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """ HTTPAdapter whose connections time each phase of a request
+        Responses get a timings attribute, a RequestTimings; when the body is not streamed
+        it has been read already, otherwise drain_response marks the last byte """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+    def send(self, request, stream=False, *args, **kwargs):
+        timings = RequestTimings()
+        if request.body is not None:
+            timings.uploaded = super_len(request.body)
+        _local.timings = timings
+        try:
+            response = super(TimingHTTPAdapter, self).send(request, stream, *args, **kwargs)
+        finally:
+            _local.timings = None
+        response.timings = timings
+        if not stream:
+            # Read the whole body, as requests would without the adapter
+            timings.downloaded = len(response.content)
+            timings.mark('end')
+        return response
+
+
+class ConnectionPool(object):
+    """ Shared keep-alive connection pool for a run
+
+        The pool itself is a single requests HTTPAdapter, which wraps a urllib3 PoolManager:
+        that keeps one connection pool per (scheme, host, port) and is thread-safe.
+        Sessions handed out by session() mount the shared adapter, so they share connections
+        but not cookies.  Do not close those sessions, that would close the shared pool,
+        call close() on the pool once the run is finished instead.
+    """
+    pool_size = DEFAULT_POOL_SIZE
+    adapter = None
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = int(pool_size)
+        if self.pool_size <= 0:
+            raise ValueError(
+                "Invalid connection pool size, must be > 0: {0}".format(pool_size))
+        self.adapter = TimingHTTPAdapter(pool_connections=self.pool_size,
+                                         pool_maxsize=self.pool_size)
+
+    def session(self):
+        """ Create a session with a fresh cookie jar that sends over the shared pool """
+        session = requests.Session()
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def close(self):
+        """ Close all pooled connections """
+        self.adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+
+def drain_response(response):
+    """ Read and discard a streamed response body, so the connection goes back to the pool
+        Returns the number of body bytes read, also counted on response.timings if timed
+        Responses marked drained were read and counted by their transport already """
+    timings = getattr(response, 'timings', None)
+    if getattr(response, 'drained', False):
+        return timings.downloaded if timings is not None else 0
+    size = 0
+    for chunk in response.iter_content(DRAIN_CHUNK_SIZE):
+        size = size + len(chunk)
+    response.close()
+    if timings is not None:
+        timings.downloaded = size
+        if timings.end is None:
+            timings.mark('end')
+    return size
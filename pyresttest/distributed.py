@@ -0,0 +1,290 @@
+"""
+Distributed benchmarks, for more load than one process can generate
+- Worker processes (pyresttest --worker) listen on a socket, on this host or others
+- The coordinator gives each worker a parsed Benchmark with its share of the load
+- Workers stream their measurements back while they run, as BenchmarkRecorders, which merge
+- The coordinator merges them and analyzes the whole like a local run, so aggregates,
+    throughput and the CSV/JSON writers work unchanged
+
+Messages are pickled over multiprocessing connections, authenticated with a shared key.
+Workers always require one, anyone who can connect can run code: without a key given,
+a worker generates one and prints it, to pass on to the coordinator.
+"""
+import binascii
+import copy
+import logging
+import os
+import sys
+import threading
+import traceback
+from multiprocessing.connection import Listener, Client, wait
+
+from . import resttest
+from . import asyncio_engine
+from .benchmarks import BenchmarkStage
+from .binding import Context
+
+LOGGER = logging.getLogger('pyresttest.distributed')
+
+DEFAULT_WORKER_HOST = '127.0.0.1'
+DEFAULT_WORKER_PORT = 7357
+AUTHKEY_VARIABLE = 'PYRESTTEST_AUTHKEY'  # Environment variable for the shared key
+STREAM_INTERVAL = 1.0  # Seconds between batches of measurements sent by a worker
+AUTHKEY_BYTES = 16  # Random bytes in a generated key
+
+
+def parse_address(text, default_host=DEFAULT_WORKER_HOST):
+    """ (host, port) from 'host:port', 'host' or ':port' """
+    host, sep, port = text.strip().rpartition(':')
+    if not sep:
+        host, port = port, ''
+    try:
+        port = int(port) if port else DEFAULT_WORKER_PORT
+    except ValueError:
+        raise ValueError("Invalid worker address: {0}".format(text))
+    return (host or default_host, port)
+
+
+def parse_authkey(key=None):
+    """ Shared key as bytes, from the argument or else the environment, None if neither """
+    if key is None:
+        key = os.environ.get(AUTHKEY_VARIABLE)
+    if not key:
+        return None
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return key
+
+
+def generate_authkey():
+    """ New random shared key, as hex so it can be passed on with --authkey """
+    return binascii.hexlify(os.urandom(AUTHKEY_BYTES))
+
+
+def _split(total, count):
+    """ Divide a total into count integer parts, as evenly as possible """
+    share, extra = divmod(total, count)
+    return [share + 1 if i < extra else share for i in range(0, count)]
+
+
+def benchmark_share(benchmark, index, count):
+    """ Copy of a benchmark with the index-th of count equal parts of its load,
+        or None if that part has no runs
+
+        Runs, rates, concurrency and precision max_runs are divided between workers,
+        every worker gets at least one thread.  Durations and warmups are not divided.
+    """
+    share = benchmark.ninja_copy()
+    share.benchmark_runs = _split(benchmark.benchmark_runs, count)[index]
+    if benchmark.concurrency:
+        share.concurrency = max(1, _split(benchmark.concurrency, count)[index])
+    if benchmark.rate:
+        share.rate = benchmark.rate / float(count)
+    if benchmark.precision is not None:
+        share.precision = copy.copy(benchmark.precision)
+        share.precision.max_runs = max(share.precision.min_runs,
+                                       _split(benchmark.precision.max_runs, count)[index])
+    if benchmark.stages:
+        share.stages = list()
+        for stage in benchmark.stages:
+            concurrency = stage.concurrency
+            if concurrency:
+                concurrency = max(1, _split(concurrency, count)[index])
+            rate = stage.rate
+            if rate:
+                rate = rate / float(count)
+            share.stages.append(BenchmarkStage(duration=stage.duration,
+                                               concurrency=concurrency, rate=rate))
+    elif benchmark.duration is None and benchmark.precision is None \
+            and share.benchmark_runs <= 0:
+        return None
+    return share
+
+
+def portable_config(test_config):
+    """ Copy of a TestConfig that can be sent to a worker
+        Generators can't be pickled, and workers do not distribute further """
+    config = copy.copy(test_config)
+    config.generators = None
+    config.workers = None
+    config.authkey = None
+    return config
+
+
+def merge_precision(summaries):
+    """ Combine precision summaries from workers: reached only if every worker reached it """
+    summaries = [x for x in summaries if x]
+    if not summaries:
+        return None
+    output = dict(summaries[0])
+    widths = [x[u'relative_width'] for x in summaries if x[u'relative_width'] is not None]
+    output[u'relative_width'] = max(widths) if widths else None
+    output[u'runs'] = sum(x[u'runs'] for x in summaries)
+    output[u'reached'] = all(x[u'reached'] for x in summaries)
+    return output
+
+
+def serve_worker(address=(DEFAULT_WORKER_HOST, DEFAULT_WORKER_PORT), authkey=None,
+                 connections=None, ready=None):
+    """ Run as a worker: accept coordinator connections and run the benchmarks they send
+
+        Serves connections one at a time, forever, or for the given number of connections.
+        ready, if given, is called with the (host, port) listened on once accepting.
+        Without an authkey, one is generated and printed for the coordinator's --authkey.
+    """
+    if authkey is None:
+        authkey = generate_authkey()
+        sys.stdout.write("Worker authentication key, pass it to the coordinator with "
+                         "--authkey or {0}: {1}\n".format(AUTHKEY_VARIABLE,
+                                                          authkey.decode('ascii')))
+        sys.stdout.flush()
+    listener = Listener(address, authkey=authkey)
+    LOGGER.info("Worker listening on {0}:{1}".format(*listener.address))
+    if ready is not None:
+        ready(listener.address)
+    served = 0
+    try:
+        while connections is None or served < connections:
+            try:
+                conn = listener.accept()
+            except Exception as error:  # Failed authentication, mostly
+                LOGGER.error("Worker rejected connection: {0}".format(error))
+                continue
+            served = served + 1
+            try:
+                _serve_connection(conn)
+            except (EOFError, OSError):
+                LOGGER.warning("Coordinator disconnected")
+            finally:
+                conn.close()
+    finally:
+        listener.close()
+
+
+def _serve_connection(conn):
+    """ Run each benchmark the coordinator sends, until it closes the connection """
+    while True:
+        message = conn.recv()
+        if message[0] == u'close':
+            return
+        elif message[0] == u'benchmark':
+            _run_job(conn, *message[1:])
+        else:
+            raise ValueError("Unknown coordinator message: {0}".format(message[0]))
+
+
+def _run_job(conn, benchmark, test_config, variables):
+    """ Run a benchmark share, sending its measurements as they come in, then a summary """
+    context = Context()
+    if variables:
+        context.bind_variables(variables)
+
+    recorders = list()
+    lock = threading.Lock()
+    outcome = dict()
+
+    def monitor(recorder):
+        with lock:
+            recorders.append(recorder)
+
+    def run():
+        try:
+            if test_config.engine == u'asyncio':
+                with asyncio_engine.AsyncioEngine(
+                        pool_size=max(resttest.DEFAULT_POOL_SIZE,
+                                      benchmark.worker_count())) as engine:
+                    outcome['result'] = engine.run_benchmark(
+                        benchmark, test_config, context, monitor=monitor)
+            else:
+                outcome['result'] = resttest.run_benchmark(
+                    benchmark, test_config, context, monitor=monitor)
+        except Exception:
+            outcome['error'] = traceback.format_exc()
+
+    LOGGER.info("Worker running benchmark: " + benchmark.name)
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    while True:
+        thread.join(STREAM_INTERVAL)
+        alive = thread.is_alive()  # Checked first, so the last take follows the run's end
+        with lock:
+            current = list(recorders)
+        conn.send((u'samples', [(key, recorder.take()) for key, recorder in enumerate(current)]))
+        if not alive:
+            break
+
+    if 'error' in outcome:
+        conn.send((u'error', outcome['error']))
+    else:
+        result = outcome['result']
+        conn.send((u'done', {u'warmup_runs': result.warmup_runs,
+                             u'precision': result.precision,
+                             u'resources': result.resources}))
+
+
+def run_distributed_benchmark(benchmark, test_config, workers, authkey=None, context=None):
+    """ Run a benchmark spread across worker processes at the given (host, port) addresses,
+        returning the analyzed BenchmarkResult for the whole run """
+    if benchmark.generator_binds:
+        raise ValueError("Benchmark {0} uses generators, which can't be sent to "
+                         "workers".format(benchmark.name))
+    variables = dict(context.get_values()) if context is not None else dict()
+    config = portable_config(test_config)
+
+    connections = list()
+    recorders = dict()  # (connection index, worker recorder index) -> merged BenchmarkRecorder
+    warmup_runs = 0
+    precisions = list()
+    generators = list()  # Resource use of each worker
+    try:
+        for index, address in enumerate(workers):
+            share = benchmark_share(benchmark, index, len(workers))
+            if share is None:
+                continue
+            conn = Client(address, authkey=authkey)
+            connections.append(conn)
+            conn.send((u'benchmark', share, config, variables))
+        LOGGER.info("Benchmark {0} sent to {1} workers".format(benchmark.name, len(connections)))
+
+        pending = list(connections)
+        while pending:
+            for conn in wait(pending):
+                kind, payload = conn.recv()
+                if kind == u'samples':
+                    for key, recorder in payload:
+                        key = (connections.index(conn), key)
+                        if key in recorders:
+                            recorders[key].merge(recorder)
+                        else:
+                            recorders[key] = recorder
+                elif kind == u'done':
+                    pending.remove(conn)
+                    warmup_runs = warmup_runs + (payload[u'warmup_runs'] or 0)
+                    precisions.append(payload[u'precision'])
+                    generators.extend(payload.get(u'resources') or list())
+                else:
+                    raise Exception("Benchmark {0} failed on a worker: {1}".format(
+                        benchmark.name, payload))
+    finally:
+        for conn in connections:
+            try:
+                conn.send((u'close',))
+            except Exception:
+                pass  # Worker already gone
+            conn.close()
+
+    output = resttest.BenchmarkResult()
+    output.name = benchmark.name
+    output.group = benchmark.group
+    stages = benchmark.load_stages()
+    stage_recorders = [[recorder for key, recorder in sorted(recorders.items())
+                        if recorder.stage == index] for index in range(0, len(stages))]
+    if benchmark.stages:
+        resttest.collect_benchmark_results(output, stage_recorders, benchmark.stages)
+    else:
+        resttest.collect_benchmark_results(output, stage_recorders[0])
+    output.warmup_runs = warmup_runs
+    output.precision = merge_precision(precisions)
+    output.resources = generators
+    return resttest.analyze_benchmark_results(output, benchmark)
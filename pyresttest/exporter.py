@@ -0,0 +1,243 @@
+"""
+Live export of benchmark metrics in the Prometheus text exposition format
+- A MetricsExporter keeps running totals for each benchmark, fed sample by sample as a
+    BenchmarkRecorder sink, so in-progress runs can be scraped, not only finished ones
+- Served over HTTP at /metrics for Prometheus to scrape, and/or written to a file on an
+    interval for the node_exporter textfile collector
+- Exported: requests by status code, failures by error class, a total_time histogram,
+    the stage running and whether the benchmark is still running
+"""
+import logging
+import math
+import os
+import threading
+
+from .six.moves import BaseHTTPServer, socketserver
+from .benchmarks import add_sink
+
+LOGGER = logging.getLogger('pyresttest.exporter')
+
+# Bucket upper bounds in seconds, the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0,
+                   7.5, 10.0)
+TEXTFILE_INTERVAL = 5.0  # Seconds between rewrites of the textfile
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    """ Label value escaped for the exposition format """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    return '{' + ','.join('{0}="{1}"'.format(name, escape_label(value))
+                          for name, value in labels) + '}'
+
+
+class BenchmarkMetrics(object):
+    """ Running totals for one benchmark, a BenchmarkRecorder sink
+
+        Pass monitor() to run_benchmark, so that workers call sample() and failure() as
+        they record; the exporter renders the totals.
+    """
+    name = None
+    group = None
+    requests = None  # Status code -> responses
+    failures = None  # Error class -> failed requests
+    buckets = None  # Responses with total_time at most each of the exporter's bounds
+    latency_sum = 0.0
+    latency_count = 0
+    stage = 0
+    running = True
+
+    def __init__(self, name, group, bounds, lock):
+        self.name = name
+        self.group = group
+        self.bounds = bounds
+        self.lock = lock  # The exporter's, so renders see consistent totals
+        self.requests = dict()
+        self.failures = dict()
+        self.buckets = [0] * len(bounds)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.stage = 0
+        self.running = True
+
+    def sample(self, stage, metrics, status):
+        total_time = metrics.get(u'total_time')
+        with self.lock:
+            self.stage = stage
+            self.requests[status] = self.requests.get(status, 0) + 1
+            if total_time is not None:
+                for index, bound in enumerate(self.bounds):
+                    if total_time <= bound:
+                        self.buckets[index] = self.buckets[index] + 1
+                self.latency_sum = self.latency_sum + total_time
+                self.latency_count = self.latency_count + 1
+
+    def failure(self, stage, error, elapsed):
+        with self.lock:
+            self.stage = stage
+            self.failures[error] = self.failures.get(error, 0) + 1
+
+    def monitor(self, recorder):
+        """ Benchmark monitor: each worker's recorder passes its samples here as well """
+        add_sink(recorder, self)
+
+    def finish(self):
+        """ Mark the benchmark done, its totals stay exported """
+        with self.lock:
+            self.running = False
+
+
+class MetricsExporter(object):
+    """ Exports the running totals of benchmarks, see module docs
+
+        benchmark() starts the totals for a benchmark and returns its sink.  serve() and
+        start_textfile() publish them until stop().
+    """
+    bounds = LATENCY_BUCKETS
+    benchmarks = None
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(bounds))
+        self.benchmarks = list()
+        self.lock = threading.Lock()
+        self.server = None
+        self.stopping = threading.Event()
+        self.threads = list()
+        self.textfile = None
+
+    def benchmark(self, name, group=None):
+        """ New BenchmarkMetrics for a benchmark run, replacing any earlier run of that name """
+        metrics = BenchmarkMetrics(name, group, self.bounds, self.lock)
+        with self.lock:
+            self.benchmarks = [x for x in self.benchmarks
+                               if (x.name, x.group) != (name, group)] + [metrics]
+        return metrics
+
+    def render(self):
+        """ All the totals, as Prometheus exposition text """
+        lines = list()
+
+        def family(name, kind, help_text):
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+
+        def sample(name, labels, value):
+            lines.append('{0}{1} {2}'.format(name, format_labels(labels), format_value(value)))
+
+        with self.lock:
+            benchmarks = [(x, (('benchmark', x.name), ('group', x.group or '')))
+                          for x in self.benchmarks]
+            family('pyresttest_benchmark_running', 'gauge',
+                   'Whether the benchmark is still running')
+            for metrics, labels in benchmarks:
+                sample('pyresttest_benchmark_running', labels, 1 if metrics.running else 0)
+            family('pyresttest_benchmark_stage', 'gauge',
+                   'Index of the benchmark stage running, or last run')
+            for metrics, labels in benchmarks:
+                sample('pyresttest_benchmark_stage', labels, metrics.stage)
+            family('pyresttest_benchmark_requests_total', 'counter',
+                   'Responses measured, by HTTP status code')
+            for metrics, labels in benchmarks:
+                for status in sorted(metrics.requests.keys(), key=str):
+                    sample('pyresttest_benchmark_requests_total',
+                           labels + (('status', status),), metrics.requests[status])
+            family('pyresttest_benchmark_failures_total', 'counter',
+                   'Requests that failed without a response, by error class')
+            for metrics, labels in benchmarks:
+                for error in sorted(metrics.failures.keys(), key=str):
+                    sample('pyresttest_benchmark_failures_total',
+                           labels + (('error', error),), metrics.failures[error])
+            family('pyresttest_benchmark_latency_seconds', 'histogram',
+                   'Total time of each response')
+            for metrics, labels in benchmarks:
+                for bound, count in zip(self.bounds, metrics.buckets):
+                    sample('pyresttest_benchmark_latency_seconds_bucket',
+                           labels + (('le', format_value(bound)),), count)
+                sample('pyresttest_benchmark_latency_seconds_bucket',
+                       labels + (('le', '+Inf'),), metrics.latency_count)
+                sample('pyresttest_benchmark_latency_seconds_sum', labels, metrics.latency_sum)
+                sample('pyresttest_benchmark_latency_seconds_count', labels,
+                       metrics.latency_count)
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, address=''):
+        """ Serve the totals at /metrics on a background thread, returns the bound address """
+        exporter = self
+
+        class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes every few seconds would drown out the test output
+
+        class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = MetricsServer((address, port), MetricsHandler)
+        self._start(self.server.serve_forever)
+        LOGGER.info("Serving benchmark metrics on port {0}".format(
+            self.server.server_address[1]))
+        return self.server.server_address
+
+    def write_textfile(self, path):
+        """ Write the totals to path, replacing it whole so readers never see half a file """
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as file_out:
+            file_out.write(self.render())
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, path)
+        else:  # Python 2, overwrites on POSIX
+            os.rename(temp_path, path)
+
+    def start_textfile(self, path, interval=TEXTFILE_INTERVAL):
+        """ Rewrite the textfile at path every interval seconds on a background thread """
+        self.textfile = path
+
+        def run():
+            while not self.stopping.wait(interval):
+                self._write_quietly(path)
+        self._write_quietly(path)
+        self._start(run)
+
+    def _write_quietly(self, path):
+        try:
+            self.write_textfile(path)
+        except (IOError, OSError) as error:
+            LOGGER.warning("Could not write benchmark metrics to {0}: {1}".format(path, error))
+
+    def _start(self, target):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        """ Stop serving, writing the textfile a last time with the final totals """
+        self.stopping.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.threads:
+            thread.join()
+        self.threads = list()
+        if self.textfile is not None:
+            self._write_quietly(self.textfile)
@@ -15,6 +15,7 @@ from . import binding
 from .binding import Context
 from . import resttest
 from . import validators
+from .benchmarks import Benchmark
 
 # Python 2/3 compat shims
 from . import six
@@ -307,7 +308,7 @@ class RestTestCase(unittest.TestCase):
 
     def test_benchmark_get(self):
         """ Benchmark basic local get test """
-        benchmark_config = resttest.Benchmark()
+        benchmark_config = Benchmark()
         benchmark_config.url = self.prefix + '/api/person/'
         benchmark_config.add_metric(
             'total_time').add_metric('total_time', 'median')
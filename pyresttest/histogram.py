@@ -0,0 +1,111 @@
+"""
+Compact histograms for benchmark timings, in the style of HdrHistogram
+- Values are counted in log-scaled buckets split into linear sub-buckets,
+    so every value is kept to a fixed relative precision over any range
+- Counts live in one array of integers: recording is O(1), and memory depends on the range
+    of values seen, not on how many were recorded
+- Histograms merge by adding counts, and answer percentiles by walking the buckets
+- Count, sum, min, max, mean and standard deviation are kept exactly, by an Accumulator
+"""
+import math
+from array import array
+
+from .accumulators import Accumulator
+
+DEFAULT_UNIT = 1e-6  # Smallest distinguishable value, timings are in seconds: 1 microsecond
+DEFAULT_SIGNIFICANT_FIGURES = 3  # Decimal digits of precision kept for every value
+
+
+class Histogram(Accumulator):
+    """ Histogram of non-negative values, each kept to significant_figures digits of precision
+
+        Values are rounded to integer multiples of unit.  Those below 2 * 10^significant_figures
+        units are counted exactly; above that, each power of two range is split into the same
+        number of equal sub-buckets, so the width of a bucket is proportional to its values.
+    """
+    unit = DEFAULT_UNIT
+    significant_figures = DEFAULT_SIGNIFICANT_FIGURES
+
+    def __init__(self, unit=DEFAULT_UNIT, significant_figures=DEFAULT_SIGNIFICANT_FIGURES):
+        if unit <= 0:
+            raise ValueError("Histogram unit must be > 0: {0}".format(unit))
+        if significant_figures < 1 or significant_figures > 5:
+            raise ValueError("Histogram significant figures must be 1 to 5: {0}".format(
+                significant_figures))
+        super(Histogram, self).__init__()
+        self.unit = unit
+        self.significant_figures = significant_figures
+        # Sub-buckets per bucket: a power of two, enough to tell apart 10^figures values
+        self.sub_bucket_bits = int(math.ceil(math.log(2 * 10 ** significant_figures, 2)))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts = array('L')
+
+    def _index(self, scaled):
+        """ Index into counts for a value in units """
+        if scaled < self.sub_bucket_count:
+            return scaled
+        bucket = scaled.bit_length() - self.sub_bucket_bits
+        return bucket * self.half_count + (scaled >> bucket)
+
+    def _highest_equivalent(self, index):
+        """ Largest value, in units, counted at an index """
+        if index < self.sub_bucket_count:
+            return index
+        bucket = index // self.half_count - 1
+        sub_bucket = index - bucket * self.half_count
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def _middle(self, index):
+        """ Value, in units, in the middle of the range counted at an index """
+        if index < self.sub_bucket_count:
+            return index
+        bucket = index // self.half_count - 1
+        sub_bucket = index - bucket * self.half_count
+        return (sub_bucket << bucket) + (1 << bucket) / 2.0 - 0.5
+
+    def record(self, value, count=1):
+        """ Count a value, count times """
+        if value < 0:
+            raise ValueError("Histograms only record values >= 0: {0}".format(value))
+        index = self._index(int(value / self.unit + 0.5))
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] = self.counts[index] + count
+        super(Histogram, self).record(value, count)
+
+    def merge(self, other):
+        """ Add another histogram's counts to this one, returns self """
+        if (other.unit, other.significant_figures) != (self.unit, self.significant_figures):
+            raise ValueError("Can't merge histograms with different units or precision")
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, value in enumerate(other.counts):
+            if value:
+                self.counts[index] = self.counts[index] + value
+        return super(Histogram, self).merge(other)
+
+    def buckets(self):
+        """ Generator of (value, count) for each non-empty bucket, in increasing order
+            value is the middle of the bucket's range """
+        for index, value in enumerate(self.counts):
+            if value:
+                yield (self._middle(index) * self.unit, value)
+
+    def percentile(self, percent):
+        """ Value at or below which percent (0 to 100) of the recorded values fall,
+            to the histogram's precision, None if empty """
+        if not self.count:
+            return None
+        if percent <= 0:
+            return self.min
+        if percent >= 100:
+            return self.max
+        wanted = max(1, int(math.ceil(percent / 100.0 * self.count)))
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen = seen + value
+            if seen >= wanted:
+                found = self._highest_equivalent(index) * self.unit
+                return min(max(found, self.min), self.max)
+        return self.max
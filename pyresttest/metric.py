@@ -1,87 +1,190 @@
 """ Metrics methods that perform calculations based on the request provided."""
+import timeit
+
 import requests
+from requests.utils import super_len
+
+
+class RequestTimings(object):
+    """ When each phase of one request completed, as timeit.default_timer() values,
+        and how much it transferred
+        Filled in by the transport (see connections.TimingHTTPAdapter), found on response.timings
+        Phases that did not happen are None, name lookup and connect for a reused connection
+        or the TLS handshake for plain HTTP
+    """
+    start = None  # Request handed to the transport
+    namelookup = None  # Host name resolved
+    connect = None  # TCP connection established
+    appconnect = None  # TLS handshake done
+    pretransfer = None  # Request sent
+    starttransfer = None  # First byte of the response (status line and headers) received
+    end = None  # Last byte of the response body received
+
+    uploaded = 0  # Request body bytes sent
+    downloaded = 0  # Response body bytes received, counted as the body is read
+    connects = 0  # New connections opened for the request
+
+    def __init__(self):
+        self.start = timeit.default_timer()
+
+    def mark(self, phase):
+        """ Record that a phase completed now """
+        setattr(self, phase, timeit.default_timer())
+
+    def since_start(self, phase):
+        """ Seconds from the start until a phase completed, 0 if it did not happen """
+        value = getattr(self, phase)
+        if value is None:
+            return 0.0
+        return value - self.start
+
+    def upload_duration(self):
+        """ Seconds spent sending the request, from the connection being ready """
+        ready = max(x for x in (self.start, self.connect, self.appconnect) if x is not None)
+        return self.pretransfer - ready
+
+    def download_duration(self):
+        """ Seconds spent receiving the response body, after the headers """
+        return self.end - self.starttransfer
+
+
+def _rate(size, duration):
+    """ Bytes per second, 0 if nothing was transferred or it took no measurable time """
+    if not size or not duration or duration <= 0:
+        return 0.0
+    return size / duration
+
+
+def _timings(response):
+    """ The response's RequestTimings, None if the transport did not record any """
+    return getattr(response, 'timings', None)
+
+
+def _first_start(response):
+    """ When the first request of a redirect chain started """
+    for earlier in response.history:
+        timings = _timings(earlier)
+        if timings is not None:
+            return timings.start
+    return _timings(response).start
 
 
 class Metrics(requests.Response):
     """ Class containing all calculation methods. """
 
     @staticmethod
-    def namelookup_time():
+    def namelookup_time(response):
         """ Timing info, precisely in order from start to finish
         The time it took from the start until the name resolving was completed.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.since_start('namelookup')
 
     @staticmethod
-    def connect_time():
+    def connect_time(response):
         """ The time it took from the start until the connect
          to the remote host (or proxy) was completed.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.since_start('connect')
 
     @staticmethod
-    def appconnect_time():
+    def appconnect_time(response):
         """ The time it took from the start until the SSL
         connect/handshake with the remote host was completed.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.since_start('appconnect')
 
     @staticmethod
-    def pretransfer_time():
-        """ The time it took from the start until the file transfer is just about to begin.
+    def pretransfer_time(response):
+        """ The time it took from the start until the request was sent.
         This includes all pre-transfer commands and negotiations that are
         specific to the particular protocol(s) involved.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.since_start('pretransfer')
 
     @staticmethod
-    def starttransfer_time():
+    def starttransfer_time(response):
         """ The time it took from the start until the first
         byte is received by request.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.since_start('starttransfer')
 
     @staticmethod
-    def redirect_time():
+    def redirect_time(response):
         """ The time it took for all redirection steps include
          name lookup, connect, pre-transfer and transfer
          before final transaction was started.
          So, this is zero if no redirection took place.
         """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.start - _first_start(response)
 
     @staticmethod
     def total_time(response):
-        """ Total time of the previous request. """
-        total = response.elapsed.total_seconds()
-        return total
+        """ Total time of the previous request, redirects included, until the last byte.
+        Time until the response headers if the transport did not time the body. """
+        timings = _timings(response)
+        if timings is None or timings.end is None:
+            return response.elapsed.total_seconds()
+        return timings.end - _first_start(response)
 
     @staticmethod
-    def size_download():
-        """ Transfer sizes and speeds. """
-        pass
+    def size_download(response):
+        """ Transfer sizes and speeds.
+        Bytes of response body received, counted without keeping the body. """
+        timings = _timings(response)
+        if timings is None:
+            return len(response.content)
+        return timings.downloaded
 
     @staticmethod
     def size_upload(response):
-        """ Total size of attachments uploaded. """
-        size = response.headers['content-length']
-        return size
+        """ Bytes of request body sent, None if the request had no body. """
+        request = getattr(response, 'request', None)
+        if request is None or request.body is None:
+            return None
+        timings = _timings(response)
+        if timings is None:
+            return super_len(request.body)
+        return timings.uploaded
 
     @staticmethod
     def request_size(response):
-        """ Total size of request. """
-        size = len(response.content)
-        return size
+        """ Bytes of response body received, the same as size_download.
+        Kept under this name, which configs already use, despite what it suggests. """
+        return Metrics.size_download(response)
 
     @staticmethod
-    def speed_download():
-        """ Total time of speed to download content. """
-        pass
+    def speed_download(response):
+        """ Bytes per second while receiving the response body. """
+        timings = _timings(response)
+        if timings is None or timings.end is None or timings.starttransfer is None:
+            return None
+        return _rate(timings.downloaded, timings.download_duration())
 
     @staticmethod
-    def speed_upload():
-        """ Total time of speed of uploading content. """
-        pass
+    def speed_upload(response):
+        """ Bytes per second while sending the request body. """
+        timings = _timings(response)
+        if timings is None or timings.pretransfer is None:
+            return None
+        return _rate(timings.uploaded, timings.upload_duration())
 
     @staticmethod
     def redirect_count(response):
@@ -90,6 +193,9 @@ class Metrics(requests.Response):
         return count
 
     @staticmethod
-    def num_connects():
+    def num_connects(response):
         """ Total number of connections made by request. """
-        pass
+        timings = _timings(response)
+        if timings is None:
+            return None
+        return timings.connects
@@ -0,0 +1,203 @@
+"""
+Parallel execution of the tests in a TestSet
+- Works out ordering constraints between tests from the variables they bind and template
+- Runs independent tests concurrently on a thread pool
+- Hands results back in test order, so reporting is identical to serial execution
+"""
+import string
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import validators
+from .contenthandling import ContentHandler
+
+DEFAULT_PARALLEL_WORKERS = 8
+
+
+def template_names(template_string):
+    """ Set of variable names ($var or ${var}) referenced by a template string """
+    names = set()
+    if template_string is None:
+        return names
+    for match in string.Template.pattern.finditer(str(template_string)):
+        name = match.group('named') or match.group('braced')
+        if name:
+            names.add(name)
+    return names
+
+
+def _content_reads(content):
+    """ Variables read when realizing a ContentHandler, None if they can't be known up front """
+    names = set()
+    if content.is_template_path:
+        names.update(template_names(content.content))
+    if content.is_template_content:
+        if content.is_file:
+            return None  # Would have to read the file to know
+        names.update(template_names(content.content))
+    return names
+
+
+def _extractor_reads(extractor):
+    """ Variables read by an extractor, from its templated query """
+    if extractor.is_templated:
+        return template_names(extractor.query)
+    return set()
+
+
+def _validator_reads(validator):
+    """ Variables read by a validator, None if they can't be known up front """
+    names = set()
+    if isinstance(validator, validators.ComparatorValidator):
+        names.update(_extractor_reads(validator.extractor))
+        if isinstance(validator.expected, validators.AbstractExtractor):
+            names.update(_extractor_reads(validator.expected))
+        elif validator.isTemplateExpected:
+            names.update(template_names(validator.expected))
+        return names
+    elif isinstance(validator, validators.ExtractTestValidator):
+        return _extractor_reads(validator.extractor)
+
+    # Extension validators: look for the templating-aware pieces we know about
+    known = False
+    for value in vars(validator).values():
+        if isinstance(value, ContentHandler):
+            reads = _content_reads(value)
+            if reads is None:
+                return None
+            names.update(reads)
+            known = True
+        elif isinstance(value, validators.AbstractExtractor):
+            names.update(_extractor_reads(value))
+            known = True
+    if not known:
+        return None
+    return names
+
+
+def variables_read(test):
+    """ Variable names a test reads from the context, or None if that can't be determined """
+    names = set()
+    if test.templates:
+        for name, template in test.templates.items():
+            if name == test.NAME_HEADERS:  # Keys and values of the header dict are templates
+                for key, value in test._headers.items():
+                    names.update(template_names(key))
+                    names.update(template_names(value))
+            else:
+                names.update(template_names(template.template))
+    if isinstance(test._body, ContentHandler):
+        reads = _content_reads(test._body)
+        if reads is None:
+            return None
+        names.update(reads)
+    for validator in test.validators or list():
+        reads = _validator_reads(validator)
+        if reads is None:
+            return None
+        names.update(reads)
+    for extractor in (test.extract_binds or dict()).values():
+        names.update(_extractor_reads(extractor))
+    return names
+
+
+def variables_written(test):
+    """ Variable names a test binds in the context,
+        generators it advances are included as ('generator', name) entries """
+    names = set()
+    names.update(str(x) for x in (test.variable_binds or dict()).keys())
+    names.update(str(x) for x in (test.extract_binds or dict()).keys())
+    for variable_name, generator_name in (test.generator_binds or dict()).items():
+        names.add(str(variable_name))
+        names.add(('generator', str(generator_name)))
+    return names
+
+
+def dependency_graph(tests):
+    """ For each test, the set of earlier test indices that must finish before it can start
+
+        A test depends on an earlier one if either writes a variable the other reads or writes,
+        if both advance the same generator, or if the earlier test has stop_on_failure set.
+    """
+    last_writer = dict()  # variable -> index of last test binding it
+    readers = dict()  # variable -> indices reading it since its last write
+    unknown_readers = list()  # Tests that may read any variable
+    barrier = None  # Last stop_on_failure test
+    graph = list()
+
+    for index, test in enumerate(tests):
+        deps = set()
+        if barrier is not None:
+            deps.add(barrier)
+
+        reads = variables_read(test)
+        if reads is None:
+            deps.update(last_writer.values())
+            unknown_readers.append(index)
+        else:
+            for name in reads:
+                if name in last_writer:
+                    deps.add(last_writer[name])
+                readers.setdefault(name, list()).append(index)
+
+        for name in variables_written(test):
+            if name in last_writer:
+                deps.add(last_writer[name])
+            deps.update(readers.get(name, list()))
+            deps.update(unknown_readers)
+            last_writer[name] = index
+            readers[name] = list()
+
+        deps.discard(index)
+        graph.append(deps)
+        if test.stop_on_failure:
+            barrier = index
+    return graph
+
+
+def run_parallel(tests, run_function, workers=DEFAULT_PARALLEL_WORKERS):
+    """ Generator: run tests on a thread pool, yielding run_function(test) results in test order
+
+        Tests start as soon as the tests they depend on have finished.
+        A failed stop_on_failure test releases nothing after it, so iteration ends at that test,
+        and an exception raised by run_function is re-raised at that test's position.
+    """
+    graph = dependency_graph(tests)
+    waiting_on = [len(deps) for deps in graph]
+    dependents = [list() for x in tests]
+    for index, deps in enumerate(graph):
+        for dep in deps:
+            dependents[dep].append(index)
+
+    finished = dict()  # index -> completed future
+    running = dict()  # future -> index
+    halted_at = len(tests)  # Nothing at or after a test that raised gets started
+    next_index = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, count in enumerate(waiting_on):
+            if count == 0:
+                running[executor.submit(run_function, tests[index])] = index
+
+        while next_index < len(tests):
+            if next_index in finished:
+                future = finished.pop(next_index)
+                next_index = next_index + 1
+                yield future.result()
+                continue
+            if not running:
+                return  # Stopped early, the remaining tests never start
+
+            done, pending = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                finished[index] = future
+                if future.exception() is not None:
+                    halted_at = min(halted_at, index)
+                    continue
+                result = future.result()
+                if not result.passed and tests[index].stop_on_failure:
+                    continue
+                for dependent in dependents[index]:
+                    waiting_on[dependent] = waiting_on[dependent] - 1
+                    if waiting_on[dependent] == 0 and dependent < halted_at:
+                        running[executor.submit(run_function, tests[dependent])] = dependent
@@ -0,0 +1,110 @@
+"""
+Timing of pyresttest's own work on each request, to tell client overhead from server latency
+- A ClientProfile keeps a Histogram of the seconds spent in each phase of a request:
+    templating, building, preparing and signing it, sending it, parsing headers and validating
+- Profiling is optional (the profile_client option): without it, NO_PROFILE stands in
+    and nothing is timed
+- The send phase includes the server's time: compare it with total_time to see what the
+    HTTP client itself adds
+"""
+import threading
+import timeit
+
+from .histogram import Histogram
+
+# Phases of a request, in the order they happen
+PHASES = [u'update_context_before', u'realize', u'configure_request', u'prepare', u'sign',
+          u'send', u'parse_headers', u'validate']
+
+PHASE_UNIT = 1e-8  # Phases can take well under a microsecond, keep them to 10 nanoseconds
+
+
+class NullProfile(object):
+    """ Stands in for a ClientProfile when not profiling, times nothing """
+
+    def start(self):
+        return None
+
+    def stop(self, phase, started):
+        pass
+
+
+NO_PROFILE = NullProfile()
+
+
+def new_profile(enabled):
+    """ A ClientProfile if enabled, otherwise NO_PROFILE """
+    if enabled:
+        return ClientProfile()
+    return NO_PROFILE
+
+
+class ClientProfile(object):
+    """ Seconds spent in each phase of the requests profiled, safe to share between threads
+
+        Time a phase with:
+            started = profile.start()
+            ...
+            profile.stop(u'phase', started)
+    """
+    phases = None  # Phase name -> Histogram of seconds spent in it
+
+    def __init__(self):
+        self.phases = dict()
+        self.lock = threading.Lock()
+
+    def start(self):
+        return timeit.default_timer()
+
+    def stop(self, phase, started):
+        """ Record the time since started, from start(), against a phase """
+        self.record(phase, timeit.default_timer() - started)
+
+    def record(self, phase, seconds):
+        with self.lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram(unit=PHASE_UNIT)
+            histogram.record(max(0.0, seconds))
+
+    def merge(self, other):
+        """ Add another profile's timings to this one, returns self """
+        with self.lock:
+            for phase, histogram in other.phases.items():
+                if phase in self.phases:
+                    self.phases[phase].merge(histogram)
+                else:
+                    self.phases[phase] = Histogram(unit=PHASE_UNIT).merge(histogram)
+        return self
+
+    def take(self):
+        """ Remove and return everything recorded so far, as a new profile """
+        taken = ClientProfile()
+        with self.lock:
+            taken.phases, self.phases = self.phases, dict()
+        return taken
+
+    def summary(self):
+        """ For each phase timed: count, total seconds, and mean, p50, p90, p99 and max """
+        with self.lock:
+            return dict((phase, {
+                u'count': histogram.count, u'total': histogram.total,
+                u'mean': histogram.mean(), u'p50': histogram.percentile(50),
+                u'p90': histogram.percentile(90), u'p99': histogram.percentile(99),
+                u'max': histogram.max}) for phase, histogram in self.phases.items())
+
+    def __getstate__(self):
+        """ Pickle without the lock """
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def ordered_phases(summary):
+    """ Phase names of a summary, in PHASES order, any others after them alphabetically """
+    known = [phase for phase in PHASES if phase in summary]
+    return known + sorted(phase for phase in summary if phase not in PHASES)
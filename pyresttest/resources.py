@@ -0,0 +1,156 @@
+"""
+Resource usage of the load generator, sampled while a benchmark runs
+- CPU time and peak RSS come from the resource module (Unix), CPU time from os.times elsewhere
+- Garbage collections per generation come from gc
+- With psutil installed, RSS is the current resident size, and open connections and threads
+    are counted too
+- A busy client measures itself rather than the server: a run that kept the process near a
+    full core is flagged as saturated, and a warning logged
+"""
+import gc
+import logging
+import os
+import sys
+import threading
+import timeit
+
+try:
+    import resource
+except ImportError:  # Not on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LOGGER = logging.getLogger('pyresttest.resources')
+
+SAMPLE_INTERVAL = 1.0  # Seconds between samples
+# Mean CPU use, as a percentage of one core, above which the client looks saturated.
+# Python runs its own code on one core at a time, so more cores don't help.
+SATURATION_PERCENT = 90.0
+
+
+def cpu_time():
+    """ Seconds of CPU, user and system, used by this process so far """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    times = os.times()
+    return times[0] + times[1]
+
+
+def gc_collections():
+    """ Garbage collections run so far, per generation """
+    if hasattr(gc, 'get_stats'):
+        return [stats['collections'] for stats in gc.get_stats()]
+    return None  # Python 2 doesn't count them
+
+
+class ResourceSampler(object):
+    """ Samples this process's resource use from a background thread, between start() and stop()
+
+        Each sample has: time (seconds since start), cpu_percent (of one core, since the
+        previous sample), rss (bytes, the peak so far without psutil), gc_collections
+        (per generation, since start), and with psutil, connections and threads open.
+    """
+    interval = SAMPLE_INTERVAL
+    samples = None
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = list()
+        self.process = psutil.Process() if psutil is not None else None
+        self.stopping = threading.Event()
+        self.thread = None
+        self.started = None
+        self.started_cpu = None
+        self.started_gc = None
+        self.last = None  # (wall time, cpu time) of the previous sample
+
+    def start(self):
+        self.started = timeit.default_timer()
+        self.started_cpu = cpu_time()
+        self.started_gc = gc_collections()
+        self.last = (self.started, self.started_cpu)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ Stop sampling, taking a last sample, returns self """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.sample()
+        return self
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """ Record resource use now """
+        now = timeit.default_timer()
+        cpu = cpu_time()
+        wall = now - self.last[0]
+        percent = 100.0 * (cpu - self.last[1]) / wall if wall > 0 else 0.0
+        self.last = (now, cpu)
+
+        collections = gc_collections()
+        if collections is not None:
+            collections = [x - y for x, y in zip(collections, self.started_gc)]
+        sample = {u'time': now - self.started, u'cpu_percent': percent,
+                  u'rss': self._rss(), u'gc_collections': collections,
+                  u'connections': None, u'threads': None}
+        if self.process is not None:
+            sample[u'connections'] = self._connections()
+            sample[u'threads'] = self.process.num_threads()
+        self.samples.append(sample)
+        return sample
+
+    def _rss(self):
+        if self.process is not None:
+            return self.process.memory_info().rss
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return peak  # Bytes on macOS, kilobytes elsewhere
+        return peak * 1024
+
+    def _connections(self):
+        try:  # Renamed in psutil 6
+            lister = getattr(self.process, 'net_connections', None) or self.process.connections
+            return len(lister(kind='inet'))
+        except psutil.Error:
+            return None  # Not permitted on some platforms
+
+    def summary(self):
+        """ Dict of the samples, and over the run: cpu_percent (mean) and cpu_percent_max,
+            rss_max, gc_collections, connections_max, and whether the client looked saturated """
+        elapsed = self.last[0] - self.started
+        cpu_percent = 0.0
+        if elapsed > 0:
+            cpu_percent = 100.0 * (self.last[1] - self.started_cpu) / elapsed
+        connections = [x[u'connections'] for x in self.samples if x[u'connections'] is not None]
+        rss = [x[u'rss'] for x in self.samples if x[u'rss'] is not None]
+        return {
+            u'cpu_percent': cpu_percent,
+            u'cpu_percent_max': max([x[u'cpu_percent'] for x in self.samples] or [None]),
+            u'rss_max': max(rss) if rss else None,
+            u'gc_collections': self.samples[-1][u'gc_collections'] if self.samples else None,
+            u'connections_max': max(connections) if connections else None,
+            u'saturated': cpu_percent >= SATURATION_PERCENT,
+            u'samples': list(self.samples)}
+
+
+def warn_if_saturated(name, summary):
+    """ Log a warning if a benchmark's resource summary shows a saturated client """
+    if summary is not None and summary[u'saturated']:
+        LOGGER.warning(
+            "Benchmark {0}: the load generator used {1:.0f}% of a CPU core, so results may "
+            "measure the client rather than the server.  Lower the load, or spread it across "
+            "processes with --workers".format(name, summary[u'cpu_percent']))
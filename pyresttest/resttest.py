@@ -15,6 +15,9 @@ import json
 import csv
 import logging
 import threading
+import timeit
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
 from email import message_from_string  # For headers handling
 import urllib3
@@ -22,14 +25,6 @@ import requests
 import yaml
 from . import signer
 
-try:
-    from cStringIO import StringIO as MyIO
-except ImportError:
-    try:
-        from StringIO import StringIO as MyIO
-    except ImportError:
-        from io import BytesIO as MyIO
-
 ESCAPE_DECODING = 'string-escape'
 # Python 3 compatibility
 if sys.version_info[0] > 2:
@@ -49,7 +44,18 @@ if __name__ == '__main__':
     from pyresttest.parsing import flatten_dictionaries, lowercase_keys, safe_to_bool, safe_to_json
     from pyresttest.validators import Failure
     from pyresttest.tests import Test, DEFAULT_TIMEOUT
-    from pyresttest.benchmarks import Benchmark, AGGREGATES, METRICS, parse_benchmark
+    from pyresttest import benchmarks
+    from pyresttest.benchmarks import parse_benchmark
+    from pyresttest.benchmarks import BenchmarkRecorder, PrecisionSchedule
+    from pyresttest.benchmarks import throughput_summary, CORRECTED_TOTAL_TIME
+    from pyresttest.connections import ConnectionPool, DEFAULT_POOL_SIZE, drain_response
+    from pyresttest import parallel
+    from pyresttest.parallel import DEFAULT_PARALLEL_WORKERS
+    from pyresttest import profiling
+    from pyresttest.profiling import NO_PROFILE
+    from pyresttest import resources
+    from pyresttest import comparison
+    from pyresttest import exporter
 else:  # Normal imports
     from . import six
     from .six import text_type
@@ -65,7 +71,17 @@ else:  # Normal imports
     from . import tests
     from .tests import Test, DEFAULT_TIMEOUT
     from . import benchmarks
-    from .benchmarks import Benchmark, AGGREGATES, METRICS, parse_benchmark
+    from .benchmarks import parse_benchmark
+    from .benchmarks import BenchmarkRecorder, PrecisionSchedule
+    from .benchmarks import throughput_summary, CORRECTED_TOTAL_TIME
+    from .connections import ConnectionPool, DEFAULT_POOL_SIZE, drain_response
+    from . import parallel
+    from .parallel import DEFAULT_PARALLEL_WORKERS
+    from . import profiling
+    from .profiling import NO_PROFILE
+    from . import resources
+    from . import comparison
+    from . import exporter
 
 
 HEADER_ENCODING = 'ISO-8859-1' # Per RFC 2616
@@ -80,6 +96,9 @@ LOGGER = logging.getLogger('pyresttest')
 
 DIR_LOCK = threading.RLock()  # Guards operations changing the working directory
 
+# Ways to execute tests and benchmarks: blocking requests calls, or an asyncio event loop
+ENGINES = [u'requests', u'asyncio']
+
 
 class cd:
     """Context manager for changing the current working directory"""
@@ -107,10 +126,17 @@ class TestConfig:
     print_headers = False  # Print response bodies in all cases
     retries = 0  # Retries on failures
     test_parallel = False  # Allow parallel execution of tests in a test set, for speed?
+    parallel_workers = DEFAULT_PARALLEL_WORKERS  # Threads used when test_parallel is set
+    engine = u'requests'  # Execution engine, from ENGINES
     interactive = False
     verbose = False
     ssl_insecure = False
     skip_term_colors = True  # Turn off output term colors
+    keep_alive = True  # Reuse connections between requests, instead of sending Connection: close
+    connection_pool_size = DEFAULT_POOL_SIZE  # Connections kept per scheme/host/port
+    profile_client = False  # Time pyresttest's own work in each phase of a request
+    workers = None  # (host, port) of worker processes to spread benchmarks across
+    authkey = None  # Key shared with the workers
     # NEW
     signature = False
     key = None
@@ -147,6 +173,16 @@ class BenchmarkResult:
     results = dict()  # Benchmark output, map the metric to the result array for that metric
     aggregates = list()  # List of aggregates, as tuples of (metricname, aggregate, result)
     failures = 0  # Track call count that failed
+    throughput = None  # Responses/second, {'combined': rate, 'workers': [rate per worker]}
+    stages = None  # Staged benchmarks: a BenchmarkResult for each stage
+    stage = None  # In the result for one stage, the BenchmarkStage it ran
+    warmup_runs = None  # Warmup runs sent before measuring
+    precision = None  # For a precision target: whether it was reached, and in how many runs
+    timeseries = None  # Requests, failures, throughput and latency for each interval of the run
+    statuses = None  # HTTP status code -> count and latency of the responses with it
+    errors = None  # Error class (timeout, connection_refused, ...) -> count and latency of failures
+    client_overhead = None  # With profile_client: phase -> time pyresttest spent in it
+    resources = None  # Resource use of each load generator process, see resources.ResourceSampler
 
     def __init__(self):
         self.aggregates = list()
@@ -301,6 +337,19 @@ def parse_configuration(node, base_config=None):
             test_config.print_bodies = safe_to_bool(value)
         elif key == u'retries':
             test_config.retries = int(value)
+        elif key == u'keep_alive':
+            test_config.keep_alive = safe_to_bool(value)
+        elif key == u'connection_pool_size':
+            test_config.connection_pool_size = int(value)
+        elif key == u'profile_client':
+            test_config.profile_client = safe_to_bool(value)
+        elif key == u'test_parallel':
+            test_config.test_parallel = safe_to_bool(value)
+        elif key == u'parallel_workers':
+            test_config.parallel_workers = int(value)
+            if test_config.parallel_workers <= 0:
+                raise ValueError(
+                    "Invalid number of parallel workers, must be > 0: {0}".format(value))
         elif key == u'variable_binds':
             if not test_config.variable_binds:
                 test_config.variable_binds = dict()
@@ -324,38 +373,69 @@ def read_file(path):
     return string
 
 
-def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *args, **kwargs):
-    """ Put together test pieces: configure & run actual test, return results """
+def prepare_request(templated_test, test_config=TestConfig(), context=None, curl_handle=None,
+                    profile=NO_PROFILE):
+    """ Configure, prepare and sign the request for an already templated test or benchmark
+        profile, a profiling.ClientProfile, times each step """
+    started = profile.start()
+    req = templated_test.configure_request(
+        timeout=test_config.timeout,
+        context=context,
+        curl_handle=curl_handle,
+        keep_alive=test_config.keep_alive)
+    profile.stop(u'configure_request', started)
+    started = profile.start()
+    prepped = req.prepare()
+    profile.stop(u'prepare', started)
+    # generate and attach signature to header
+    started = profile.start()
+    signed = signer.request_signer(prepped, TestConfig.key)
+    profile.stop(u'sign', started)
+    return signed
+
+
+def request_failed(result, error):
+    """ Record a request exception (network error) on a test result """
+    trace = traceback.format_exc()
+    result.failures.append(Failure(message="Request Exception: {0}".format(
+        error), details=trace, failure_type=validators.FAILURE_CURL_EXCEPTION))
+    result.passed = False
+    return result
+
+
+def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None,
+             connection_pool=None, profile=NO_PROFILE, *args, **kwargs):
+    """ Put together test pieces: configure & run actual test, return results
+        Requests go through connection_pool if supplied, otherwise through a pool for this test only
+        profile, a profiling.ClientProfile, times each phase of the test
+    """
     # Initialize a context if not supplied
     my_context = context
     if my_context is None:
         my_context = Context()
 
+    started = profile.start()
     mytest.update_context_before(my_context)
+    profile.stop(u'update_context_before', started)
+    started = profile.start()
     templated_test = mytest.realize(my_context)
+    profile.stop(u'realize', started)
 
     result = TestResponse()
     result.test = templated_test
 
-    session = requests.Session()
+    pool = connection_pool
+    if pool is None:
+        pool = ConnectionPool()
+    session = pool.session()  # Own cookies, shared connections
 
-    # generate and attach signature to header
-    req = templated_test.configure_request(
-        timeout=test_config.timeout,
-        context=my_context,
-        curl_handle=curl_handle)
+    prepped = prepare_request(templated_test, test_config, my_context, curl_handle, profile)
 
     if test_config.verbose:
         session.verbose = True
     if test_config.ssl_insecure:
         session.verify = False
 
-    headers = MyIO()
-    body = MyIO()
-
-    prepped = req.prepare()
-    prepped = signer.request_signer(prepped, TestConfig.key)
-
     result.passed = None
 
     if test_config.interactive:
@@ -379,23 +459,28 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
         time.sleep(mytest.delay)
 
     try:
+        started = profile.start()
         response = session.send(prepped)
+        profile.stop(u'send', started)
     except Exception as error:
         # exception occurred (network error), do not pass go, do not
         # collect $200
-        trace = traceback.format_exc()
-        result.failures.append(Failure(message="Request Exception: {0}".format(
-            error), details=trace, failure_type=validators.FAILURE_CURL_EXCEPTION))
-        result.passed = False
-        session.close()
-        return result
+        request_failed(result, error)
+    else:
+        process_test_response(mytest, result, response, test_config, my_context, profile)
+
+    if connection_pool is None:
+        pool.close()
+    return result
+
 
+def process_test_response(mytest, result, response, test_config=TestConfig(), context=None,
+                          profile=NO_PROFILE):
+    """ Check a received response against the test: status code, headers, validators
+        Runs extractors to update the context if the test passes """
     # Retrieve values
     result.body = response.content
-    body.close()
-
     result.response_headers = response.headers  # Per RFC 2616
-    headers.close()
 
     response_code = response.status_code
     result.response_code = response_code
@@ -419,7 +504,9 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
 
     # Parse HTTP headers
     try:
+        started = profile.start()
         result.response_headers = parse_headers(result.response_headers)
+        profile.stop(u'parse_headers', started)
     except Exception as error:
         trace = traceback.format_exc()
         result.failures.append(Failure(
@@ -427,7 +514,6 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
             details=trace,
             failure_type=validators.FAILURE_TEST_EXCEPTION))
         result.passed = False
-        session.close()
         return result
 
     head = result.response_headers
@@ -439,9 +525,10 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
             LOGGER.debug("executing this many validators: " +
                          str(len(mytest.validators)))
             failures = result.failures
+            started = profile.start()
             for validator in mytest.validators:
                 validate_result = validator.validate(
-                    body=body, headers=head, context=my_context)
+                    body=body, headers=head, context=context)
                 if not validate_result:
                     result.passed = False
                 # Proxy for checking if it is a Failure object, because of
@@ -449,11 +536,12 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
                 if hasattr(validate_result, 'details'):
                     failures.append(validate_result)
                 # TODO add printing of validation for interactive mode
+            profile.stop(u'validate', started)
         else:
             LOGGER.debug("no validators found")
 
         # Only do context updates if test was successful
-        mytest.update_context_after(result.body, head, my_context)
+        mytest.update_context_after(result.body, head, context)
 
     # Print response body if override is set to print all *OR* if test failed
     # (to capture maybe a stack trace)
@@ -469,12 +557,50 @@ def run_test(mytest, test_config=TestConfig(), context=None, curl_handle=None, *
 
     # TODO add string escape on body output
     LOGGER.debug(result)
-
     return result
 
 
-def run_benchmark(benchmark, test_config=TestConfig(), context=None, *args, **kwargs):
-    """ Perform a benchmark, (re)using a given, configured CURL call to do so
+def prepare_benchmark_request(benchmark, test_config, context, profile=NO_PROFILE):
+    """ Apply context updates and templating for one benchmark call, then build its request """
+    started = profile.start()
+    benchmark.update_context_before(context)
+    profile.stop(u'update_context_before', started)
+    started = profile.start()
+    templated = benchmark.realize(context)
+    profile.stop(u'realize', started)
+    return prepare_request(templated, test_config, context, profile=profile)
+
+
+def _send_benchmark_request(benchmark, test_config, context, connection_pool, lock=None,
+                            profile=NO_PROFILE):
+    """ Template, configure, sign and send one benchmark request
+        Returns the response with the body still unread (streamed)
+        With concurrent workers, lock guards the shared context while the request is built """
+    session = connection_pool.session()
+    # Do not store actual response body at all.
+    session.stream = True
+    if test_config.ssl_insecure:
+        session.verify = False
+
+    if lock is None:
+        prepped = prepare_benchmark_request(benchmark, test_config, context, profile)
+    else:
+        with lock:
+            prepped = prepare_benchmark_request(benchmark, test_config, context, profile)
+    started = profile.start()
+    response = session.send(prepped)
+    profile.stop(u'send', started)
+    return response
+
+
+def run_benchmark(benchmark, test_config=TestConfig(), context=None,
+                  connection_pool=None, monitor=None, sample_writer=None, *args, **kwargs):
+    """ Perform a benchmark, reusing pooled connections between calls
+        Runs are shared out between worker threads using the connection pool, see Benchmark
+        With a rate they are sent on schedule, and latency is also measured from that schedule
+        monitor, if given, is called with each worker's BenchmarkRecorder as the worker starts,
+        so measurements can be read while the benchmark runs
+        sample_writer, if given, receives every sample as it is measured, see SampleWriter
         The actual analysis of metrics is performed separately, to allow for testing
     """
 
@@ -483,13 +609,22 @@ def run_benchmark(benchmark, test_config=TestConfig(), context=None, *args, **kw
     if my_context is None:
         my_context = Context()
 
-    warmup_runs = benchmark.warmup_runs
     benchmark_runs = benchmark.benchmark_runs
     message = ''  # Message is name of benchmark... print it?
 
-    if benchmark_runs <= 0:
+    if benchmark_runs <= 0 and benchmark.duration is None and not benchmark.stages:
         raise Exception(
-            "Invalid number of benchmark runs, must be > 0 :" + benchmark_runs)
+            "Invalid number of benchmark runs, must be > 0 :" + str(benchmark_runs))
+
+    stages = benchmark.load_stages()
+    workers = benchmark.worker_count()
+    lock = None
+    if workers > 1:  # Context and generators are not thread-safe
+        lock = threading.Lock()
+
+    pool = connection_pool
+    if pool is None:
+        pool = ConnectionPool(pool_size=max(DEFAULT_POOL_SIZE, workers))
 
     # TODO create and use a curl-returning configuration function
     # TODO create and use a post-benchmark cleanup function
@@ -503,77 +638,131 @@ def run_benchmark(benchmark, test_config=TestConfig(), context=None, *args, **kw
     output = BenchmarkResult()
     output.name = benchmark.name
     output.group = benchmark.group
-    metricnames = list(benchmark.metrics)
-
-    # Metric variable for curl, to avoid hash lookup for every metric name
-    metricvalues = [METRICS[name] for name in metricnames]
-
-    # Initialize arrays to store results for each metric
-    results = [list() for x in xrange(0, len(metricnames))]
-
-    # Benchmark warm-up to allow for caching, JIT compiling, on client
-    LOGGER.info('Warmup: ' + message + ' started')
-    for item in xrange(0, warmup_runs):
-        session = requests.Session()
-        benchmark.update_context_before(my_context)
-        templated = benchmark.realize(my_context)
-        # Do not store actual response body at all.
-        session.stream = True
-        req = templated.configure_request(
-            timeout=test_config.timeout, context=my_context, curl_handle=session)
-
-        if test_config.ssl_insecure:
-            session.verify = False
-
-        prepped = req.prepare()
-        prepped = oci_signer.request_signer(prepped, TestConfig.oci_key)
-
-        session.send(prepped)
-        session.close()
-
-    LOGGER.info('Warmup: ' + message + ' finished')
-
-    LOGGER.info('Benchmark: ' + message + ' starting')
-
-    for item in xrange(0, benchmark_runs):  # Run the actual benchmarks
-        # Setup benchmark
-        session = requests.Session()
-        benchmark.update_context_before(my_context)
-        templated = benchmark.realize(my_context)
-        # Do not store actual response body at all.
-        session.stream = True
-        req = templated.configure_request(
-            timeout=test_config.timeout, context=my_context, curl_handle=session)
-
-        if test_config.ssl_insecure:
-            session.verify = False
-
-        prepped = req.prepare()
-        prepped = oci_signer.request_signer(prepped, TestConfig.oci_key)
-
-        try:  # Run the curl call, if it errors, then add to failure counts for benchmark
-            response = session.send(prepped)
-        except Exception:
-            output.failures = output.failures + 1
-            session.close()
-            continue  # Skip metrics collection
-
-        # Get all metrics values for this run, and store to metric lists
-        for i in xrange(0, len(metricnames)):
-            # results[i].append(curl.getinfo(metricvalues[i]))
-            value = metricvalues[i]
-            results[i].append(value(response))
-        session.close()
-
-    LOGGER.info('Benchmark: ' + message + ' ending')
-
-    temp_results = dict()
-    for i in xrange(0, len(metricnames)):
-        temp_results[metricnames[i]] = results[i]
-    output.results = temp_results
+    sampler = None
+    # Streamed values are already on disk, keeping them too would grow without bound
+    kept_metrics = benchmark.raw_metrics if sample_writer is None else ()
+
+    def warmup(schedule):
+        """ Benchmark warm-up to allow for caching, JIT compiling, on client """
+        while schedule.next_run() is not None:
+            response = _send_benchmark_request(benchmark, test_config, my_context, pool, lock)
+            drain_response(response)
+            schedule.record(response)
+
+    def measure(schedule):
+        """ Run the actual benchmarks, returning the worker's BenchmarkRecorder """
+        recorder = BenchmarkRecorder(benchmark.metrics, open_loop=schedule.rate is not None,
+                                     stage=stage_index,
+                                     raw_metrics=kept_metrics,
+                                     aggregated_metrics=benchmark.aggregated_metrics,
+                                     timeseries=benchmark.new_timeseries(origin),
+                                     profile_client=test_config.profile_client,
+                                     sink=sample_writer)
+        if monitor is not None:
+            monitor(recorder)
+        profile = recorder.profile or NO_PROFILE
+        start = timeit.default_timer()
+        while True:
+            due = schedule.next_run()
+            if due is None:
+                break
+            wait = due - timeit.default_timer()
+            if wait > 0:
+                time.sleep(wait)
+            sent = timeit.default_timer()
+            try:  # Run the request, if it errors, then add to failure counts for benchmark
+                response = _send_benchmark_request(
+                    benchmark, test_config, my_context, pool, lock, profile)
+                drain_response(response)  # Hand the connection back to the pool
+            except Exception as error:
+                recorder.record_failure(error, timeit.default_timer() - sent)
+                continue  # Skip metrics collection
+            # Latency from when it was due, so time waiting on the lock, templating
+            # and signing count too, not only the transport's total_time
+            recorder.record(response, timeit.default_timer() - due)
+            schedule.record(response)
+        recorder.elapsed = timeit.default_timer() - start
+        return recorder
+
+    def run_workers(function, schedule, count):
+        """ Run count workers over a schedule, returning what each worker returns """
+        if count == 1:
+            return [function(schedule)]
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            return list(executor.map(function, [schedule] * count))
+
+    try:
+        LOGGER.info('Warmup: ' + message + ' started')
+        warmup_schedule = benchmark.warmup_schedule()
+        run_workers(warmup, warmup_schedule, stages[0].worker_count())
+        output.warmup_runs = warmup_schedule.issued
+        LOGGER.info('Warmup: ' + message + ' finished after {0} runs'.format(output.warmup_runs))
+
+        LOGGER.info('Benchmark: ' + message + ' starting')
+        origin = timeit.default_timer()  # Time series intervals count from here
+        sampler = resources.ResourceSampler().start()
+        stage_recorders = list()
+        for stage_index, stage in enumerate(stages):
+            schedule = stage.schedule()
+            schedule.begin()
+            stage_recorders.append(run_workers(measure, schedule, stage.worker_count()))
+            if isinstance(schedule, PrecisionSchedule):
+                output.precision = schedule.summary()
+        LOGGER.info('Benchmark: ' + message + ' ending')
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if connection_pool is None:
+            pool.close()
+    output.resources = [sampler.summary()]
+
+    if benchmark.stages:
+        collect_benchmark_results(output, stage_recorders, benchmark.stages)
+    else:
+        collect_benchmark_results(output, stage_recorders[0])
     return analyze_benchmark_results(output, benchmark)
 
 
+def collect_benchmark_results(output, recorders, stages=None):
+    """ Store the merged raw measurements and throughput of benchmark workers in a BenchmarkResult
+
+        For a staged benchmark, recorders holds the list of worker recorders for each stage:
+        output then covers all stages, and output.stages has a BenchmarkResult for each one """
+    stage_recorders = [recorders]
+    if stages is not None:
+        stage_recorders = recorders
+    merged = stage_recorders[0][0].empty_copy()
+    for worker_recorders in stage_recorders:
+        for recorder in worker_recorders:
+            merged.merge(recorder)
+    output.results = merged.metric_results()
+    output.failures = merged.failures
+    output.timeseries = merged.timeseries
+    output.statuses = merged.statuses
+    output.errors = merged.errors
+    output.client_overhead = merged.profile
+    if stages is None:
+        output.throughput = throughput_summary(recorders)
+        return output
+
+    # Stages run one after another, and have different workers
+    output.stages = list()
+    wall_time = 0.0
+    for stage, worker_recorders in zip(stages, stage_recorders):
+        stage_output = BenchmarkResult()
+        stage_output.name = output.name
+        stage_output.group = output.group
+        stage_output.stage = stage
+        output.stages.append(collect_benchmark_results(stage_output, worker_recorders))
+        stage_output.timeseries = None  # Covered by the time series of the whole run
+        wall_time = wall_time + max(recorder.elapsed for recorder in worker_recorders)
+    combined = None
+    if wall_time > 0:
+        combined = merged.requests / wall_time
+    output.throughput = {u'combined': combined, u'workers': list()}
+    return output
+
+
 def analyze_benchmark_results(benchmark_result, benchmark):
     """ Take a benchmark result containing raw benchmark results, and do aggregation by
     applying functions
@@ -584,25 +773,57 @@ def analyze_benchmark_results(benchmark_result, benchmark):
     output.name = benchmark_result.name
     output.group = benchmark_result.group
     output.failures = benchmark_result.failures
-
-    # Copy raw metric arrays over where necessary
+    output.throughput = benchmark_result.throughput
+    if benchmark_result.stage is not None:
+        output.stage = benchmark_result.stage
+    if benchmark_result.warmup_runs is not None:
+        output.warmup_runs = benchmark_result.warmup_runs
+    if benchmark_result.precision is not None:
+        output.precision = benchmark_result.precision
+    if benchmark_result.timeseries is not None:
+        output.timeseries = benchmark_result.timeseries.summary()
+    if benchmark_result.statuses is not None:
+        output.statuses = dict((status, outcome.summary())
+                               for status, outcome in benchmark_result.statuses.items())
+    if benchmark_result.errors is not None:
+        output.errors = dict((kind, outcome.summary())
+                             for kind, outcome in benchmark_result.errors.items())
+    if benchmark_result.client_overhead is not None:
+        output.client_overhead = benchmark_result.client_overhead.summary()
+    if benchmark_result.resources is not None:
+        output.resources = benchmark_result.resources
+    if benchmark_result.stages is not None:
+        # Raw data is only kept for the whole benchmark
+        output.stages = list()
+        for stage_result in benchmark_result.stages:
+            stage_output = analyze_benchmark_results(stage_result, benchmark)
+            stage_output.results = dict()
+            output.stages.append(stage_output)
+
+    # Open loop runs report corrected latency alongside total_time, in the same way
     raw_results = benchmark_result.results
+    raw_metrics = list(benchmark.raw_metrics)
+    aggregated_metrics = list(benchmark.aggregated_metrics.items())
+    if CORRECTED_TOTAL_TIME in raw_results:
+        if u'total_time' in benchmark.raw_metrics:
+            raw_metrics.append(CORRECTED_TOTAL_TIME)
+        if u'total_time' in benchmark.aggregated_metrics:
+            aggregated_metrics.append(
+                (CORRECTED_TOTAL_TIME, benchmark.aggregated_metrics[u'total_time']))
+
+    # Copy raw metric arrays over where necessary, streamed runs did not keep them
     temp = dict()
-    for metric in benchmark.raw_metrics:
-        temp[metric] = raw_results[metric]
+    for metric in raw_metrics:
+        if not isinstance(raw_results[metric], (benchmarks.Histogram, benchmarks.Accumulator)):
+            temp[metric] = list(raw_results[metric])
     output.results = temp
 
     # Compute aggregates for each metric, and add tuples to aggregate results
     aggregate_results = list()
-    for metricname, aggregate_list in benchmark.aggregated_metrics.items():
-        numbers = raw_results[metricname]
-        for aggregate_name in aggregate_list:
-            if numbers:  # Only compute aggregates if numbers exist
-                aggregate_function = AGGREGATES[aggregate_name]
-                aggregate_results.append(
-                    (metricname, aggregate_name, aggregate_function(numbers)))
-            else:
-                aggregate_results.append((metricname, aggregate_name, None))
+    for metricname, aggregate_list in aggregated_metrics:
+        values = benchmarks.aggregate_all(raw_results[metricname], aggregate_list)
+        for aggregate_name, value in zip(aggregate_list, values):
+            aggregate_results.append((metricname, aggregate_name, value))
 
     output.aggregates = aggregate_results
     return output
@@ -640,24 +861,169 @@ def write_benchmark_json(file_out, benchmark_result, benchmark, test_config=Test
     json.dump(benchmark_result, file_out, default=safe_to_json)
 
 
+class SampleWriter(object):
+    """ Streams each benchmark sample to a file as a line of JSON, while the benchmark runs
+
+        Lines are a sample (timestamp, stage, status and each metric) per response, or a failure
+        (timestamp, stage, error class and elapsed seconds) per request that raised.
+        Writes are buffered by the file, and flushed every flush_interval seconds, so little
+        is held in memory and a crashed run keeps everything up to its last flush.
+    """
+    FLUSH_INTERVAL = 1.0  # Seconds between flushes
+
+    def __init__(self, file_out, flush_interval=FLUSH_INTERVAL):
+        self.file_out = file_out
+        self.flush_interval = flush_interval
+        self.flushed = timeit.default_timer()
+        self.lock = threading.Lock()  # Shared by worker threads
+
+    def sample(self, stage, metrics, status):
+        line = {u'type': u'sample', u'timestamp': time.time(), u'stage': stage,
+                u'status': status}
+        line.update(metrics)
+        self.write(line)
+
+    def failure(self, stage, error, elapsed):
+        self.write({u'type': u'failure', u'timestamp': time.time(), u'stage': stage,
+                    u'error': error, u'elapsed': elapsed})
+
+    def write(self, line):
+        text = json.dumps(line, default=safe_to_json) + '\n'
+        with self.lock:
+            self.file_out.write(text)
+            now = timeit.default_timer()
+            if now - self.flushed >= self.flush_interval:
+                self.file_out.flush()
+                self.flushed = now
+
+
+def write_benchmark_jsonl(file_out, benchmark_result, benchmark, test_config=TestConfig()):
+    """ Writes benchmark to file as a last line of json, after any samples streamed by a
+        SampleWriter; raw results are left out, the sample lines already hold them """
+    line = {u'type': u'result'}
+    line.update(benchmark_result.__dict__)
+    line.pop('results', None)
+    file_out.write(json.dumps(line, default=safe_to_json) + '\n')
+
+
 def write_benchmark_csv(file_out, benchmark_result, benchmark, test_config=TestConfig()):
     """ Writes benchmark to file as csv """
     writer = csv.writer(file_out)
     writer.writerow(('Benchmark', benchmark_result.name))
     writer.writerow(('Benchmark Group', benchmark_result.group))
     writer.writerow(('Failures', benchmark_result.failures))
+    if benchmark_result.warmup_runs is not None:
+        writer.writerow(('Warmup Runs', benchmark_result.warmup_runs))
 
     # Write result arrays
     if benchmark_result.results:
         writer.writerow(('Results', ''))
         writer.writerows(metrics_to_tuples(benchmark_result.results))
+    _write_benchmark_csv_summary(writer, benchmark_result)
+    if benchmark_result.precision:
+        writer.writerow(('Precision', ''))
+        for key in (u'metric', u'aggregate', u'tolerance', u'confidence',
+                    u'relative_width', u'runs', u'reached'):
+            writer.writerow((key, benchmark_result.precision[key]))
+    if benchmark_result.resources:
+        _write_benchmark_csv_resources(writer, benchmark_result.resources)
+    if benchmark_result.timeseries:
+        writer.writerow(('Time Series', ''))
+        writer.writerow(('start', 'requests', 'failures', 'throughput',
+                         'mean', 'p50', 'p90', 'p99', 'max'))
+        for bucket in benchmark_result.timeseries:
+            latency = bucket[u'latency']
+            writer.writerow((bucket[u'start'], bucket[u'requests'], bucket[u'failures'],
+                             bucket[u'throughput'], latency[u'mean'], latency[u'p50'],
+                             latency[u'p90'], latency[u'p99'], latency[u'max']))
+
+    # Then the same summary for each stage of a staged benchmark
+    for index, stage_result in enumerate(benchmark_result.stages or list()):
+        stage = stage_result.stage
+        writer.writerow(('Stage', index + 1))
+        writer.writerow(('Duration', stage.duration))
+        writer.writerow(('Concurrency', stage.concurrency))
+        writer.writerow(('Rate', stage.rate))
+        writer.writerow(('Failures', stage_result.failures))
+        _write_benchmark_csv_summary(writer, stage_result)
+
+
+def _write_benchmark_csv_summary(writer, benchmark_result):
+    """ Write the aggregates, throughput, status and error sections of a benchmark result """
     if benchmark_result.aggregates:
         writer.writerow(('Aggregates', ''))
         writer.writerows(benchmark_result.aggregates)
-
+    if benchmark_result.throughput:
+        writer.writerow(('Throughput', ''))
+        writer.writerow(('combined', benchmark_result.throughput[u'combined']))
+        for index, rate in enumerate(benchmark_result.throughput[u'workers']):
+            writer.writerow(('worker {0}'.format(index + 1), rate))
+    _write_benchmark_csv_outcomes(writer, 'Status Codes', 'status', benchmark_result.statuses)
+    _write_benchmark_csv_outcomes(writer, 'Errors', 'error', benchmark_result.errors)
+    if benchmark_result.client_overhead:
+        writer.writerow(('Client Overhead', ''))
+        writer.writerows(client_overhead_rows(benchmark_result.client_overhead))
+
+
+def _write_benchmark_csv_resources(writer, summaries):
+    """ Write the resource use of each load generator, then its samples """
+    def collections(counts):
+        return ' '.join(str(x) for x in counts) if counts is not None else None
+
+    writer.writerow(('Resources', ''))
+    writer.writerow(('generator', 'cpu_percent', 'cpu_percent_max', 'rss_max',
+                     'gc_collections', 'connections_max', 'saturated'))
+    for index, summary in enumerate(summaries):
+        writer.writerow((index + 1, summary[u'cpu_percent'], summary[u'cpu_percent_max'],
+                         summary[u'rss_max'], collections(summary[u'gc_collections']),
+                         summary[u'connections_max'], summary[u'saturated']))
+    writer.writerow(('Resource Samples', ''))
+    writer.writerow(('generator', 'time', 'cpu_percent', 'rss', 'gc_collections',
+                     'connections', 'threads'))
+    for index, summary in enumerate(summaries):
+        for sample in summary[u'samples']:
+            writer.writerow((index + 1, sample[u'time'], sample[u'cpu_percent'], sample[u'rss'],
+                             collections(sample[u'gc_collections']), sample[u'connections'],
+                             sample[u'threads']))
+
+
+def _write_benchmark_csv_outcomes(writer, title, key_name, outcomes):
+    """ Write a table of count and latency for each status code or error class """
+    if not outcomes:
+        return
+    writer.writerow((title, ''))
+    writer.writerow((key_name, 'count', 'mean', 'p50', 'p90', 'p99', 'max'))
+    for key in sorted(outcomes.keys(), key=str):
+        outcome = outcomes[key]
+        latency = outcome[u'latency']
+        writer.writerow((key, outcome[u'count'], latency[u'mean'], latency[u'p50'],
+                         latency[u'p90'], latency[u'p99'], latency[u'max']))
+
+
+def client_overhead_rows(summary):
+    """ Header row, then a row for each phase of a ClientProfile summary """
+    rows = [('phase', 'count', 'total', 'mean', 'p50', 'p90', 'p99', 'max')]
+    for phase in profiling.ordered_phases(summary):
+        timing = summary[phase]
+        rows.append((phase, timing[u'count'], timing[u'total'], timing[u'mean'],
+                     timing[u'p50'], timing[u'p90'], timing[u'p99'], timing[u'max']))
+    return rows
+
+
+def write_benchmark_binary(file_out, benchmark_result, benchmark, test_config=TestConfig()):
+    """ Writes benchmark to a binary file: raw results as typed columns, after a header of the
+        rest of the result, see benchmarks.write_binary_results """
+    header = dict(benchmark_result.__dict__)
+    header.pop('results', None)
+    benchmarks.write_binary_results(file_out, benchmark_result.results or dict(), header)
+
+
+STREAM_BUFFER_SIZE = 1 << 16  # Bytes buffered before a jsonl output file is written
 
 # Method to call when writing benchmark file
-OUTPUT_METHODS = {u'csv': write_benchmark_csv, u'json': write_benchmark_json}
+OUTPUT_METHODS = {u'csv': write_benchmark_csv, u'json': write_benchmark_json,
+                  u'jsonl': write_benchmark_jsonl, u'binary': write_benchmark_binary}
+BINARY_OUTPUT_FORMATS = frozenset([u'binary'])  # Written to files opened in binary mode
 
 
 def log_failure(failure, context=None, test_config=TestConfig()):
@@ -668,8 +1034,229 @@ def log_failure(failure, context=None, test_config=TestConfig()):
         LOGGER.error("Validator/Error details:" + str(failure.details))
 
 
-def run_testsets(testsets):
-    """ Execute a set of tests, using given TestSet list input """
+def run_testset(testset, connection_pool, engine=None, curl_handle=None, metrics_exporter=None):
+    """ Execute the tests and benchmarks of one TestSet, in a fresh Context
+        With metrics_exporter, a MetricsExporter, benchmarks export their totals as they run
+        Returns (group_results, group_failure_counts, bench_results) for this testset """
+    group_results = dict()  # results, by group
+    group_failure_counts = dict()
+    bench_results = dict()
+
+    mytests = testset.tests
+    myconfig = testset.config
+    mybenchmarks = testset.benchmarks
+    context = Context()
+
+    # Bind variables & add generators if pertinent
+    if myconfig.variable_binds:
+        context.bind_variables(myconfig.variable_binds)
+    if myconfig.generators:
+        for key, value in myconfig.generators.items():
+            context.add_generator(key, value)
+
+    profile = profiling.new_profile(myconfig.profile_client)
+
+    def run_one(test):
+        """ Run a test of this testset """
+        return run_test(test, test_config=myconfig, context=context, curl_handle=curl_handle,
+                        connection_pool=connection_pool, profile=profile)
+
+    use_engine = myconfig.engine == u'asyncio' and not myconfig.interactive
+
+    # Results always come back in test order, parallel or not
+    if use_engine:
+        test_results = engine.run_tests(mytests, myconfig, context, profile=profile)
+    elif myconfig.test_parallel and not myconfig.interactive:
+        test_results = parallel.run_parallel(
+            mytests, run_one, workers=myconfig.parallel_workers)
+    else:
+        test_results = (run_one(test) for test in mytests)
+
+    # Run tests, collecting statistics as needed
+    for test, result in zip(mytests, test_results):
+        # Initialize the dictionaries to store test fail counts and results
+        if test.group not in group_results:
+            group_results[test.group] = list()
+            group_failure_counts[test.group] = 0
+
+        result.body = None  # Remove the body, save some memory!
+
+        if not result.passed:  # Print failure, increase failure counts for that test group
+            # Use result test URL to allow for templating
+            LOGGER.error('Test Failed: ' + test.name + " URL=" + result.test.url +
+                         " Group=" + test.group +
+                         " HTTP Status Code: " + str(result.response_code))
+
+            # Print test failure reasons
+            if result.failures:
+                for failure in result.failures:
+                    log_failure(failure, context=context,
+                                test_config=myconfig)
+
+            # Increment test failure counts for that group (adding an entry
+            # if not present)
+            failures = group_failure_counts[test.group]
+            failures = failures + 1
+            group_failure_counts[test.group] = failures
+
+        else:  # Test passed, print results
+            LOGGER.info('Test Succeeded: ' + test.name +
+                        " URL=" + test.url + " Group=" + test.group)
+
+        # Add results for this test group to the resultset
+        group_results[test.group].append(result)
+
+        # handle stop_on_failure flag
+        if not result.passed and test.stop_on_failure is not None and test.stop_on_failure:
+            LOGGER.error(
+                'STOP ON FAILURE! stopping test set execution, continuing with other test sets')
+            break
+
+    if profile is not NO_PROFILE and profile.phases:
+        LOGGER.info('Client overhead, seconds per phase:\n' + '\n'.join(
+            ','.join(str(x) for x in row) for row in client_overhead_rows(profile.summary())))
+
+    for benchmark in mybenchmarks:  # Run benchmarks, analyze, write
+        # Initialize the dictionaries to store test fail counts and results
+        if benchmark.name not in bench_results:
+            bench_results[benchmark.name] = []
+
+        if not benchmark.metrics:
+            LOGGER.debug('Skipping benchmark, no metrics to collect')
+            continue
+
+        LOGGER.info("Benchmark Starting: " + benchmark.name +
+                    " Group: " + benchmark.group)
+        stream_file = None
+        sample_writer = None
+        streams = benchmark.output_file and benchmark.output_format == u'jsonl'
+        if streams and myconfig.workers:
+            LOGGER.warning("Benchmark {0} runs on --workers, which keep its samples: {1} gets "
+                           "only the result line".format(benchmark.name, benchmark.output_file))
+        elif streams:
+            # Samples go to disk as they are measured, the result line follows at the end
+            stream_file = open(benchmark.output_file, 'w', STREAM_BUFFER_SIZE)
+            sample_writer = SampleWriter(stream_file)
+        benchmark_metrics = None
+        monitor = None
+        if metrics_exporter is not None and not myconfig.workers:
+            benchmark_metrics = metrics_exporter.benchmark(benchmark.name, benchmark.group)
+            monitor = benchmark_metrics.monitor
+        try:
+            if myconfig.workers:  # Samples stay with the worker processes
+                benchmark_result = distributed.run_distributed_benchmark(
+                    benchmark, myconfig, myconfig.workers, authkey=myconfig.authkey,
+                    context=context)
+            elif use_engine:
+                benchmark_result = engine.run_benchmark(
+                    benchmark, myconfig, context=context, monitor=monitor,
+                    sample_writer=sample_writer)
+            else:
+                benchmark_result = run_benchmark(
+                    benchmark, myconfig, context=context, connection_pool=connection_pool,
+                    monitor=monitor, sample_writer=sample_writer)
+            if stream_file is not None:
+                write_benchmark_jsonl(stream_file, benchmark_result, benchmark, myconfig)
+        finally:
+            if stream_file is not None:
+                stream_file.close()
+            if benchmark_metrics is not None:
+                benchmark_metrics.finish()
+        LOGGER.info(benchmark_result)
+        for summary in benchmark_result.resources or list():
+            resources.warn_if_saturated(benchmark.name, summary)
+        LOGGER.info("Benchmark Done: " + benchmark.name +
+                    " Group: " + benchmark.group)
+        # Add results for this test group to the result set
+        bench_results[benchmark.name].append(json.dumps(benchmark_result, default=safe_to_json))
+
+        if benchmark.output_file and stream_file is None:  # Write file
+            LOGGER.debug(
+                'Writing benchmark to file in format: ' + benchmark.output_format)
+            write_method = OUTPUT_METHODS[benchmark.output_format]
+            mode = 'wb' if benchmark.output_format in BINARY_OUTPUT_FORMATS else 'w'
+            my_file = open(benchmark.output_file, mode)  # Overwrites file
+            LOGGER.debug("Benchmark writing to file: " +
+                         benchmark.output_file)
+            write_method(my_file, benchmark_result,
+                         benchmark, test_config=myconfig)
+            my_file.close()
+
+    return group_results, group_failure_counts, bench_results
+
+
+def run_pool_size(testsets):
+    """ Connection pool size for a run: the largest any testset needs """
+    return max([DEFAULT_POOL_SIZE] + [t.config.connection_pool_size for t in testsets] +
+               [t.config.parallel_workers for t in testsets if t.config.test_parallel] +
+               [b.worker_count() for t in testsets for b in t.benchmarks])
+
+
+# Per-process state for sharded runs, set up before the worker processes fork
+SHARD_STATE = dict()
+
+
+def _init_shard_process():
+    """ Process pool initializer: each worker process gets its own connections """
+    testsets = SHARD_STATE['testsets']
+    pool_size = run_pool_size(testsets)
+    SHARD_STATE['connection_pool'] = ConnectionPool(pool_size=pool_size)
+    SHARD_STATE['engine'] = None
+    if [t for t in testsets if t.config.engine == u'asyncio']:
+        SHARD_STATE['engine'] = asyncio_engine.AsyncioEngine(
+            pool_size=pool_size, connection_pool=SHARD_STATE['connection_pool'])
+
+
+def portable_result(result):
+    """ Copy of a TestResponse that can be pickled back from a worker process
+        Drops the test object and validator references, which may hold lambdas """
+    output = TestResponse()
+    output.response_code = result.response_code
+    output.passed = result.passed
+    output.response_headers = result.response_headers
+    output.failures = [Failure(message=failure.message, details=failure.details,
+                               failure_type=failure.failure_type)
+                       for failure in result.failures]
+    return output
+
+
+def _run_testset_shard(index):
+    """ Worker process task: run one testset, return picklable results """
+    group_results, group_failure_counts, bench_results = run_testset(
+        SHARD_STATE['testsets'][index], SHARD_STATE['connection_pool'],
+        engine=SHARD_STATE['engine'], curl_handle=requests.Request())
+    for group, results in group_results.items():
+        group_results[group] = [portable_result(result) for result in results]
+    return group_results, group_failure_counts, bench_results
+
+
+def run_testsets_sharded(testsets, processes):
+    """ Run testsets on a pool of worker processes, returning each testset's results in order
+        Processes are forked, so parsed tests, generators and extensions carry over as-is """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        LOGGER.warning("Process sharding needs fork(), running testsets in this process")
+        return None
+
+    SHARD_STATE.clear()
+    SHARD_STATE['testsets'] = testsets
+    process_pool = multiprocessing.get_context('fork').Pool(
+        processes=processes, initializer=_init_shard_process)
+    try:
+        return process_pool.map(_run_testset_shard, range(0, len(testsets)), chunksize=1)
+    finally:
+        process_pool.close()
+        process_pool.join()
+        SHARD_STATE.clear()
+
+
+def run_testsets(testsets, processes=None, baseline=None,
+                 threshold=comparison.DEFAULT_THRESHOLD, metrics_exporter=None):
+    """ Execute a set of tests, using given TestSet list input
+        With processes > 1, testsets are spread across that many worker processes
+        With metrics_exporter, a MetricsExporter, benchmarks export their totals as they run,
+        unless sharded across processes
+        With baseline, a list of earlier benchmark results, benchmarks are compared against it:
+        regressions beyond threshold count as failures, see comparison """
     group_results = dict()  # results, by group
     group_failure_counts = dict()
     total_failures = 0
@@ -677,102 +1264,69 @@ def run_testsets(testsets):
     myinteractive = False
     curl_handle = requests.Request()
 
+    # Testsets run in order until one without tests: probably just imports.. stop there
+    runnable = list()
+    mytests = list()
+    myconfig = TestConfig()
     for testset in testsets:
         mytests = testset.tests
         myconfig = testset.config
-        mybenchmarks = testset.benchmarks
-        context = Context()
-
-        # Bind variables & add generators if pertinent
-        if myconfig.variable_binds:
-            context.bind_variables(myconfig.variable_binds)
-        if myconfig.generators:
-            for key, value in myconfig.generators.items():
-                context.add_generator(key, value)
-
-        # Make sure we actually have tests to execute
-        if not mytests and not mybenchmarks:
-            # no tests in this test set, probably just imports.. skip to next
-            # test set
+        if not mytests and not testset.benchmarks:
             break
-
+        runnable.append(testset)
         myinteractive = True if myinteractive or myconfig.interactive else False
 
-        # Run tests, collecting statistics as needed
-        for test in mytests:
-            # Initialize the dictionaries to store test fail counts and results
-            if test.group not in group_results:
-                group_results[test.group] = list()
-                group_failure_counts[test.group] = 0
-
-            result = run_test(test, test_config=myconfig, context=context, curl_handle=curl_handle)
-            result.body = None  # Remove the body, save some memory!
-
-            if not result.passed:  # Print failure, increase failure counts for that test group
-                # Use result test URL to allow for templating
-                LOGGER.error('Test Failed: ' + test.name + " URL=" + result.test.url +
-                             " Group=" + test.group +
-                             " HTTP Status Code: " + str(result.response_code))
-
-                # Print test failure reasons
-                if result.failures:
-                    for failure in result.failures:
-                        log_failure(failure, context=context,
-                                    test_config=myconfig)
-
-                # Increment test failure counts for that group (adding an entry
-                # if not present)
-                failures = group_failure_counts[test.group]
-                failures = failures + 1
-                group_failure_counts[test.group] = failures
-
-            else:  # Test passed, print results
-                LOGGER.info('Test Succeeded: ' + test.name +
-                            " URL=" + test.url + " Group=" + test.group)
-
-            # Add results for this test group to the resultset
-            group_results[test.group].append(result)
-
-            # handle stop_on_failure flag
-            if not result.passed and test.stop_on_failure is not None and test.stop_on_failure:
-                LOGGER.error(
-                    'STOP ON FAILURE! stopping test set execution, continuing with other test sets')
-                break
-
-        for benchmark in mybenchmarks:  # Run benchmarks, analyze, write
-            # Initialize the dictionaries to store test fail counts and results
-            if benchmark.name not in bench_results:
-                bench_results[benchmark.name] = []
-
-            if not benchmark.metrics:
-                LOGGER.debug('Skipping benchmark, no metrics to collect')
-                continue
-
-            LOGGER.info("Benchmark Starting: " + benchmark.name +
-                        " Group: " + benchmark.group)
-            benchmark_result = run_benchmark(
-                benchmark, myconfig, context=context)
-            LOGGER.info(benchmark_result)
-            LOGGER.info("Benchmark Done: " + benchmark.name +
-                        " Group: " + benchmark.group)
-            # Add results for this test group to the result set
-            bench_results[benchmark.name].append(json.dumps(benchmark_result, default=safe_to_json))
-
-            if benchmark.output_file:  # Write file
-                LOGGER.debug(
-                    'Writing benchmark to file in format: ' + benchmark.output_format)
-                write_method = OUTPUT_METHODS[benchmark.output_format]
-                my_file = open(benchmark.output_file, 'w')  # Overwrites file
-                LOGGER.debug("Benchmark writing to file: " +
-                             benchmark.output_file)
-                write_method(my_file, benchmark_result,
-                             benchmark, test_config=myconfig)
-                my_file.close()
+    testset_results = None
+    if processes and processes > 1 and runnable:
+        if myinteractive:
+            LOGGER.warning("Interactive mode can't be sharded, running testsets in this process")
+        else:
+            if metrics_exporter is not None:
+                LOGGER.warning("Benchmark metrics aren't exported from sharded testsets")
+            testset_results = run_testsets_sharded(runnable, processes)
+
+    if testset_results is None:
+        # One pool for the whole run, so connections survive from test to test and set to set
+        pool_size = run_pool_size(runnable)
+        connection_pool = ConnectionPool(pool_size=pool_size)
+        engine = None  # Event loop engine, only started if a testset asks for it
+        if [t for t in runnable if t.config.engine == u'asyncio']:
+            engine = asyncio_engine.AsyncioEngine(
+                pool_size=pool_size, connection_pool=connection_pool)
+
+        testset_results = [run_testset(testset, connection_pool, engine=engine,
+                                       curl_handle=curl_handle,
+                                       metrics_exporter=metrics_exporter)
+                           for testset in runnable]
+
+        if engine is not None:
+            engine.close()
+        connection_pool.close()
+
+    # Merge per-testset results, in testset order
+    for set_results, set_failure_counts, set_bench_results in testset_results:
+        for group, results in set_results.items():
+            group_results.setdefault(group, list()).extend(results)
+            group_failure_counts[group] = \
+                group_failure_counts.get(group, 0) + set_failure_counts[group]
+        for name, results in set_bench_results.items():
+            bench_results.setdefault(name, list()).extend(results)
 
     if myinteractive:
         # a break for when interactive bits are complete, before summary data
         LOGGER.debug("===================================")
 
+    regressed = 0
+    if baseline is not None:
+        current = [json.loads(result) for name in sorted(bench_results.keys())
+                   for result in bench_results[name]]
+        changes = comparison.compare_results(baseline, current, threshold)
+        comparison.write_changes(sys.stdout, changes)
+        regressed = len(comparison.regressions(changes))
+        if regressed:
+            LOGGER.error("{0} benchmark aggregates regressed against the baseline".format(
+                regressed))
+
     # Print summary results
     for group in sorted(group_results.keys()):
         test_count = len(group_results[group])
@@ -791,6 +1345,8 @@ def run_testsets(testsets):
             else:
                 LOGGER.info('\033[92m' + output_string + '\033[0m')
 
+    if baseline is not None:
+        return total_failures + regressed
     if not mytests:
         return bench_results
     else:
@@ -854,6 +1410,15 @@ except ImportError as import_error:
         "if you wish to use jmespath extractor. {}". format(import_error))
 
 
+# Imported last: the engine and distributed modules use the functions above
+if __name__ == '__main__':
+    from pyresttest import asyncio_engine
+    from pyresttest import distributed
+else:
+    from . import asyncio_engine
+    from . import distributed
+
+
 def main(args):
     """
     Execute a test against the given base url.
@@ -870,6 +1435,17 @@ def main(args):
         absolute_urls - OPTIONAL - mode that treats URLs in tests as absolute/full URLs
                                     instead of relative URLs
         skip_term_colors - OPTIONAL - mode that turn off the output term colors
+        engine        - OPTIONAL - execution engine {requests,asyncio} (default=requests)
+        profile_client - OPTIONAL - time pyresttest's own work in each phase of a request
+        processes     - OPTIONAL - number of worker processes to spread test sets across
+        workers       - OPTIONAL - comma-separated host:port of --worker processes to
+                                    spread benchmarks across
+        authkey       - OPTIONAL - key shared with the workers (default from PYRESTTEST_AUTHKEY)
+        baseline      - OPTIONAL - JSON benchmark results to compare benchmarks against,
+                                    exiting non-zero if they regressed
+        regression_threshold - OPTIONAL - relative change counted as a regression (default 10%)
+        metrics_port  - OPTIONAL - serve live benchmark metrics for Prometheus on this port
+        metrics_file  - OPTIONAL - write live benchmark metrics to this Prometheus textfile
     """
 
     if 'log' in args and args['log'] is not None:
@@ -925,8 +1501,43 @@ def main(args):
         if 'skip_term_colors' in args and args['skip_term_colors'] is not None:
             test.config.skip_term_colors = safe_to_bool(args['skip_term_colors'])
 
+        if 'engine' in args and args['engine'] is not None:
+            test.config.engine = args['engine']
+
+        if 'profile_client' in args and args['profile_client']:
+            test.config.profile_client = True
+
+        if 'workers' in args and args['workers'] is not None:
+            test.config.workers = [distributed.parse_address(address)
+                                   for address in args['workers'].split(',') if address.strip()]
+            test.config.authkey = distributed.parse_authkey(args.get('authkey'))
+
+    processes = None
+    if 'processes' in args and args['processes'] is not None:
+        processes = int(args['processes'])
+
+    baseline = None
+    threshold = comparison.DEFAULT_THRESHOLD
+    if 'baseline' in args and args['baseline'] is not None:
+        baseline = comparison.load_results(args['baseline'])
+    if 'regression_threshold' in args and args['regression_threshold'] is not None:
+        threshold = benchmarks.parse_tolerance(args['regression_threshold'])
+
+    metrics_exporter = None
+    if 'metrics_port' in args and args['metrics_port'] is not None:
+        metrics_exporter = exporter.MetricsExporter()
+        metrics_exporter.serve(int(args['metrics_port']))
+    if 'metrics_file' in args and args['metrics_file'] is not None:
+        metrics_exporter = metrics_exporter or exporter.MetricsExporter()
+        metrics_exporter.start_textfile(args['metrics_file'])
+
     # Execute all testsets
-    failures = run_testsets(tests)
+    try:
+        failures = run_testsets(tests, processes=processes, baseline=baseline,
+                                threshold=threshold, metrics_exporter=metrics_exporter)
+    finally:
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
     sys.exit(failures)
 
 
@@ -971,6 +1582,46 @@ def parse_command_line_args(args_in):
     parser.add_option(u'--skip_term_colors',
                       help='Turn off the output term colors',
                       action='store_true', default=False, dest="skip_term_colors")
+    parser.add_option(u'--engine',
+                      help='Execution engine: requests (default) or asyncio',
+                      action='store', type='choice', choices=ENGINES, dest='engine')
+    parser.add_option(u'--profile-client',
+                      help='Time pyresttest\'s own work in each phase of a request, '
+                           'to tell client overhead from server latency',
+                      action='store_true', dest='profile_client')
+    parser.add_option(u'--baseline',
+                      help='JSON benchmark results to compare benchmarks against, '
+                           'exiting non-zero if they regressed',
+                      action='store', type='string', dest='baseline')
+    parser.add_option(u'--regression-threshold',
+                      help='Relative change, such as 10%, beyond which a worse benchmark '
+                           'aggregate is a regression (default 10%)',
+                      action='store', type='string', dest='regression_threshold')
+    parser.add_option(u'--metrics-port',
+                      help='Serve live benchmark metrics for Prometheus to scrape, '
+                           'at /metrics on this port',
+                      action='store', type='int', dest='metrics_port')
+    parser.add_option(u'--metrics-file',
+                      help='Write live benchmark metrics in the Prometheus text format to '
+                           'this file, such as for the node_exporter textfile collector',
+                      action='store', type='string', dest='metrics_file')
+    parser.add_option(u'--processes',
+                      help='Spread test sets across this many worker processes',
+                      action='store', type='int', dest='processes')
+    parser.add_option(u'--workers',
+                      help='Spread benchmarks across the --worker processes at these '
+                           'comma-separated host:port addresses',
+                      action='store', type='string', dest='workers')
+    parser.add_option(u'--worker',
+                      help='Run as a worker process for distributed benchmarks',
+                      action='store_true', default=False, dest='worker')
+    parser.add_option(u'--listen',
+                      help='host:port for a worker to listen on (default 127.0.0.1:7357)',
+                      action='store', type='string', dest='listen')
+    parser.add_option(u'--authkey',
+                      help='Key shared between workers and the coordinator '
+                           '(default from the PYRESTTEST_AUTHKEY environment variable)',
+                      action='store', type='string', dest='authkey')
     parser.add_option(u'--oci-signature',
                       help='Disable the OCI client signature',
                       action='store_true', default=True, dest='oci_sig')
@@ -979,7 +1630,9 @@ def parse_command_line_args(args_in):
     args = vars(args)
 
     # Handle url/test as named, or, failing that, positional arguments
-    if not args['url'] or not args['test']:
+    if args['worker']:
+        pass  # Workers are sent everything they need
+    elif not args['url'] or not args['test']:
         if len(unparsed_args) == 2:
             args[u'url'] = unparsed_args[0]
             args[u'test'] = unparsed_args[1]
@@ -1001,7 +1654,13 @@ def parse_command_line_args(args_in):
 def command_line_run(args_in):
     """ collects command line string """
     args = parse_command_line_args(args_in)
-    main(args)
+    if args['worker']:
+        if args['log'] is not None:
+            LOGGER.setLevel(LOGGING_LEVELS.get(args['log'].lower(), logging.NOTSET))
+        distributed.serve_worker(distributed.parse_address(args['listen'] or ''),
+                                 authkey=distributed.parse_authkey(args['authkey']))
+    else:
+        main(args)
 
 
 # Allow import into another module without executing the main method
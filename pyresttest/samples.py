@@ -0,0 +1,82 @@
+"""
+Typed storage for the raw values of benchmark metrics
+- Values are kept in an array of doubles rather than a list of float objects
+- Missing values (a metric the transport could not measure) are stored as NaN
+- With NumPy installed the array is shared with NumPy without copying, for vectorized
+    aggregation, see benchmarks.aggregate_all.  Without it, aggregation is pure Python.
+"""
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MISSING = float('nan')
+
+
+class Samples(object):
+    """ Raw values of one metric, in recording order, list-like """
+
+    def __init__(self, values=()):
+        self.values = array('d')
+        self.extend(values)
+
+    def append(self, value):
+        if value is None:
+            value = MISSING
+        try:
+            self.values.append(value)
+        except TypeError:
+            raise TypeError("Raw metric values must be numbers, got {0!r}".format(value))
+
+    def extend(self, values):
+        if isinstance(values, Samples):
+            self.values.extend(values.values)
+        else:
+            for value in values:
+                self.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        if math.isnan(value):
+            return None
+        return value
+
+    def __iter__(self):
+        for index in range(0, len(self.values)):
+            yield self[index]
+
+    def __eq__(self, other):
+        """ Equal to Samples or a list with the same values """
+        if isinstance(other, (Samples, list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Samples({0!r})'.format(self.tolist())
+
+    def tolist(self):
+        """ Values as a list, missing ones as None """
+        return list(self)
+
+    def present(self):
+        """ List of the values that were measured """
+        return [x for x in self.values if not math.isnan(x)]
+
+    def as_numpy(self):
+        """ NumPy array of the values that were measured, requires NumPy """
+        values = numpy.frombuffer(self.values, dtype=numpy.float64)
+        return values[~numpy.isnan(values)]
@@ -0,0 +1,57 @@
+import random
+import unittest
+
+from .accumulators import *
+from .benchmarks import AGGREGATES, std_deviation
+
+
+class AccumulatorsTest(unittest.TestCase):
+    """ Tests for single-pass aggregates """
+
+    def test_matches_aggregates(self):
+        """ Running aggregates match those computed over the stored values """
+        rand = random.Random(7)
+        values = [rand.uniform(0.001, 2.0) for x in range(0, 1000)]
+        accumulator = Accumulator()
+        for value in values:
+            accumulator.record(value)
+        self.assertEqual(1000, len(accumulator))
+        self.assertAlmostEqual(AGGREGATES['mean'](values), accumulator.mean())
+        self.assertAlmostEqual(std_deviation(values), accumulator.std_deviation())
+        self.assertAlmostEqual(AGGREGATES['mean_harmonic'](values), accumulator.mean_harmonic())
+        self.assertAlmostEqual(sum(values), accumulator.total)
+        self.assertEqual((min(values), max(values)), (accumulator.min, accumulator.max))
+
+    def test_merge(self):
+        """ Merged accumulators give the same results as one that saw every value """
+        values = [2, 4, 4, 4, 5, 5, 7, 9]
+        whole = Accumulator()
+        parts = [Accumulator(), Accumulator(), Accumulator()]
+        for index, value in enumerate(values):
+            whole.record(value)
+            parts[index % 2].record(value)
+        merged = Accumulator()
+        for part in parts:
+            merged.merge(part)
+        self.assertEqual(8, merged.count)
+        self.assertAlmostEqual(2.0, merged.std_deviation())
+        self.assertAlmostEqual(whole.mean(), merged.mean())
+        self.assertEqual((2, 9), (merged.min, merged.max))
+
+    def test_record_count(self):
+        repeated = Accumulator()
+        repeated.record(3, count=2)
+        repeated.record(1)
+        self.assertAlmostEqual(std_deviation([3, 3, 1]), repeated.std_deviation())
+
+    def test_empty_and_zero(self):
+        self.assertEqual(None, Accumulator().mean())
+        self.assertEqual(0, Accumulator().std_deviation())
+        accumulator = Accumulator()
+        accumulator.record(0)
+        accumulator.record(2)
+        self.assertEqual(0.0, accumulator.mean_harmonic())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import json
+import threading
+import unittest
+
+from .six.moves import BaseHTTPServer
+from .six.moves import socketserver
+
+from . import asyncio_engine
+from .asyncio_engine import *
+from . import resttest
+from .tests import Test
+from .benchmarks import Benchmark, BenchmarkStage, PrecisionTarget, CORRECTED_TOTAL_TIME
+
+
+class JsonHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Returns the request path as JSON, or a 503 for /fail """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(503 if self.path.startswith('/fail') else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Concurrent requests each hold their own keep-alive connection """
+    daemon_threads = True
+
+
+class AsyncioEngineTest(unittest.TestCase):
+    """ Tests for the asyncio execution engine, with and without aiohttp """
+
+    def setUp(self):
+        self.server = ThreadedServer(('127.0.0.1', 0), JsonHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.saved_aiohttp = asyncio_engine.aiohttp
+
+    def tearDown(self):
+        asyncio_engine.aiohttp = self.saved_aiohttp
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_tests(self):
+        """ Extract from one test, template it into the next, then fail and stop """
+        first = Test.parse_test(self.url, {
+            'url': '/first', 'extract_binds': [{'path': {'jsonpath_mini': 'path'}}]})
+        second = Test.parse_test(self.url, {
+            'url': {'template': '/second$path'},
+            'validators': [{'compare': {'jsonpath_mini': 'path', 'expected': '/second/first'}}]})
+        stopper = Test.parse_test(self.url, {'url': '/fail', 'stop_on_failure': True})
+        never = Test.parse_test(self.url, {'url': '/never'})
+        return [first, second, stopper, never]
+
+    def check_run_tests(self, parallel):
+        config = resttest.TestConfig()
+        config.test_parallel = parallel
+        with AsyncioEngine() as engine:
+            results = engine.run_tests(self.make_tests(), config)
+        self.assertEqual(3, len(results))
+        self.assertEqual([True, True, False], [r.passed for r in results])
+        self.assertEqual(503, results[2].response_code)
+
+    def test_run_tests_aiohttp(self):
+        """ Serial and dependency-ordered concurrent runs over aiohttp """
+        if asyncio_engine.aiohttp is None:
+            raise unittest.SkipTest("aiohttp module absent")
+        self.check_run_tests(False)
+        self.check_run_tests(True)
+
+    def test_run_tests_thread_fallback(self):
+        """ Same results when requests are sent from the thread pool """
+        asyncio_engine.aiohttp = None
+        self.check_run_tests(False)
+        self.check_run_tests(True)
+
+    def test_run_benchmark(self):
+        """ Benchmarks produce metrics and aggregates on the event loop """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/bench'
+        benchmark.warmup_runs = 1
+        benchmark.benchmark_runs = 5
+        benchmark.add_metric('total_time').add_metric('total_time', 'mean')
+        with AsyncioEngine() as engine:
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual(5, len(result.results['total_time']))
+        self.assertEqual(1, len(result.aggregates))
+        self.assertEqual(0, result.failures)
+        self.assertEqual(1, result.warmup_runs)
+
+    def test_run_benchmark_concurrency(self):
+        """ Concurrent benchmark tasks split the runs and report throughput for each """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/bench'
+        benchmark.warmup_runs = 2
+        benchmark.benchmark_runs = 7
+        benchmark.concurrency = 3
+        benchmark.add_metric('total_time')
+        with AsyncioEngine() as engine:
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual(7, len(result.results['total_time']))
+        self.assertEqual(3, len(result.throughput['workers']))
+        self.assertTrue(result.throughput['combined'] > 0)
+
+    def test_run_benchmark_rate(self):
+        """ Open loop benchmarks keep to the schedule and report corrected latency """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/bench'
+        benchmark.warmup_runs = 0
+        benchmark.benchmark_runs = 5
+        benchmark.rate = 50
+        benchmark.add_metric('total_time').add_metric('total_time', 'mean')
+        with AsyncioEngine() as engine:
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual(5, len(result.results[CORRECTED_TOTAL_TIME]))
+        self.assertEqual(2, len(result.aggregates))
+        # Runs are due every 20ms, so the last cannot finish before 80ms in
+        self.assertTrue(result.throughput['combined'] < 5 / 0.08)
+
+    def test_run_benchmark_stages(self):
+        """ Stages run one after the other, for their duration """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/bench'
+        benchmark.warmup_runs = 0
+        benchmark.stages = [BenchmarkStage(duration=0.1, concurrency=2),
+                            BenchmarkStage(duration=0.1, rate=30)]
+        benchmark.add_metric('total_time', 'mean')
+        with AsyncioEngine() as engine:
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual(2, len(result.stages))
+        self.assertEqual(2, len(result.stages[0].throughput['workers']))
+        self.assertEqual(3, len(result.stages[1].throughput['workers']))
+        self.assertEqual(0, result.failures)
+
+    def test_run_benchmark_precision(self):
+        """ Precision targets cap the runs and are reported with the results """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/bench'
+        benchmark.warmup_runs = 0
+        benchmark.precision = PrecisionTarget(tolerance=0.0001, min_runs=3, max_runs=8)
+        benchmark.add_metric('total_time')
+        with AsyncioEngine() as engine:
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual(8, len(result.results['total_time']))
+        self.assertFalse(result.precision['reached'])
+        self.assertEqual(8, result.precision['runs'])
+
+    def test_benchmark_stream_aiohttp(self):
+        """ Streamed benchmark bodies are counted over aiohttp, not kept """
+        if asyncio_engine.aiohttp is None:
+            raise unittest.SkipTest("aiohttp module absent")
+        body_size = len(json.dumps({'path': '/stream'}))
+        with AsyncioEngine() as engine:
+            prepped = resttest.prepare_request(Test.parse_test(self.url, {'url': '/stream'}))
+            response = engine.loop.run_until_complete(
+                engine._send(prepped, resttest.TestConfig(), stream=True))
+            self.assertEqual(b'', response.content)
+            self.assertEqual(body_size, drain_response(response))
+            self.assertEqual(body_size, response.timings.downloaded)
+
+            benchmark = Benchmark()
+            benchmark.url = self.url + '/stream'
+            benchmark.warmup_runs = 0
+            benchmark.benchmark_runs = 2
+            benchmark.add_metric('size_download')
+            result = engine.run_benchmark(benchmark)
+        self.assertEqual([body_size, body_size], result.results['size_download'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,17 @@
+import datetime
+import errno
+import math
+import os
+import pickle
+import socket
+import ssl
+import tempfile
+import time
+import timeit
 import unittest
+
+import requests
+
 from . import benchmarks
 from .benchmarks import *
 
@@ -81,6 +94,29 @@ class BenchmarkTest(unittest.TestCase):
             value = function(array)
             self.assertTrue(isinstance(value, int) or isinstance(value, float))
 
+    def test_percentiles(self):
+        """ Percentiles by selection match the sorted values, nearest-rank """
+        array = [0.5, 0.1, 0.9, 0.3, 0.7, 0.2, 0.8, 0.4, 0.6, 1.0, 0.4]
+        ordered = sorted(array)
+        for percent in [0, 10, 25, 50, 90, 99, 100]:
+            rank = max(0, int(math.ceil(percent / 100.0 * len(array))) - 1)
+            self.assertEqual(ordered[rank], percentile(array, percent))
+        self.assertEqual(0.4, select(array, 3))
+        self.assertEqual(0.4, select(array, 4))
+        self.assertEqual((0.1, 1.0), (AGGREGATES['min'](array), AGGREGATES['max'](array)))
+        self.assertEqual(1.0, AGGREGATES['p99.9'](array))
+
+        self.assertEqual(99.5, percentile_of('percentile_99.5'))
+        self.assertEqual(None, percentile_of('percentile_101'))
+        self.assertEqual(None, percentile_of('percentile_x'))
+        self.assertEqual(0.8, aggregate_function('percentile_80')(array))
+        self.assertEqual(None, aggregate_function('p42'))
+
+        benchmark = Benchmark().add_metric('total_time', 'p99').add_metric(
+            'total_time', 'percentile_99.99')
+        self.assertEqual(['p99', 'percentile_99.99'], benchmark.aggregated_metrics['total_time'])
+        self.assertRaises(Exception, benchmark.add_metric, 'total_time', 'percentile_200')
+
     def test_add_metric(self):
         """ Test the add-metric method for benchmarks """
         benchmark_config = Benchmark()
@@ -112,6 +148,430 @@ class BenchmarkTest(unittest.TestCase):
         self.assertEqual(2, len(benchmark_config.raw_metrics))
         self.assertEqual(2, len(benchmark_config.aggregated_metrics.keys()))
 
+    def test_benchmark_concurrency(self):
+        """ Test parsing concurrency, which must be positive """
+        cfg = parse_benchmark('what', [{'concurrency': '4'}])
+        self.assertEqual(4, cfg.concurrency)
+        self.assertEqual(None, parse_benchmark('what', []).concurrency)
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'concurrency': 0}])
+
+    def test_benchmark_rate(self):
+        """ Test parsing rate, and the workers a rate implies """
+        cfg = parse_benchmark('what', [{'rate': '20.5'}])
+        self.assertEqual(20.5, cfg.rate)
+        self.assertEqual(DEFAULT_RATE_CONCURRENCY, cfg.worker_count())
+        cfg = parse_benchmark('what', [{'rate': 5}, {'concurrency': 2}])
+        self.assertEqual(2, cfg.worker_count())
+        self.assertEqual(1, Benchmark().worker_count())
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'rate': -1}])
+
+    def test_run_schedule(self):
+        """ Closed loop runs are due immediately, open loop ones at start + N/rate """
+        schedule = RunSchedule(2)
+        self.assertTrue(schedule.next_run() is not None)
+        self.assertTrue(schedule.next_run() is not None)
+        self.assertEqual(None, schedule.next_run())
+
+        schedule = RunSchedule(3, rate=4)
+        schedule.begin()
+        due = [schedule.next_run() for x in range(0, 3)]
+        self.assertEqual([0, 0.25, 0.5], [round(x - schedule.start, 6) for x in due])
+        self.assertEqual(None, schedule.next_run())
+
+    def test_parse_duration(self):
+        """ Durations are seconds, or carry an s/m/h suffix """
+        self.assertEqual(90, parse_duration(90))
+        self.assertEqual(1.5, parse_duration('1.5'))
+        self.assertEqual(1800, parse_duration('30m'))
+        self.assertEqual(7200, parse_duration(' 2H '))
+        self.assertEqual(5, parse_duration('5s'))
+        self.assertRaises(ValueError, parse_duration, 'soon')
+        self.assertRaises(ValueError, parse_duration, '0s')
+
+    def test_benchmark_stages(self):
+        """ Test parsing duration and staged load profiles """
+        cfg = parse_benchmark('what', [{'duration': '10m'}, {'concurrency': 3}])
+        self.assertEqual(600, cfg.duration)
+        stages = cfg.load_stages()
+        self.assertEqual(1, len(stages))
+        self.assertEqual(None, stages[0].runs)
+        self.assertEqual(3, stages[0].worker_count())
+
+        cfg = parse_benchmark('what', [{'stages': [
+            {'duration': '1m', 'concurrency': 2},
+            [{'duration': 300}, {'rate': 50}],
+            {'duration': '30s', 'rate': 10, 'concurrency': 64}]}])
+        self.assertEqual(3, len(cfg.load_stages()))
+        self.assertEqual([60, 300, 30], [x.duration for x in cfg.stages])
+        self.assertEqual([None, 50, 10], [x.rate for x in cfg.stages])
+        self.assertEqual(64, cfg.worker_count())
+
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'stages': []}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'stages': [{'concurrency': 2}]}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'stages': [{'duration': 5}]}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'stages': [{'duration': 5, 'rate': 1, 'runs': 4}]}])
+
+    def test_run_schedule_duration(self):
+        """ Schedules with a duration stop issuing runs once it is over """
+        schedule = RunSchedule(rate=10, duration=0.35)
+        schedule.begin()
+        self.assertEqual(4, len(list(iter(schedule.next_run, None))))
+
+        schedule = RunSchedule(duration=0.05)
+        schedule.begin()
+        self.assertTrue(schedule.next_run() is not None)
+        time.sleep(0.06)
+        self.assertEqual(None, schedule.next_run())
+
+    def test_benchmark_warmup_auto(self):
+        """ Test parsing automatic warmup settings """
+        cfg = parse_benchmark('what', [{'warmup': 'auto'}, {'warmup_tolerance': '2%'},
+                                       {'warmup_window': 5}, {'warmup_max_runs': '50'}])
+        self.assertTrue(cfg.warmup_auto)
+        self.assertEqual(0.02, cfg.warmup_tolerance)
+        schedule = cfg.warmup_schedule()
+        self.assertEqual(5, schedule.window)
+        self.assertEqual(50, schedule.runs)
+
+        cfg = parse_benchmark('what', [{'warmup': 3}])
+        self.assertFalse(cfg.warmup_auto)
+        self.assertEqual(3, cfg.warmup_schedule().runs)
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'warmup_tolerance': 'x'}])
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'warmup_window': 0}])
+
+    def test_steady_state_schedule(self):
+        """ Warmup ends once two consecutive windows of total_time agree """
+        def response(seconds):
+            output = requests.Response()
+            output.elapsed = datetime.timedelta(seconds=seconds)
+            return output
+
+        schedule = SteadyStateSchedule(window=2, tolerance=0.1, max_runs=100)
+        timings = [1.0, 0.8, 0.5, 0.3, 0.2, 0.21, 0.2, 0.2, 0.2]
+        for seconds in timings:
+            if schedule.next_run() is None:
+                break
+            schedule.record(response(seconds))
+        self.assertTrue(schedule.stable)
+        self.assertEqual(8, schedule.issued)
+        self.assertEqual(None, schedule.next_run())
+
+        schedule = SteadyStateSchedule(window=2, tolerance=0.1, max_runs=5)
+        for seconds in timings:
+            if schedule.next_run() is None:
+                break
+            schedule.record(response(seconds))
+        self.assertFalse(schedule.stable)
+        self.assertEqual(5, schedule.issued)
+
+    def test_benchmark_precision(self):
+        """ Test parsing precision targets """
+        cfg = parse_benchmark('what', [{'precision': {
+            'metric': 'total_time', 'aggregate': 'Median', 'tolerance': '2%',
+            'confidence': '99%', 'min_runs': 10, 'max_runs': 500}}])
+        target = cfg.precision
+        self.assertEqual(('total_time', 'median', 0.02, 0.99, 10, 500),
+                         (target.metric, target.aggregate, target.tolerance,
+                          target.confidence, target.min_runs, target.max_runs))
+        self.assertEqual(500, cfg.load_stages()[0].runs)
+        self.assertTrue(isinstance(cfg.load_stages()[0].schedule(), PrecisionSchedule))
+
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'precision': {'aggregate': 'std_deviation'}}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'precision': {'metric': 'no_such_metric'}}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'precision': {'confidence': 1}}])
+        self.assertRaises(ValueError, parse_benchmark, 'what',
+                          [{'precision': {'min_runs': 10, 'max_runs': 5}}])
+
+    def test_z_score_without_normaldist(self):
+        """ Before Python 3.8, quantiles come from the approximation """
+        for p, expected in ((0.001, -3.090232306), (0.2, -0.841621234), (0.5, 0.0),
+                            (0.975, 1.959963985), (0.995, 2.575829304)):
+            self.assertTrue(math.fabs(inverse_normal_cdf(p) - expected) < 1e-8, p)
+        self.assertRaises(ValueError, inverse_normal_cdf, 1)
+
+        saved = benchmarks.NormalDist
+        benchmarks.NormalDist = None
+        try:
+            self.assertTrue(math.fabs(z_score(0.99) - 2.575829304) < 1e-8)
+        finally:
+            benchmarks.NormalDist = saved
+
+    def test_precision_schedule(self):
+        """ Runs stop once the interval is narrow enough, or at max_runs """
+        self.assertTrue(math.fabs(z_score(0.95) - 1.96) < 0.001)
+
+        def run(target, timings):
+            schedule = PrecisionSchedule(target)
+            for seconds in timings:
+                if schedule.next_run() is None:
+                    break
+                response = requests.Response()
+                response.elapsed = datetime.timedelta(seconds=seconds)
+                schedule.record(response)
+            return schedule
+
+        steady = [0.1, 0.1001, 0.0999] * 20
+        schedule = run(PrecisionTarget(tolerance=0.01, min_runs=5), steady)
+        self.assertTrue(schedule.reached)
+        self.assertEqual(5, schedule.count)
+        self.assertEqual(None, schedule.next_run())
+
+        noisy = [0.1, 1.0] * 30
+        schedule = run(PrecisionTarget(tolerance=0.01, min_runs=5, max_runs=20), noisy)
+        self.assertFalse(schedule.reached)
+        self.assertEqual(20, schedule.count)
+        self.assertEqual(20, schedule.summary()['runs'])
+
+        schedule = run(PrecisionTarget(aggregate='median', tolerance=0.01, min_runs=9), steady)
+        self.assertTrue(schedule.reached)
+        self.assertTrue(schedule.relative_width <= 0.01)
+
+    def test_recorder_take(self):
+        """ Taking from a recorder empties it, and what was taken pickles and merges back """
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        recorder = BenchmarkRecorder(['total_time'], open_loop=True, stage=2)
+        recorder.record(response, 0.75)
+        recorder.record_failure()
+        first = pickle.loads(pickle.dumps(recorder.take()))
+        self.assertEqual((1, 1, 2), (first.requests, first.failures, first.stage))
+        self.assertEqual(0, recorder.requests)
+
+        recorder.record(response)
+        recorder.elapsed = 3.0
+        first.merge(recorder.take())
+        self.assertEqual({'total_time': [0.5, 0.5], CORRECTED_TOTAL_TIME: [0.75, 0.5]},
+                         first.metric_results())
+        self.assertEqual(3.0, first.elapsed)
+
+    def test_recorder_corrected(self):
+        """ Open loop recorders also keep the latency from when each request was due """
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        recorder = BenchmarkRecorder(['total_time'], open_loop=True)
+        recorder.record(response, 0.75)
+        closed = BenchmarkRecorder(['total_time'])
+        closed.record(response, 0.75)
+        self.assertEqual({'total_time': [0.5], CORRECTED_TOTAL_TIME: [0.75]},
+                         recorder.metric_results())
+        self.assertEqual({'total_time': [0.5]}, closed.metric_results())
+        merged = BenchmarkRecorder(['total_time']).merge(recorder)
+        self.assertEqual([0.75], merged.metric_results()[CORRECTED_TOTAL_TIME])
+
+    def test_recorder_merge(self):
+        """ Worker recorders merge into one set of results, throughput stays per worker """
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        first = BenchmarkRecorder(['total_time', 'redirect_count'])
+        first.record(response)
+        first.record(response)
+        first.elapsed = 1.0
+        second = BenchmarkRecorder(['total_time', 'redirect_count'])
+        second.record(response)
+        second.record_failure()
+        second.elapsed = 2.0
+
+        summary = throughput_summary([first, second])
+        self.assertEqual([2.0, 0.5], summary['workers'])
+        self.assertTrue(math.fabs(summary['combined'] - 1.5) < 0.001)
+
+        merged = BenchmarkRecorder(first.metricnames).merge(first).merge(second)
+        self.assertEqual(3, merged.requests)
+        self.assertEqual(1, merged.failures)
+        self.assertEqual({'total_time': [0.5, 0.5, 0.5], 'redirect_count': [0, 0, 0]},
+                         merged.metric_results())
+        self.assertEqual(None, BenchmarkRecorder(['total_time']).throughput())
+
+    def test_timing_metrics(self):
+        """ Phase metrics are seconds from the start, redirects and the body count in total_time """
+        from .metric import RequestTimings
+        first = requests.Response()
+        first.timings = RequestTimings()
+        first.timings.start = 10.0
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        response.history = [first]
+        response.timings = RequestTimings()
+        response.timings.start = 10.25
+        response.timings.pretransfer = 10.5
+        response.timings.starttransfer = 11.0
+
+        self.assertEqual(0.0, METRICS['connect_time'](response))  # Connection reused
+        self.assertEqual(0.25, METRICS['pretransfer_time'](response))
+        self.assertEqual(0.75, METRICS['starttransfer_time'](response))
+        self.assertEqual(0.25, METRICS['redirect_time'](response))
+        self.assertEqual(0.5, METRICS['total_time'](response))  # Body not read yet
+        response.timings.end = 11.5
+        self.assertEqual(1.5, METRICS['total_time'](response))
+
+        plain = requests.Response()
+        plain.elapsed = datetime.timedelta(seconds=0.5)
+        self.assertEqual(None, METRICS['namelookup_time'](plain))
+        self.assertEqual(0.5, METRICS['total_time'](plain))
+
+        response.timings.connect = 10.3
+        response.timings.uploaded = 1000
+        response.timings.downloaded = 2000
+        response.timings.connects = 1
+        self.assertEqual(2000, METRICS['size_download'](response))
+        self.assertEqual(2000, METRICS['request_size'](response))
+        self.assertEqual(4000.0, METRICS['speed_download'](response))
+        self.assertAlmostEqual(5000.0, METRICS['speed_upload'](response))
+        self.assertEqual(1, METRICS['num_connects'](response))
+
+        recorder = BenchmarkRecorder(['namelookup_time', 'starttransfer_time'])
+        recorder.record(response)
+        self.assertEqual([0.75], recorder.metric_results()['starttransfer_time'])
+
+    def test_recorder_histograms(self):
+        """ Timing metrics not wanted raw go into histograms, aggregates come from them """
+        from .histogram import Histogram
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        recorder = BenchmarkRecorder(['total_time', 'redirect_count', 'connect_time'],
+                                     open_loop=True, raw_metrics=['connect_time'])
+        recorder.record(response)
+        recorder.record(response, 1.0)
+        results = recorder.metric_results()
+        self.assertTrue(isinstance(results['total_time'], Histogram))
+        self.assertTrue(isinstance(results[CORRECTED_TOTAL_TIME], Histogram))
+        self.assertEqual(0, results['redirect_count'].max)  # Aggregates unknown, so any
+        self.assertEqual([None, None], results['connect_time'])
+
+        merged = BenchmarkRecorder(recorder.metricnames, raw_metrics=recorder.raw_metrics)
+        merged.merge(recorder).merge(pickle.loads(pickle.dumps(recorder.take())))
+        results = merged.metric_results()
+        self.assertEqual(4, len(results['total_time']))
+        self.assertEqual(1.0, results[CORRECTED_TOTAL_TIME].max)
+        self.assertEqual(0.5, HISTOGRAM_AGGREGATES['median'](results['total_time']))
+        self.assertEqual(0.75, HISTOGRAM_AGGREGATES['mean'](results[CORRECTED_TOTAL_TIME]))
+        self.assertEqual(1.0, aggregate_function('percentile_75', results[CORRECTED_TOTAL_TIME])(
+            results[CORRECTED_TOTAL_TIME]))
+        self.assertEqual(0.5, HISTOGRAM_AGGREGATES['min'](results[CORRECTED_TOTAL_TIME]))
+
+    def test_recorder_accumulators(self):
+        """ Metrics whose aggregates need no distribution keep only running totals """
+        from .accumulators import Accumulator
+        from .histogram import Histogram
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        benchmark = Benchmark()
+        benchmark.add_metric('redirect_count', 'mean').add_metric('redirect_count', 'max')
+        benchmark.add_metric('num_connects', 'p99')
+        benchmark.add_metric('total_time', 'std_deviation')
+        recorder = BenchmarkRecorder(benchmark.metrics, raw_metrics=benchmark.raw_metrics,
+                                     aggregated_metrics=benchmark.aggregated_metrics)
+        recorder.record(response)
+        results = recorder.metric_results()
+        self.assertEqual(Accumulator, type(results['redirect_count']))
+        self.assertEqual(Histogram, type(results['num_connects']))
+        self.assertEqual(0, len(results['num_connects']))  # No timings, nothing measured
+        self.assertEqual(Histogram, type(results['total_time']))
+        self.assertEqual(Accumulator, type(recorder.take().results[
+            recorder.metricnames.index('redirect_count')]))
+        self.assertEqual(None, aggregate_function('median', Accumulator()))
+        self.assertEqual(None, aggregate_function('percentile_50', Accumulator()))
+
+    def test_timeseries(self):
+        """ Responses and failures are counted in the interval they completed in """
+        response = requests.Response()
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        benchmark = parse_benchmark('what', [{'timeseries': '2s'}])
+        self.assertEqual(2.0, benchmark.timeseries_interval)
+        self.assertEqual(None, Benchmark().new_timeseries(0))
+        self.assertRaises(ValueError, parse_benchmark, 'what', [{'timeseries': '0'}])
+
+        # Started 5 seconds ago, so now is in the third interval
+        recorder = BenchmarkRecorder(['total_time'], raw_metrics=[],
+                                     timeseries=benchmark.new_timeseries(timeit.default_timer() - 5))
+        recorder.record(response)
+        recorder.record_failure()
+        other = recorder.empty_copy()
+        other.timeseries.origin = timeit.default_timer() - 1
+        other.record(response)
+        taken = recorder.take()
+        self.assertEqual(dict(), recorder.timeseries.buckets)
+
+        series = BenchmarkRecorder(['total_time'], raw_metrics=[]).merge(taken).merge(
+            pickle.loads(pickle.dumps(other))).timeseries.summary()
+        self.assertEqual([0.0, 2.0, 4.0], [x[u'start'] for x in series])
+        self.assertEqual([1, 0, 1], [x[u'requests'] for x in series])
+        self.assertEqual([0, 0, 1], [x[u'failures'] for x in series])
+        self.assertEqual([0.5, 0, 0.5], [x[u'throughput'] for x in series])
+        self.assertEqual([0.5, None, 0.5], [x[u'latency'][u'p99'] for x in series])
+
+    def test_error_class(self):
+        """ Errors are classified by what they wrap, as HTTP libraries raise their own """
+        self.assertEqual(u'timeout', error_class(socket.timeout('timed out')))
+        self.assertEqual(u'tls', error_class(ssl.SSLError(1, 'certificate verify failed')))
+        refused = OSError(errno.ECONNREFUSED, 'Connection refused')
+        self.assertEqual(u'connection_refused', error_class(refused))
+        self.assertEqual(u'connection_refused', error_class(
+            requests.exceptions.ConnectionError(Exception('Max retries', refused))))
+        wrapper = requests.exceptions.ConnectionError('Connection aborted')
+        wrapper.__cause__ = OSError(errno.ECONNRESET, 'Connection reset by peer')
+        self.assertEqual(u'connection_reset', error_class(wrapper))
+        self.assertEqual(u'other', error_class(ValueError('bad template')))
+
+    def test_recorder_outcomes(self):
+        """ Responses are counted by status code, failures by class of error """
+        ok = requests.Response()
+        ok.status_code = 200
+        ok.elapsed = datetime.timedelta(seconds=0.5)
+        unavailable = requests.Response()
+        unavailable.status_code = 503
+        unavailable.elapsed = datetime.timedelta(seconds=0.25)
+        recorder = BenchmarkRecorder(['total_time'], raw_metrics=[])
+        recorder.record(ok)
+        recorder.record(unavailable)
+        recorder.record_failure(socket.timeout('timed out'), 2.0)
+        other = pickle.loads(pickle.dumps(recorder.take()))
+        recorder.record(ok)
+        recorder.record_failure()
+        merged = other.merge(recorder)
+
+        statuses = dict((code, outcome.summary()) for code, outcome in merged.statuses.items())
+        self.assertEqual({200: 2, 503: 1}, dict((x, y[u'count']) for x, y in statuses.items()))
+        self.assertAlmostEqual(0.25, statuses[503][u'latency'][u'max'])
+        errors = dict((kind, outcome.summary()) for kind, outcome in merged.errors.items())
+        self.assertEqual({u'timeout': 1, u'other': 1},
+                         dict((x, y[u'count']) for x, y in errors.items()))
+        self.assertEqual(2.0, errors[u'timeout'][u'latency'][u'max'])
+        self.assertEqual(None, errors[u'other'][u'latency'][u'max'])
+
+    def test_binary_results(self):
+        """ Raw values are typed columns, memory-mapped back with the header """
+        handle, path = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        try:
+            with open(path, 'wb') as file_out:
+                write_binary_results(file_out, {u'total_time': [0.5, None, 1.25],
+                                                u'size_download': [10, None],
+                                                u'speed_download': []},
+                                     {u'name': u'bin'})
+            with read_binary_results(path) as results:
+                self.assertEqual({u'name': u'bin'}, results.header)
+                self.assertEqual([u'size_download', u'speed_download', u'total_time'],
+                                 list(results.columns.keys()))
+                self.assertEqual([10, -1], list(results.columns[u'size_download']))
+                self.assertEqual(0, len(results.columns[u'speed_download']))
+                total_time = results.columns[u'total_time']
+                self.assertEqual((0.5, 1.25), (total_time[0], total_time[2]))
+                self.assertTrue(math.isnan(total_time[1]))
+            self.assertRaises(ValueError, len, total_time)  # Unmapped
+
+            with open(path, 'wb') as file_out:
+                file_out.write(b'{"name": "json"}')
+            self.assertRaises(ValueError, read_binary_results, path)
+        finally:
+            os.remove(path)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,185 @@
+import io
+import json
+import math
+import os
+import tempfile
+import unittest
+
+from . import comparison
+from .comparison import *
+from . import resttest
+from .benchmarks import Benchmark, BenchmarkStage
+from .histogram import Histogram
+
+
+def result(name, mean, throughput=10.0, raw=None):
+    output = {u'name': name, u'aggregates': [[u'total_time', u'mean', mean],
+                                             [u'size_download', u'mean', 100]],
+              u'throughput': {u'combined': throughput, u'workers': [throughput]}}
+    if raw is not None:
+        output[u'results'] = {u'total_time': raw}
+    return output
+
+
+class ComparisonTest(unittest.TestCase):
+    """ Tests for comparing benchmark results against a baseline """
+
+    def test_mann_whitney_u(self):
+        self.assertAlmostEqual(0.01219, mann_whitney_u([1, 2, 3, 4, 5], [6, 7, 8, 9, 10]), 4)
+        self.assertTrue(mann_whitney_u([1, 3, 5, 7], [2, 4, 6, 8]) > 0.5)
+        self.assertEqual(1.0, mann_whitney_u([2, 2, 2], [2, 2]))
+        self.assertEqual(None, mann_whitney_u([], [1, 2]))
+
+    def test_compare_result(self):
+        """ Worse beyond the threshold is a regression, direction depends on the metric """
+        changes = compare_result(result('one', 1.0, 10.0), result('one', 1.5, 5.0))
+        self.assertEqual([(u'total_time', u'mean', REGRESSED),
+                          (u'size_download', u'mean', UNCHANGED),
+                          (u'throughput', u'combined', REGRESSED)],
+                         [(x.metric, x.aggregate, x.status) for x in changes])
+        self.assertAlmostEqual(0.5, changes[0].change)
+
+        changes = compare_result(result('one', 1.0), result('one', 1.05))
+        self.assertEqual([], regressions(changes))
+        changes = compare_result(result('one', 1.0), result('one', 0.5))
+        self.assertEqual(IMPROVED, changes[0].status)
+
+    def test_compare_significance(self):
+        """ With raw values, a change must also be statistically significant """
+        noisy = compare_result(result('one', 1.0, raw=[0.5, 1.5, 0.6, 1.4]),
+                               result('one', 1.2, raw=[0.4, 2.0, 0.7, 1.7]))
+        self.assertEqual(UNCHANGED, noisy[0].status)
+        self.assertTrue(noisy[0].p_value > DEFAULT_ALPHA)
+        steady = compare_result(result('one', 1.0, raw=[1.0] * 10 + [0.99] * 10),
+                                result('one', 1.2, raw=[1.2] * 10 + [1.21] * 10))
+        self.assertEqual(REGRESSED, steady[0].status)
+
+    def test_compare_results(self):
+        """ Results are matched by name, unmatched ones are skipped """
+        changes = compare_results([result('one', 1.0), result('two', 1.0)],
+                                  [result('two', 2.0), result('three', 1.0)], threshold=0.5)
+        self.assertEqual(set([u'two']), set(x.benchmark for x in changes))
+        self.assertEqual(1, len(regressions(changes)))
+
+        out = io.StringIO()
+        write_changes(out, changes)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual([u'benchmark', u'metric', u'aggregate', u'baseline', u'current',
+                          u'change', u'p-value', u'status'], lines[0].split())
+        self.assertEqual([u'two', u'total_time', u'mean', u'1', u'2', u'+100.0%', u'-',
+                          u'REGRESSED'], lines[1].split())
+
+    def test_load_results(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            with open(path, 'w') as file_out:
+                json.dump(result('one', 1.0), file_out)
+            self.assertEqual([u'one'], [x[u'name'] for x in load_results(path)])
+            with open(path, 'w') as file_out:
+                json.dump([result('one', 1.0), result('two', 1.0)], file_out)
+            self.assertEqual(2, len(load_results(path)))
+        finally:
+            os.remove(path)
+
+    def test_json_tokens(self):
+        """ Tokens split across chunks are put back together """
+        text = u'{"name": "a \\"b\\"", "x": [1, -2.5e-3, true, null, NaN], "y": {}}'
+        tokens = list(comparison._json_tokens(io.StringIO(text), chunk_size=3))
+        self.assertEqual([u'{', (u'name',), u':', (u'a "b"',), u',', (u'x',), u':', u'[',
+                          (1,), u',', (-0.0025,), u',', (True,), u',', (None,), u','],
+                         tokens[:16])
+        self.assertTrue(math.isnan(tokens[16][0]))
+        self.assertEqual([u']', u',', (u'y',), u':', u'{', u'}', u'}'], tokens[17:])
+
+    def test_read_json_summaries(self):
+        """ Raw values are streamed into histograms, the rest is read as is """
+        data = [dict(result('one', 0.2, raw=[0.1, 0.2, None, 0.3]),
+                     stages=[{u'results': {u'total_time': [5.0]}}]),
+                result('two', 1.0)]
+        summaries = read_json_summaries(io.StringIO(json.dumps(data)))
+        self.assertEqual([u'one', u'two'], [x.name for x in summaries])
+        histogram = summaries[0].raw[u'total_time']
+        self.assertEqual((3, 0.3), (histogram.count, histogram.max))
+        self.assertEqual(0.2, summaries[0].aggregates[(u'total_time', u'mean')])
+        self.assertEqual(10.0, summaries[1].throughput)
+        self.assertEqual(dict(), summaries[1].raw)
+
+        single = read_json_summaries(io.StringIO(json.dumps(result('one', 0.2, raw=[0.5]))))
+        self.assertEqual(1, single[0].raw[u'total_time'].count)
+
+    def test_read_csv_summaries(self):
+        """ CSV output is read section by section, stages are skipped """
+        output = resttest.BenchmarkResult()
+        output.name = u'csv'
+        output.results = {u'total_time': [0.1, 0.2], u'size_download': [10, 20]}
+        output.aggregates = [(u'total_time', u'mean', 0.15)]
+        output.throughput = {u'combined': 5.0, u'workers': [5.0]}
+        stage = resttest.BenchmarkResult()
+        stage.stage = BenchmarkStage(duration=1, rate=2)
+        stage.aggregates = [(u'total_time', u'mean', 9.0)]
+        output.stages = [stage]
+        out = io.StringIO()
+        resttest.write_benchmark_csv(out, output, Benchmark())
+        out.seek(0)
+
+        summary = read_csv_summaries(out)[0]
+        self.assertEqual(u'csv', summary.name)
+        self.assertEqual({(u'total_time', u'mean'): 0.15}, dict(summary.aggregates))
+        self.assertEqual(5.0, summary.throughput)
+        self.assertEqual(2, summary.raw[u'size_download'].count)
+        self.assertAlmostEqual(0.15, summary.raw[u'total_time'].mean())
+
+    def test_read_binary_summaries(self):
+        """ Binary output is recognized by its magic, missing values are skipped """
+        output = resttest.BenchmarkResult()
+        output.name = u'bin'
+        output.results = {u'total_time': [0.1, None, 0.3]}
+        output.aggregates = [(u'total_time', u'mean', 0.2)]
+        output.throughput = {u'combined': 5.0, u'workers': [5.0]}
+        handle, path = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        try:
+            with open(path, 'wb') as file_out:
+                resttest.write_benchmark_binary(file_out, output, Benchmark())
+            summary = read_summaries(path)[0]
+        finally:
+            os.remove(path)
+        self.assertEqual(u'bin', summary.name)
+        self.assertEqual({(u'total_time', u'mean'): 0.2}, dict(summary.aggregates))
+        self.assertEqual(5.0, summary.throughput)
+        self.assertEqual(2, summary.raw[u'total_time'].count)
+
+    def test_intervals(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.record(value / 1000.0)
+        mean, low, high = mean_interval(histogram, 1.96)
+        self.assertAlmostEqual(0.0505, mean)
+        self.assertTrue(low < mean < high)
+        value, low, high = percentile_interval(histogram, 50, 1.96)
+        for expected, actual in zip((0.05, 0.04, 0.06), (value, low, high)):
+            self.assertAlmostEqual(expected, actual, 4)
+        single = Histogram()
+        single.record(1.0)
+        self.assertEqual((1.0, None, None), mean_interval(single, 1.96))
+
+    def test_write_side_by_side(self):
+        """ Each file's values side by side, with the change from the first """
+        first = BenchmarkSummary(u'one')
+        first.aggregates[(u'total_time', u'mean')] = 1.0
+        second = BenchmarkSummary(u'renamed')
+        second.aggregates[(u'total_time', u'mean')] = 1.5
+        second.record(u'total_time', 1.5)
+        out = io.StringIO()
+        write_side_by_side(out, [[first], [second]], [u'a.json', u'b.csv'])
+        lines = out.getvalue().splitlines()
+        self.assertEqual([u'benchmark', u'metric', u'statistic', u'a.json', u'b.csv', u'change'],
+                         lines[0].split())
+        self.assertEqual([u'one', u'total_time', u'mean', u'1', u'1.5', u'+50.0%'],
+                         lines[1].split())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import socket
+import threading
+import unittest
+
+from .six.moves import BaseHTTPServer
+from .six.moves import socketserver
+
+from . import connections
+from .connections import *
+
+
+class CountingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Keep-alive handler that sets a cookie and echoes back any cookie it received """
+    protocol_version = 'HTTP/1.1'
+    connections_opened = 0
+
+    def setup(self):
+        CountingHandler.connections_opened = CountingHandler.connections_opened + 1
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length')))
+        self.do_GET()
+
+    def do_GET(self):
+        body = (self.headers.get('Cookie') or 'none').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'visited=yes')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ConnectionsTest(unittest.TestCase):
+    """ Tests for the shared connection pool """
+
+    def setUp(self):
+        CountingHandler.connections_opened = 0
+        self.server = ThreadedServer(('127.0.0.1', 0), CountingHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sessions_share_connections(self):
+        """ Sessions from one pool reuse the connection but keep separate cookies """
+        with ConnectionPool(pool_size=2) as pool:
+            for x in range(0, 3):
+                response = pool.session().get(self.url)
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(b'none', response.content)  # No cookie carried over
+        self.assertEqual(1, CountingHandler.connections_opened)
+
+    def test_drain_response(self):
+        """ Draining a streamed body returns its size and releases the connection """
+        with ConnectionPool() as pool:
+            for x in range(0, 2):
+                response = pool.session().get(self.url, stream=True)
+                self.assertEqual(4, drain_response(response))
+        self.assertEqual(1, CountingHandler.connections_opened)
+
+    def test_request_timings(self):
+        """ Phases are timed in order, a reused connection skips lookup and connect """
+        url = self.url.replace('127.0.0.1', 'localhost')
+        with ConnectionPool() as pool:
+            response = pool.session().get(url, stream=True)
+            timings = response.timings
+            self.assertEqual(None, timings.end)
+            drain_response(response)
+            phases = [timings.start, timings.namelookup, timings.connect,
+                      timings.pretransfer, timings.starttransfer, timings.end]
+            self.assertEqual(sorted(phases), phases)
+            self.assertEqual(None, timings.appconnect)  # No TLS
+
+            timings = pool.session().get(url).timings  # Body read already
+            self.assertEqual(0.0, timings.since_start('connect'))
+            self.assertTrue(timings.start < timings.pretransfer < timings.end)
+
+    def test_request_timings_refused_address(self):
+        """ A refused address is skipped for the next, without resolving the host again """
+        port = self.server.server_address[1]
+        lookups = list()
+        original = connections.socket.getaddrinfo
+
+        def getaddrinfo(host, *args, **kwargs):
+            if host != 'pyresttest.invalid':
+                return original(host, *args, **kwargs)
+            lookups.append(host)
+            # Nothing listens on 127.0.0.2, so the first address is refused
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (ip, port))
+                    for ip in ('127.0.0.2', '127.0.0.1')]
+
+        connections.socket.getaddrinfo = getaddrinfo
+        try:
+            with ConnectionPool() as pool:
+                response = pool.session().get('http://pyresttest.invalid:{0}/'.format(port))
+        finally:
+            connections.socket.getaddrinfo = original
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['pyresttest.invalid'], lookups)
+        self.assertEqual(1, response.timings.connects)
+        self.assertTrue(response.timings.namelookup <= response.timings.connect)
+
+    def test_transfer_counts(self):
+        """ Bytes are counted as the body is drained, new connections per request """
+        with ConnectionPool() as pool:
+            response = pool.session().post(self.url, data=b'x' * 100, stream=True)
+            drain_response(response)
+            self.assertEqual((100, 4, 1), (response.timings.uploaded,
+                                           response.timings.downloaded,
+                                           response.timings.connects))
+            response = pool.session().get(self.url)
+            self.assertEqual((0, 4, 0), (response.timings.uploaded,
+                                         response.timings.downloaded,
+                                         response.timings.connects))
+
+    def test_invalid_pool_size(self):
+        """ Pool size must be positive """
+        self.assertRaises(ValueError, ConnectionPool, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import sys
+import threading
+import unittest
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+from .six import StringIO
+from .six.moves import BaseHTTPServer
+from .six.moves import socketserver
+
+from . import distributed
+from .distributed import *
+from . import resttest
+from .benchmarks import Benchmark, BenchmarkStage, PrecisionTarget
+
+
+class OkHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Empty 200 responses, 503 for /fail """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(503 if self.path.startswith('/fail') else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class DistributedTest(unittest.TestCase):
+    """ Tests for coordinator/worker benchmarks """
+
+    def test_parse_address(self):
+        self.assertEqual(('10.0.0.2', 9000), parse_address('10.0.0.2:9000'))
+        self.assertEqual(('loadgen', DEFAULT_WORKER_PORT), parse_address('loadgen'))
+        self.assertEqual((DEFAULT_WORKER_HOST, 9000), parse_address(':9000'))
+        self.assertEqual((DEFAULT_WORKER_HOST, DEFAULT_WORKER_PORT), parse_address(''))
+        self.assertRaises(ValueError, parse_address, 'host:port')
+
+    def test_benchmark_share(self):
+        """ Runs, rates and concurrency are divided, durations are not """
+        benchmark = Benchmark()
+        benchmark.benchmark_runs = 5
+        benchmark.concurrency = 3
+        benchmark.rate = 30
+        shares = [benchmark_share(benchmark, index, 2) for index in range(0, 2)]
+        self.assertEqual([3, 2], [x.benchmark_runs for x in shares])
+        self.assertEqual([2, 1], [x.concurrency for x in shares])
+        self.assertEqual([15, 15], [x.rate for x in shares])
+
+        benchmark.benchmark_runs = 1
+        self.assertEqual(None, benchmark_share(benchmark, 1, 2))
+
+        benchmark.stages = [BenchmarkStage(duration=60, rate=100),
+                            BenchmarkStage(duration=30, concurrency=1)]
+        share = benchmark_share(benchmark, 2, 4)
+        self.assertEqual([60, 30], [x.duration for x in share.stages])
+        self.assertEqual([25, None], [x.rate for x in share.stages])
+        self.assertEqual([None, 1], [x.concurrency for x in share.stages])
+        self.assertEqual(100, benchmark.stages[0].rate)
+
+        benchmark = Benchmark()
+        benchmark.precision = PrecisionTarget(min_runs=10, max_runs=100)
+        share = benchmark_share(benchmark, 0, 3)
+        self.assertEqual(34, share.precision.max_runs)
+        self.assertEqual(100, benchmark.precision.max_runs)
+
+    def test_merge_precision(self):
+        summary = {u'metric': u'total_time', u'aggregate': u'mean', u'tolerance': 0.02,
+                   u'confidence': 0.95, u'relative_width': 0.01, u'runs': 40, u'reached': True}
+        other = dict(summary, relative_width=0.03, runs=100, reached=False)
+        merged = merge_precision([summary, other])
+        self.assertEqual((0.03, 140, False), (merged[u'relative_width'], merged[u'runs'],
+                                              merged[u'reached']))
+        self.assertEqual(None, merge_precision([None]))
+
+    def test_worker_generates_key(self):
+        """ A worker started without a key prints the one it generates """
+        saved = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            serve_worker(('127.0.0.1', 0), connections=0)
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = saved
+        key = printed.strip().rsplit(' ', 1)[-1]
+        self.assertEqual(2 * AUTHKEY_BYTES, len(key))
+        self.assertNotEqual(generate_authkey(), generate_authkey())
+
+    def test_worker_rejects_without_key(self):
+        """ Clients without the worker's key never get a job run """
+        addresses = list()
+        ready = threading.Event()
+        served = list()
+
+        def started(address):
+            addresses.append(address)
+            ready.set()
+
+        saved = distributed._serve_connection
+        distributed._serve_connection = lambda conn: served.append(conn.recv())
+        worker = threading.Thread(target=serve_worker, args=(('127.0.0.1', 0), b'secret'),
+                                  kwargs={'connections': 1, 'ready': started})
+        worker.daemon = True
+        worker.start()
+        try:
+            self.assertTrue(ready.wait(10))
+            unkeyed = Client(addresses[0])
+            unkeyed.send((u'close',))  # Read as the answer to the worker's challenge
+            unkeyed.close()
+            self.assertRaises(AuthenticationError, Client, addresses[0], authkey=b'wrong')
+            self.assertTrue(worker.is_alive())
+
+            keyed = Client(addresses[0], authkey=b'secret')
+            keyed.send((u'close',))
+            keyed.close()
+            worker.join(10)
+            self.assertFalse(worker.is_alive())
+        finally:
+            distributed._serve_connection = saved
+        self.assertEqual([(u'close',)], served)
+
+    def test_run_job_last_take(self):
+        """ A run that ends while measurements are being sent still has them all sent """
+        finished = threading.Event()
+        runs = list()
+
+        class SlowTake(resttest.BenchmarkRecorder):
+            """ The first take lasts until the benchmark thread has ended """
+            def take(self):
+                taken = resttest.BenchmarkRecorder.take(self)
+                finished.wait(5)
+                runs[0].join(5)
+                return taken
+
+        class Conn(object):
+            def __init__(self):
+                self.sent = list()
+
+            def send(self, message):
+                self.sent.append(message)
+
+        def run_benchmark(benchmark, test_config, context, monitor=None):
+            runs.append(threading.current_thread())
+            recorder = SlowTake(['total_time'])
+            recorder.requests = 1
+            monitor(recorder)
+            finished.wait(5)
+            recorder.requests = recorder.requests + 1  # After the first take
+            recorder.elapsed = 1.0
+            return resttest.BenchmarkResult()
+
+        saved = (resttest.run_benchmark, distributed.STREAM_INTERVAL)
+        resttest.run_benchmark = run_benchmark
+        distributed.STREAM_INTERVAL = 0.01
+        conn = Conn()
+        timer = threading.Timer(0.1, finished.set)
+        timer.start()
+        try:
+            distributed._run_job(conn, Benchmark(), resttest.TestConfig(), None)
+        finally:
+            resttest.run_benchmark, distributed.STREAM_INTERVAL = saved
+            timer.cancel()
+        taken = [recorder for message in conn.sent if message[0] == u'samples'
+                 for key, recorder in message[1]]
+        self.assertEqual(2, sum(recorder.requests for recorder in taken))
+        self.assertEqual(1.0, sum(recorder.elapsed for recorder in taken))
+        self.assertEqual(u'done', conn.sent[-1][0])
+
+    def test_run_distributed_benchmark(self):
+        """ Two workers on localhost share the runs, the coordinator merges their results """
+        server = ThreadedServer(('127.0.0.1', 0), OkHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+
+        addresses = list()
+        ready = threading.Event()
+
+        def started(address):
+            addresses.append(address)
+            if len(addresses) == 2:
+                ready.set()
+
+        workers = [threading.Thread(target=serve_worker, args=(('127.0.0.1', 0), b'secret'),
+                                    kwargs={'connections': 1, 'ready': started})
+                   for x in range(0, 2)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            self.assertTrue(ready.wait(10))
+            benchmark = Benchmark()
+            benchmark.name = 'distributed'
+            benchmark.url = url + '/bench'
+            benchmark.warmup_runs = 1
+            benchmark.benchmark_runs = 7
+            benchmark.concurrency = 2
+            benchmark.add_metric('total_time').add_metric('total_time', 'mean')
+            result = run_distributed_benchmark(benchmark, resttest.TestConfig(), addresses,
+                                               authkey=b'secret')
+            self.assertEqual(7, len(result.results['total_time']))
+            self.assertEqual(0, result.failures)
+            self.assertEqual(2, result.warmup_runs)
+            self.assertEqual(2, len(result.throughput['workers']))
+            self.assertEqual(2, len(result.resources))
+            self.assertEqual(u'total_time', result.aggregates[0][0])
+            for worker in workers:
+                worker.join(10)
+                self.assertFalse(worker.is_alive())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
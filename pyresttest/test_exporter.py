@@ -0,0 +1,96 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from .exporter import *
+from .benchmarks import BenchmarkRecorder, SinkGroup
+
+
+def response(status, seconds):
+    response = requests.Response()
+    response.status_code = status
+    response.elapsed = datetime.timedelta(seconds=seconds)
+    response._content = b''
+    return response
+
+
+class ExporterTest(unittest.TestCase):
+    """ Tests for exporting live benchmark metrics """
+
+    def test_render(self):
+        """ Recorders feed the totals, rendered as counters and a cumulative histogram """
+        exporter = MetricsExporter(bounds=[0.5, 0.1])
+        metrics = exporter.benchmark(u'get "one"', u'Default')
+        recorder = BenchmarkRecorder([u'size_download'], stage=1)
+        metrics.monitor(recorder)
+        recorder.record(response(200, 0.05))
+        recorder.record(response(200, 0.2))
+        recorder.record(response(503, 1.0))
+        recorder.record_failure()
+
+        lines = exporter.render().splitlines()
+        labels = 'benchmark="get \\"one\\"",group="Default"'
+        for expected in ['pyresttest_benchmark_running{' + labels + '} 1',
+                         'pyresttest_benchmark_stage{' + labels + '} 1',
+                         'pyresttest_benchmark_requests_total{' + labels + ',status="200"} 2',
+                         'pyresttest_benchmark_requests_total{' + labels + ',status="503"} 1',
+                         'pyresttest_benchmark_failures_total{' + labels + ',error="other"} 1',
+                         'pyresttest_benchmark_latency_seconds_bucket{' + labels +
+                         ',le="0.1"} 1',
+                         'pyresttest_benchmark_latency_seconds_bucket{' + labels +
+                         ',le="0.5"} 2',
+                         'pyresttest_benchmark_latency_seconds_bucket{' + labels +
+                         ',le="+Inf"} 3',
+                         'pyresttest_benchmark_latency_seconds_sum{' + labels + '} 1.25',
+                         'pyresttest_benchmark_latency_seconds_count{' + labels + '} 3',
+                         '# TYPE pyresttest_benchmark_latency_seconds histogram']:
+            self.assertTrue(expected in lines, expected)
+
+        metrics.finish()
+        self.assertTrue('pyresttest_benchmark_running{' + labels + '} 0' in
+                        exporter.render().splitlines())
+        exporter.benchmark(u'get "one"', u'Default')  # Rerun starts again
+        self.assertFalse([x for x in exporter.render().splitlines() if 'status=' in x])
+
+    def test_add_sink(self):
+        """ A second sink joins the first rather than replacing it """
+        first = MetricsExporter().benchmark(u'one')
+        second = MetricsExporter().benchmark(u'two')
+        recorder = BenchmarkRecorder([u'total_time'])
+        first.monitor(recorder)
+        second.monitor(recorder)
+        self.assertTrue(isinstance(recorder.sink, SinkGroup))
+        recorder.record(response(200, 0.1))
+        self.assertEqual((1, 1), (first.latency_count, second.latency_count))
+
+    def test_serve_and_textfile(self):
+        exporter = MetricsExporter()
+        exporter.benchmark(u'served').sample(0, {u'total_time': 0.01}, 200)
+        address = exporter.serve(0, '127.0.0.1')
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'pyresttest.prom')
+        try:
+            exporter.start_textfile(path, interval=60)
+            scraped = requests.get('http://127.0.0.1:{0}/metrics'.format(address[1]))
+            self.assertEqual(200, scraped.status_code)
+            self.assertTrue(scraped.headers['Content-Type'].startswith('text/plain'))
+            self.assertEqual(exporter.render(), scraped.text)
+            self.assertEqual(404, requests.get(
+                'http://127.0.0.1:{0}/other'.format(address[1])).status_code)
+
+            exporter.benchmark(u'later').sample(0, {u'total_time': 0.01}, 200)
+            exporter.stop()  # Writes the final totals
+            with open(path) as file_in:
+                self.assertEqual(exporter.render(), file_in.read())
+            self.assertEqual(['pyresttest.prom'], os.listdir(directory))
+        finally:
+            exporter.stop()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
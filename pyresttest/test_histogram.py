@@ -0,0 +1,65 @@
+import math
+import pickle
+import random
+import unittest
+
+from .histogram import *
+
+
+class HistogramTest(unittest.TestCase):
+    """ Tests for log-bucketed histograms """
+
+    def test_small_values_exact(self):
+        """ Values below the first power of two range are counted exactly """
+        histogram = Histogram(unit=1)
+        for value in [1, 2, 2, 3, 1000]:
+            histogram.record(value)
+        self.assertEqual(5, len(histogram))
+        self.assertEqual(2, histogram.percentile(50))
+        self.assertEqual(1, histogram.percentile(0))
+        self.assertEqual(1000, histogram.percentile(100))
+        self.assertEqual(1008 / 5.0, histogram.mean())
+        self.assertEqual([(1, 1), (2, 2), (3, 1), (1000, 1)], list(histogram.buckets()))
+
+    def test_relative_precision(self):
+        """ Percentiles are within the precision of the sorted values, over a wide range """
+        rand = random.Random(42)
+        values = [rand.lognormvariate(-6, 2) for x in range(0, 20000)]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for percent in [1, 25, 50, 90, 99, 99.9]:
+            exact = values[int(math.ceil(percent / 100.0 * len(values))) - 1]
+            self.assertTrue(abs(histogram.percentile(percent) - exact) <=
+                            max(exact * 0.001, histogram.unit))
+        self.assertEqual(values[-1], histogram.max)
+        self.assertAlmostEqual(sum(values), histogram.total)
+
+    def test_merge(self):
+        first = Histogram()
+        second = Histogram()
+        for value in [0.001, 0.002]:
+            first.record(value)
+        second.record(1.5, count=2)
+        merged = Histogram().merge(first).merge(second)
+        self.assertEqual(4, merged.count)
+        self.assertEqual((0.001, 1.5), (merged.min, merged.max))
+        self.assertEqual(1.5, merged.percentile(75))
+        self.assertRaises(ValueError, merged.merge, Histogram(unit=1))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Histogram().record, -1)
+        self.assertRaises(ValueError, Histogram, 0)
+        self.assertEqual(None, Histogram().percentile(50))
+        self.assertEqual(None, Histogram().mean())
+
+    def test_pickle(self):
+        histogram = Histogram()
+        histogram.record(0.25)
+        copy = pickle.loads(pickle.dumps(histogram))
+        self.assertEqual(0.25, copy.percentile(50))
+
+
+if __name__ == '__main__':
+    unittest.main()
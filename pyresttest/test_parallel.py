@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+
+from . import parallel
+from .parallel import *
+from .tests import Test
+
+
+class FakeResult(object):
+    """ Stand-in for TestResponse, only passed matters to the scheduler """
+
+    def __init__(self, test, passed=True):
+        self.test = test
+        self.passed = passed
+
+
+class ParallelTest(unittest.TestCase):
+    """ Tests for dependency analysis and parallel test scheduling """
+
+    def test_template_names(self):
+        """ Both $var and ${var} forms are found, escaped $$ is not """
+        names = template_names('/api/$id/${name}/$$notvar')
+        self.assertEqual(set(['id', 'name']), names)
+        self.assertEqual(set(), template_names(None))
+
+    def test_variables_read_written(self):
+        """ Reads come from templates and validators, writes from binds """
+        test = Test.parse_test('', {
+            'url': {'template': '/api/person/$id/'},
+            'headers': {'template': {'X-Token': '$token'}},
+            'body': {'template': '{"login": "${login}"}'},
+            'validators': [{'compare': {'jsonpath_mini': 'id', 'expected': {'template': '$expected'}}}],
+            'generator_binds': {'login': 'gen'},
+            'extract_binds': [{'newid': {'jsonpath_mini': 'id'}}]
+        })
+        self.assertEqual(set(['id', 'token', 'login', 'expected']), variables_read(test))
+        self.assertEqual(set(['login', 'newid', ('generator', 'gen')]), variables_written(test))
+
+    def test_dependency_graph(self):
+        """ Extract -> template use creates an edge, unrelated tests do not """
+        create = Test.parse_test('', {'url': '/api/person/', 'method': 'POST',
+                                      'extract_binds': [{'id': {'jsonpath_mini': 'id'}}]})
+        unrelated = Test.parse_test('', {'url': '/api/other/'})
+        fetch = Test.parse_test('', {'url': {'template': '/api/person/$id/'}})
+        rebind = Test.parse_test('', {'url': '/api/person/', 'variable_binds': {'id': 7}})
+
+        graph = dependency_graph([create, unrelated, fetch, rebind])
+        self.assertEqual(set(), graph[0])
+        self.assertEqual(set(), graph[1])
+        self.assertEqual(set([0]), graph[2])
+        self.assertEqual(set([0, 2]), graph[3])  # Must not overwrite id before fetch reads it
+
+    def test_dependency_graph_generators_and_stop(self):
+        """ Shared generators are serialized, stop_on_failure blocks everything after it """
+        first = Test.parse_test('', {'url': '/a', 'generator_binds': {'a': 'ids'}})
+        second = Test.parse_test('', {'url': '/b', 'generator_binds': {'b': 'ids'}})
+        stopper = Test.parse_test('', {'url': '/c', 'stop_on_failure': True})
+        last = Test.parse_test('', {'url': '/d'})
+
+        graph = dependency_graph([first, second, stopper, last])
+        self.assertEqual(set([0]), graph[1])
+        self.assertEqual(set(), graph[2])
+        self.assertEqual(set([2]), graph[3])
+
+    def test_run_parallel_order_and_concurrency(self):
+        """ Independent tests overlap, results come back in test order """
+        tests = [Test.parse_test('', {'url': '/' + str(x), 'name': str(x)}) for x in range(0, 6)]
+        lock = threading.Lock()
+        active = [0, 0]  # current, maximum
+
+        def run_function(test):
+            with lock:
+                active[0] = active[0] + 1
+                active[1] = max(active)
+            time.sleep(0.05 if test.name == '0' else 0.01)
+            with lock:
+                active[0] = active[0] - 1
+            return FakeResult(test)
+
+        results = list(run_parallel(tests, run_function, workers=3))
+        self.assertEqual([t.name for t in tests], [r.test.name for r in results])
+        self.assertTrue(active[1] > 1)
+
+    def test_run_parallel_stop_on_failure(self):
+        """ Nothing after a failed stop_on_failure test is run """
+        tests = [Test.parse_test('', {'url': '/a', 'name': 'a'}),
+                 Test.parse_test('', {'url': '/b', 'name': 'b', 'stop_on_failure': True}),
+                 Test.parse_test('', {'url': '/c', 'name': 'c'})]
+        ran = list()
+
+        def run_function(test):
+            ran.append(test.name)
+            return FakeResult(test, passed=(test.name != 'b'))
+
+        results = list(run_parallel(tests, run_function, workers=2))
+        self.assertEqual(['a', 'b'], [r.test.name for r in results])
+        self.assertTrue('c' not in ran)
+
+    def test_run_parallel_exception(self):
+        """ Exceptions surface at the position of the test that raised them """
+        tests = [Test.parse_test('', {'url': '/a', 'name': 'a'}),
+                 Test.parse_test('', {'url': '/b', 'name': 'b'})]
+
+        def run_function(test):
+            if test.name == 'b':
+                raise ValueError('boom')
+            return FakeResult(test)
+
+        results = run_parallel(tests, run_function, workers=2)
+        self.assertEqual('a', next(results).test.name)
+        self.assertRaises(ValueError, next, results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import pickle
+import unittest
+
+from .profiling import *
+from . import resttest
+from .tests import Test
+
+
+class ProfilingTest(unittest.TestCase):
+    """ Tests for timing client overhead """
+
+    def test_profile(self):
+        """ Phases are timed into histograms that merge, and are taken and pickled whole """
+        profile = ClientProfile()
+        profile.record(u'send', 0.5)
+        profile.record(u'send', 0.25)
+        started = profile.start()
+        profile.stop(u'realize', started)
+
+        taken = pickle.loads(pickle.dumps(profile.take()))
+        self.assertEqual(dict(), profile.phases)
+        profile.record(u'send', 1.0)
+        summary = taken.merge(profile).summary()
+        self.assertEqual(3, summary[u'send'][u'count'])
+        self.assertAlmostEqual(1.75, summary[u'send'][u'total'])
+        self.assertEqual(1.0, summary[u'send'][u'max'])
+        self.assertEqual(1, summary[u'realize'][u'count'])
+        self.assertEqual([u'realize', u'send', u'custom'],
+                         ordered_phases({u'custom': 1, u'send': 1, u'realize': 1}))
+
+    def test_null_profile(self):
+        self.assertTrue(new_profile(False) is NO_PROFILE)
+        self.assertTrue(isinstance(new_profile(True), ClientProfile))
+        NO_PROFILE.stop(u'send', NO_PROFILE.start())
+
+    def test_prepare_request_phases(self):
+        """ Building a request times configuring, preparing and signing it """
+        test = Test()
+        test.url = 'http://localhost:8080/api/person/'
+        profile = ClientProfile()
+        resttest.prepare_request(test, profile=profile)
+        self.assertEqual([u'configure_request', u'prepare', u'sign'],
+                         ordered_phases(profile.summary()))
+
+
+if __name__ == '__main__':
+    unittest.main()
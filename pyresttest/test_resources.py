@@ -0,0 +1,45 @@
+import gc
+import unittest
+
+from .resources import *
+
+
+class ResourcesTest(unittest.TestCase):
+    """ Tests for load generator resource sampling """
+
+    def test_sampler(self):
+        """ Samples are taken on an interval and when stopped, and summarized """
+        sampler = ResourceSampler(interval=0.05).start()
+        garbage = [[x] for x in range(0, 100000)]  # Enough container allocations to run the gc
+        del garbage
+        while len(sampler.samples) < 2:
+            sampler.stopping.wait(0.01)
+        summary = sampler.stop().summary()
+
+        self.assertTrue(len(summary[u'samples']) >= 3)
+        times = [x[u'time'] for x in summary[u'samples']]
+        self.assertEqual(sorted(times), times)
+        self.assertTrue(summary[u'cpu_percent'] >= 0)
+        self.assertTrue(summary[u'cpu_percent_max'] >= 0)
+        self.assertEqual(summary[u'cpu_percent'] >= SATURATION_PERCENT, summary[u'saturated'])
+        if resource is not None or psutil is not None:
+            self.assertTrue(summary[u'rss_max'] > 0)
+        if gc_collections() is not None:
+            self.assertEqual(len(gc_collections()), len(summary[u'gc_collections']))
+            self.assertTrue(min(summary[u'gc_collections']) >= 0)
+            if gc.isenabled():
+                self.assertTrue(sum(summary[u'gc_collections']) > 0)
+        if psutil is None:
+            self.assertEqual(None, summary[u'connections_max'])
+
+    def test_warn_if_saturated(self):
+        summary = {u'cpu_percent': 99.0, u'saturated': True}
+        with self.assertLogs('pyresttest.resources', level='WARNING'):
+            warn_if_saturated('busy', summary)
+        with self.assertRaises(AssertionError):  # Nothing logged
+            with self.assertLogs('pyresttest.resources', level='WARNING'):
+                warn_if_saturated('idle', dict(summary, saturated=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
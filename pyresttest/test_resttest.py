@@ -1,11 +1,23 @@
+import datetime
+import io
 import json
 import math
+import os
+import socket
 import string
+import tempfile
+import threading
+import time
 import yaml
 import unittest
 
+from .six.moves import BaseHTTPServer
+from .six.moves import socketserver
+
+from . import connections
 from . import resttest
 from .resttest import *
+from .benchmarks import Benchmark, BenchmarkStage
 
 
 class TestRestTest(unittest.TestCase):
@@ -38,6 +50,165 @@ class TestRestTest(unittest.TestCase):
         self.assertEqual(3, len(distinct_aggregates))
         self.assertEqual(3, len(analyzed.aggregates))
 
+    def test_analyze_benchmark_corrected(self):
+        """ Corrected latency from open loop runs is reported like total_time """
+        benchmark_result = BenchmarkResult()
+        benchmark_config = Benchmark()
+        benchmark_config.add_metric('total_time').add_metric('total_time', 'median')
+        benchmark_config.add_metric('request_size', 'mean')
+        benchmark_result.results = {
+            'total_time': [0.1, 0.2, 0.3],
+            'request_size': [1, 2, 3],
+            CORRECTED_TOTAL_TIME: [0.1, 0.5, 0.9]
+        }
+        analyzed = analyze_benchmark_results(benchmark_result, benchmark_config)
+        self.assertEqual([0.1, 0.5, 0.9], analyzed.results[CORRECTED_TOTAL_TIME])
+        self.assertTrue((CORRECTED_TOTAL_TIME, 'median', 0.5) in analyzed.aggregates)
+        self.assertTrue(('total_time', 'median', 0.2) in analyzed.aggregates)
+        self.assertEqual(3, len(analyzed.aggregates))
+
+    def test_run_benchmark_concurrency(self):
+        """ Concurrent workers split the runs, failed sends are counted once each """
+        benchmark = Benchmark()
+        benchmark.url = 'http://127.0.0.1:1/refused'
+        benchmark.warmup_runs = 0
+        benchmark.benchmark_runs = 7
+        benchmark.concurrency = 3
+        benchmark.add_metric('total_time')
+        result = run_benchmark(benchmark)
+        self.assertEqual(7, result.failures)
+        self.assertEqual([], result.results['total_time'])
+        self.assertEqual([0.0, 0.0, 0.0], result.throughput['workers'])
+        self.assertEqual(1, len(result.resources))
+        self.assertTrue(result.resources[0]['samples'])
+
+    def test_collect_benchmark_stages(self):
+        """ Staged benchmarks report each stage, and everything together """
+        benchmark = Benchmark()
+        benchmark.add_metric('total_time', 'sum')
+        benchmark.stages = [BenchmarkStage(duration=1, concurrency=2),
+                            BenchmarkStage(duration=1, rate=4)]
+
+        recorders = list()
+        for requests, elapsed in ((2, 1.0), (1, 0.5), (4, 1.0)):
+            recorder = BenchmarkRecorder(['total_time'])
+            recorder.results = [[0.5] * requests]
+            recorder.requests = requests
+            recorder.elapsed = elapsed
+            recorders.append(recorder)
+
+        output = BenchmarkResult()
+        collect_benchmark_results(output, [recorders[:2], recorders[2:]], benchmark.stages)
+        analyzed = analyze_benchmark_results(output, benchmark)
+        self.assertEqual([('total_time', 'sum', 3.5)], analyzed.aggregates)
+        self.assertEqual(3.5, analyzed.throughput['combined'])
+        self.assertEqual(2, len(analyzed.stages))
+        self.assertEqual([('total_time', 'sum', 1.5)], analyzed.stages[0].aggregates)
+        self.assertEqual([2.0, 2.0], analyzed.stages[0].throughput['workers'])
+        self.assertEqual(4, analyzed.stages[1].stage.rate)
+
+        out = io.StringIO()
+        write_benchmark_csv(out, analyzed, benchmark)
+        rows = out.getvalue().splitlines()
+        self.assertEqual(['Stage,2', 'Duration,1', 'Concurrency,', 'Rate,4', 'Failures,0',
+                          'Aggregates,', 'total_time,sum,2.0', 'Throughput,', 'combined,4.0',
+                          'worker 1,4.0'], rows[-10:])
+        self.assertEqual(4, json.loads(str(analyzed))['stages'][1]['stage']['rate'])
+
+    def test_write_benchmark_csv_throughput(self):
+        """ Throughput gets its own section in CSV output """
+        result = BenchmarkResult()
+        result.throughput = {'combined': 30.0, 'workers': [10.0, 20.0]}
+        out = io.StringIO()
+        write_benchmark_csv(out, result, Benchmark())
+        rows = out.getvalue().splitlines()
+        self.assertEqual(['Throughput,', 'combined,30.0', 'worker 1,10.0', 'worker 2,20.0'],
+                         rows[3:])
+
+    def test_write_benchmark_csv_timeseries(self):
+        """ Time series buckets are a table in CSV output """
+        result = BenchmarkResult()
+        result.timeseries = [{'start': 0.0, 'requests': 2, 'failures': 1, 'throughput': 2.0,
+                              'latency': {'mean': 0.5, 'p50': 0.4, 'p90': 0.6, 'p99': 0.6,
+                                          'max': 0.6}}]
+        out = io.StringIO()
+        write_benchmark_csv(out, result, Benchmark())
+        rows = out.getvalue().splitlines()
+        self.assertEqual(['Time Series,', 'start,requests,failures,throughput,mean,p50,p90,p99,max',
+                          '0.0,2,1,2.0,0.5,0.4,0.6,0.6,0.6'], rows[3:])
+
+    def test_write_benchmark_csv_outcomes(self):
+        """ Status codes and errors are tables of count and latency """
+        latency = {'mean': 0.5, 'p50': 0.4, 'p90': 0.6, 'p99': 0.6, 'max': 0.6}
+        result = BenchmarkResult()
+        result.statuses = {503: {'count': 2, 'latency': latency},
+                           200: {'count': 9, 'latency': latency}}
+        result.errors = {'timeout': {'count': 1, 'latency': latency}}
+        out = io.StringIO()
+        write_benchmark_csv(out, result, Benchmark())
+        rows = out.getvalue().splitlines()
+        self.assertEqual(['Status Codes,', 'status,count,mean,p50,p90,p99,max',
+                          '200,9,0.5,0.4,0.6,0.6,0.6', '503,2,0.5,0.4,0.6,0.6,0.6',
+                          'Errors,', 'error,count,mean,p50,p90,p99,max',
+                          'timeout,1,0.5,0.4,0.6,0.6,0.6'], rows[3:])
+
+    def test_write_benchmark_jsonl(self):
+        """ Samples and failures are lines of json as recorded, then the result without raws """
+        response = requests.Response()
+        response.status_code = 200
+        response.elapsed = datetime.timedelta(seconds=0.5)
+        out = io.StringIO()
+        writer = SampleWriter(out, flush_interval=0)
+        recorder = BenchmarkRecorder(['total_time'], open_loop=True, stage=1, sink=writer)
+        recorder.record(response, corrected=0.75)
+        recorder.record_failure(socket.timeout('timed out'), 2.0)
+        result = BenchmarkResult()
+        result.name = u'streamed'
+        result.results = {u'total_time': [0.5]}
+        write_benchmark_jsonl(out, result, Benchmark())
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([u'sample', u'failure', u'result'], [x[u'type'] for x in lines])
+        self.assertEqual((1, 200, 0.5, 0.75),
+                         tuple(lines[0][x] for x in (u'stage', u'status', u'total_time',
+                                                     u'corrected_total_time')))
+        self.assertEqual((u'timeout', 2.0), (lines[1][u'error'], lines[1][u'elapsed']))
+        self.assertTrue(lines[0][u'timestamp'] <= lines[1][u'timestamp'])
+        self.assertEqual(u'streamed', lines[2][u'name'])
+        self.assertFalse(u'results' in lines[2])
+
+    def test_run_testset_jsonl_workers(self):
+        """ Samples stay with --workers: a warning, and only the result line is written """
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        benchmark = Benchmark()
+        benchmark.name = u'spread'
+        benchmark.output_file = path
+        benchmark.output_format = u'jsonl'
+        benchmark.add_metric('total_time')
+        testset = TestSet()
+        testset.config.workers = [('127.0.0.1', 1)]
+        testset.benchmarks.append(benchmark)
+
+        def run_distributed_benchmark(benchmark, test_config, workers, authkey=None,
+                                      context=None):
+            result = BenchmarkResult()
+            result.name = benchmark.name
+            result.results = {u'total_time': [0.5]}
+            return result
+
+        original = resttest.distributed.run_distributed_benchmark
+        resttest.distributed.run_distributed_benchmark = run_distributed_benchmark
+        try:
+            with self.assertLogs('pyresttest', level='WARNING'):
+                run_testset(testset, None)
+            with open(path) as file_in:
+                lines = [json.loads(line) for line in file_in]
+        finally:
+            resttest.distributed.run_distributed_benchmark = original
+            os.remove(path)
+        self.assertEqual([u'result'], [x[u'type'] for x in lines])
+
     def test_metrics_to_tuples(self):
         """ Test method to build list(tuples) from raw metrics """
         array1 = [-1, 5.6, 0]
@@ -109,6 +280,69 @@ class TestRestTest(unittest.TestCase):
         self.assertTrue('jmespath' in validators.EXTRACTORS)
         jmespathext = validators.EXTRACTORS['jmespath']('test1.a')
 
+    def test_parse_configuration_connections(self):
+        """ Keep-alive and connection pool size are read from testset config """
+        config = parse_configuration([{'keep_alive': 'false'}, {'connection_pool_size': '25'}])
+        self.assertFalse(config.keep_alive)
+        self.assertEqual(25, config.connection_pool_size)
+
+        config = parse_configuration([{'timeout': 5}])
+        self.assertTrue(config.keep_alive)
+        self.assertEqual(connections.DEFAULT_POOL_SIZE, config.connection_pool_size)
+
+    def test_parse_configuration_parallel(self):
+        """ Parallel execution settings are read from testset config """
+        config = parse_configuration([{'test_parallel': True}, {'parallel_workers': 3}])
+        self.assertTrue(config.test_parallel)
+        self.assertEqual(3, config.parallel_workers)
+        self.assertRaises(ValueError, parse_configuration, {'parallel_workers': 0})
+
+    def test_portable_result(self):
+        """ Results sent back from worker processes must survive pickling """
+        import pickle
+        result = TestResponse()
+        result.test = Test()
+        result.passed = False
+        result.response_code = 500
+        result.failures.append(validators.Failure(
+            message='bad', details='details', validator=lambda x: x,
+            failure_type=validators.FAILURE_VALIDATOR_FAILED))
+
+        copied = pickle.loads(pickle.dumps(portable_result(result)))
+        self.assertEqual(500, copied.response_code)
+        self.assertFalse(copied.passed)
+        self.assertEqual('bad', copied.failures[0].message)
+        self.assertEqual(None, copied.test)
+
+    def test_run_testsets_sharded(self):
+        """ Failure counts from worker processes add up like a serial run """
+        testsets = list()
+        for group in ('first', 'second', 'third'):
+            testset = TestSet()
+            for x in range(0, 2):
+                # Nothing listens on port 1, so every test fails with a request exception
+                testset.tests.append(Test.parse_test(
+                    'http://127.0.0.1:1', {'url': '/' + str(x), 'group': group}))
+            testsets.append(testset)
+
+        self.assertEqual(6, run_testsets(testsets))
+        self.assertEqual(6, run_testsets(testsets, processes=2))
+
+    def test_cmdline_args_processes(self):
+        """ Process count is parsed as an integer """
+        args = parse_command_line_args(['my_url', 'my_test_filename', '--processes', '4'])
+        self.assertEqual(4, args['processes'])
+
+    def test_cmdline_args_worker(self):
+        """ Workers need no url or test file, coordinators list their workers """
+        args = parse_command_line_args(['--worker', '--listen', ':9000', '--authkey', 'k'])
+        self.assertTrue(args['worker'])
+        self.assertEqual(':9000', args['listen'])
+        self.assertEqual('k', args['authkey'])
+        args = parse_command_line_args(['my_url', 'my_test_filename', '--workers', 'a:1,b:2'])
+        self.assertFalse(args['worker'])
+        self.assertEqual('a:1,b:2', args['workers'])
+
     def test_cmdline_args_parsing_basic(self):
         cmdline = [
             'my_url', 'my_test_filename',
@@ -145,5 +379,120 @@ class TestRestTest(unittest.TestCase):
         self.assertEqual('my_url', args['url'])
         self.assertEqual('my_test_filename', args['test'])
 
+    def test_cmdline_args_engine(self):
+        """ Engine defaults to unset (requests), asyncio can be selected, others are rejected """
+        args = parse_command_line_args(['my_url', 'my_test_filename'])
+        self.assertEqual(None, args['engine'])
+
+        args = parse_command_line_args(['my_url', 'my_test_filename', '--engine', 'asyncio'])
+        self.assertEqual('asyncio', args['engine'])
+
+        self.assertRaises(SystemExit, parse_command_line_args,
+                          ['my_url', 'my_test_filename', '--engine', 'gevent'])
+
+
+class EchoHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Keep-alive handler answering with the request body, or the path for a GET """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.respond(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+    def do_GET(self):
+        self.respond(self.path.encode('utf-8'))
+
+    def respond(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class RunBenchmarkTest(unittest.TestCase):
+    """ Benchmarks run against a local server """
+
+    def setUp(self):
+        self.server = ThreadedServer(('127.0.0.1', 0), EchoHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_write_benchmark_binary(self):
+        """ Raw integer metrics, kept as floats in Samples, are written as int64 columns """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/binary'
+        benchmark.warmup_runs = 0
+        benchmark.benchmark_runs = 3
+        for metric in ('total_time', 'size_download', 'num_connects', 'redirect_count',
+                       'request_size'):
+            benchmark.add_metric(metric)
+        result = run_benchmark(benchmark)
+        handle, path = tempfile.mkstemp(suffix='.bin')
+        os.close(handle)
+        try:
+            with open(path, 'wb') as file_out:
+                write_benchmark_binary(file_out, result, benchmark)
+            with benchmarks.read_binary_results(path) as columns:
+                self.assertEqual([7, 7, 7], list(columns.columns['size_download']))
+                self.assertEqual('q', columns.columns['num_connects'].format)
+                self.assertEqual(3, len(columns.columns['total_time']))
+        finally:
+            os.remove(path)
+
+    def test_run_benchmark_size_upload(self):
+        """ size_upload is the request body's length as a number, missing without a body """
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/upload'
+        benchmark.method = u'POST'
+        benchmark.body = u'twelve bytes'
+        benchmark.warmup_runs = 0
+        benchmark.benchmark_runs = 2
+        benchmark.add_metric('size_upload').add_metric('size_upload', 'mean')
+        result = run_benchmark(benchmark)
+        self.assertEqual(0, result.failures)
+        self.assertEqual([12, 12], result.results['size_upload'])
+        self.assertEqual([('size_upload', 'mean', 12.0)], result.aggregates)
+
+        benchmark.method = u'GET'
+        benchmark.body = None
+        self.assertEqual([None, None], run_benchmark(benchmark).results['size_upload'])
+
+    def test_corrected_total_time_presend(self):
+        """ Time blocked before the transport starts counts towards corrected latency """
+        original = resttest.prepare_benchmark_request
+
+        def slow_prepare(*args, **kwargs):
+            time.sleep(0.2)  # Like waiting on the shared lock, templating or signing
+            return original(*args, **kwargs)
+
+        benchmark = Benchmark()
+        benchmark.url = self.url + '/corrected'
+        benchmark.warmup_runs = 0
+        benchmark.benchmark_runs = 2
+        benchmark.rate = 50
+        benchmark.concurrency = 1
+        benchmark.add_metric('total_time')
+        resttest.prepare_benchmark_request = slow_prepare
+        try:
+            result = run_benchmark(benchmark)
+        finally:
+            resttest.prepare_benchmark_request = original
+        for total, corrected in zip(result.results['total_time'],
+                                    result.results[CORRECTED_TOTAL_TIME]):
+            self.assertTrue(corrected - total >= 0.2, (total, corrected))
+
+
 if __name__ == '__main__':
     unittest.main()
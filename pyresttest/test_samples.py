@@ -0,0 +1,64 @@
+import pickle
+import random
+import unittest
+
+from . import samples
+from .samples import *
+from .benchmarks import AGGREGATES, aggregate_all, median, percentile, std_deviation
+
+ALL_AGGREGATES = ['mean', 'mean_harmonic', 'median', 'std_deviation', 'sum', 'min', 'max',
+                  'p50', 'p90', 'p99.9', 'percentile_12.5']
+
+
+class SamplesTest(unittest.TestCase):
+    """ Tests for typed raw value storage and its aggregation backends """
+
+    def setUp(self):
+        rand = random.Random(3)
+        self.values = [rand.uniform(0.001, 1.0) for x in range(0, 501)]
+        self.expected = [AGGREGATES['mean'](self.values), AGGREGATES['mean_harmonic'](self.values),
+                         median(self.values), std_deviation(self.values), sum(self.values),
+                         min(self.values), max(self.values), percentile(self.values, 50),
+                         percentile(self.values, 90), percentile(self.values, 99.9),
+                         percentile(self.values, 12.5)]
+
+    def test_storage(self):
+        """ Missing values are kept in place, and left out of aggregates """
+        stored = Samples([0.5, None])
+        stored.append(1.5)
+        stored.extend(Samples([2.5]))
+        self.assertEqual([0.5, None, 1.5, 2.5], stored)
+        self.assertEqual(4, len(stored))
+        self.assertEqual(None, stored[1])
+        self.assertEqual([0.5, 1.5, 2.5], stored.present())
+        self.assertEqual(stored, pickle.loads(pickle.dumps(stored)))
+        self.assertEqual([1.5, 2.5], aggregate_all(stored, ['median', 'max']))
+        self.assertEqual([None], aggregate_all(Samples([None]), ['mean']))
+        with self.assertRaises(TypeError) as raised:
+            stored.append('12')
+        self.assertTrue('must be numbers' in str(raised.exception))
+
+    def test_pure_python(self):
+        """ Without NumPy, the existing aggregate functions are used """
+        real_numpy = samples.numpy
+        samples.numpy = None
+        try:
+            results = aggregate_all(Samples(self.values), ALL_AGGREGATES)
+        finally:
+            samples.numpy = real_numpy
+        for expected, result in zip(self.expected, results):
+            self.assertAlmostEqual(expected, result)
+
+    @unittest.skipIf(samples.numpy is None, "NumPy not installed")
+    def test_vectorized(self):
+        """ NumPy aggregates match the pure Python ones """
+        results = aggregate_all(Samples(self.values), ALL_AGGREGATES)
+        for expected, result in zip(self.expected, results):
+            self.assertAlmostEqual(expected, result)
+            self.assertTrue(isinstance(result, float))
+        even = Samples([1, 2, 3, 4])
+        self.assertEqual([2.5, 1.0], aggregate_all(even, ['median', 'percentile_25']))
+
+
+if __name__ == '__main__':
+    unittest.main()
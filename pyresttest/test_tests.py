@@ -471,5 +471,15 @@ class TestsTest(unittest.TestCase):
         test.update_context_before(context)
         self.assertEqual(2, context.get_value('foo'))
 
+    def test_configure_request_keep_alive(self):
+        """ Connection: close is only sent when keep-alive is turned off """
+        test = Test()
+        test.url = 'http://localhost:8000/api/person/'
+        req = test.configure_request()
+        self.assertTrue('Connection' not in req.headers)
+
+        req = test.configure_request(keep_alive=False)
+        self.assertEqual('close', req.headers['Connection'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -289,8 +289,10 @@ class Test(object):
     def __str__(self):
         return json.dumps(self, default=safe_to_json)
 
-    def configure_request(self, timeout=DEFAULT_TIMEOUT, context=None, curl_handle=None):
-        """ Create and mostly configure a request object for test, reusing existing if possible """
+    def configure_request(self, timeout=DEFAULT_TIMEOUT, context=None, curl_handle=None,
+                          keep_alive=True):
+        """ Create and mostly configure a request object for test, reusing existing if possible
+            With keep_alive False, ask the server to close the connection after the response """
 
         if curl_handle:
             req = curl_handle
@@ -365,7 +367,8 @@ class Test(object):
         # Fix for expecting 100-continue from server, which not all servers
         # will send!
         headers["Expect"] = ''
-        headers["Connection"] = "close"
+        if not keep_alive:
+            headers["Connection"] = "close"
         req.headers.update(headers)
 
         # Set custom curl options, which are KEY:VALUE pairs matching the request option names
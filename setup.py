@@ -40,14 +40,23 @@ setup(name='pyresttest',
                   'pyresttest.six',
                   'pyresttest.ext.validator_jsonschema',
                   'pyresttest.ext.extractor_jmespath',
-                  'pyresttest.signer', 'pyresttest.metric'],
+                  'pyresttest.signer', 'pyresttest.metric',
+                  'pyresttest.connections', 'pyresttest.parallel',
+                  'pyresttest.asyncio_engine', 'pyresttest.distributed',
+                  'pyresttest.accumulators', 'pyresttest.histogram',
+                  'pyresttest.samples', 'pyresttest.profiling',
+                  'pyresttest.resources', 'pyresttest.comparison',
+                  'pyresttest.exporter'],
       install_requires=dependencies,
       tests_require=test_dependencies,
       extras_require={
         'JSONSchema': ['jsonschema'],
-        'JMESPath': ['jmespath']
+        'JMESPath': ['jmespath'],
+        'asyncio': ['aiohttp'],
+        'numpy': ['numpy'],
+        'psutil': ['psutil']
       },
       # Make this executable from command line when installed
-      scripts=['util/pyresttest', 'util/resttest.py'],
+      scripts=['util/pyresttest', 'util/resttest.py', 'util/pyresttest-compare'],
       provides=['pyresttest']
       )